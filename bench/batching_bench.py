@@ -0,0 +1,111 @@
+"""Publish throughput of a Producer writing each record against batching in the background.
+
+Records go to a sink that answers the stream handshake and then discards
+everything, so only the producer's cost is measured; a broker in the same
+process would compete for the CPU. Throughput is measured until `flush()`
+returns, i.e. until every record is written to the socket.
+
+Run from the repository root:
+
+    python -m bench.batching_bench
+"""
+import logging
+import socket
+import threading
+import time
+from shapleqclient.base import QConfig
+from shapleqclient.message.api import MAGIC_NUM
+from shapleqclient.message.checksum import DeferredChecksum
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.producer import Producer
+from shapleqclient.proto.api_pb2 import ConnectResponse, PutResponse
+from shapleqclient.proto.data_pb2 import Partition
+from shapleqclient.testing import FakeZKClient
+
+RECORDS = 20000
+
+
+class Sink:
+    """Answers the stream handshake and then discards what it receives.
+
+    With `respond`, every frame is answered with the same PutResponse,
+    without decoding it, so a producer's deliveries resolve.
+    """
+
+    def __init__(self, respond: bool = False):
+        self.respond = respond
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(16)
+        self.address = '{}:{}'.format(*self._server.getsockname())
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._drain, args=(conn,), daemon=True).start()
+
+    def _drain(self, conn: socket.socket):
+        decoder = FrameDecoder(DeferredChecksum())
+        with conn:
+            while decoder.next_message() is None:
+                if decoder.recv_into(conn) == 0:
+                    return
+            conn.sendall(make_qmessage_from_proto(MessageType.STREAM, ConnectResponse(magic=MAGIC_NUM)).serialize())
+            if not self.respond:
+                buf = bytearray(1024 * 1024)
+                while conn.recv_into(buf) > 0:
+                    pass
+                return
+
+            response = make_qmessage_from_proto(MessageType.STREAM, PutResponse(
+                magic=MAGIC_NUM, partition=Partition(partition_id=1, offset=1))).serialize()
+            try:
+                while decoder.recv_into(conn) > 0:
+                    if count := sum(1 for _ in decoder):
+                        conn.sendall(response * count)
+            except OSError:
+                return
+
+    def close(self):
+        self._server.close()
+
+
+def run(sink: Sink, config: QConfig, record: bytes):
+    config.zk_client_factory = FakeZKClient.factory([sink.address])
+    producer = Producer(config, "bench", logging.getLogger("shapleq-python"))
+    producer.setup()
+    producer.metrics().reset()
+
+    started = time.perf_counter()
+    for seq in range(RECORDS):
+        producer.publish(record, seq, '0' * 32)
+    producer.flush()
+    elapsed = time.perf_counter() - started
+
+    send_calls = producer.metrics().send_calls
+    # the sink does not respond, so stop would wait for the responses to batched records
+    producer._client.close()
+    return RECORDS / elapsed, send_calls
+
+
+def main():
+    modes = [('per record', QConfig()),
+             ('batched', QConfig(batch_bytes=64 * 1024, linger_ms=5))]
+    print('publish throughput, {} records'.format(RECORDS))
+    print('{:>12} {:>12} {:>14} {:>12}'.format('record size', 'mode', 'records/sec', 'send calls'))
+    sink = Sink()
+    for size in (16, 1024):
+        record = b'x' * size
+        for name, config in modes:
+            rate, send_calls = run(sink, config, record)
+            print('{:>12} {:>12} {:>14.0f} {:>12}'.format(size, name, rate, send_calls))
+    sink.close()
+
+
+if __name__ == '__main__':
+    main()
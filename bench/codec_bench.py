@@ -0,0 +1,224 @@
+"""Micro-benchmarks for the QMessage codec.
+
+Run from the repository root:
+
+    python -m bench.codec_bench
+"""
+import socket
+import threading
+import time
+import tracemalloc
+from typing import Callable
+from google.protobuf import any_pb2, message
+from shapleqclient.common.exception import NotEnoughBufferError
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.qmessage import QMessage, QHeader, MessageType, make_qmessage_from_buffer, make_qmessage_from_proto
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.message.encoder import PutRequestEncoder
+from shapleqclient.message.batch import LazyBatchedFetchResponse
+from shapleqclient.message.checksum import InlineChecksum, DeferredChecksum, SampledChecksum, WorkerChecksum
+from shapleqclient.message.api import put_msg, ack_msg
+from shapleqclient.proto.api_pb2 import FetchResponse, BatchedFetchResponse, Ack
+
+BENCH_SECONDS = 1.0
+
+
+def measure(fn: Callable[[], int], seconds: float = BENCH_SECONDS) -> float:
+    """Run `fn` repeatedly for about `seconds` and return units per second.
+
+    `fn` returns the number of units (frames, messages, ...) it processed.
+    """
+    units = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < seconds:
+        units += fn()
+    return units / elapsed
+
+
+def _legacy_decode(chunk: bytes) -> int:
+    # decoding loop of ClientBase.continuous_receive before FrameDecoder
+    msg_buf = bytearray(b'')
+    msg_buf += bytearray(chunk)
+    count = 0
+    while True:
+        try:
+            qmsg = make_qmessage_from_buffer(msg_buf)
+            count += 1
+            msg_buf = msg_buf[QHeader.HEADER_SIZE + qmsg.length():]
+        except NotEnoughBufferError:
+            return count
+
+
+def bench_frame_decoder():
+    print('frame decoding (frames/sec)')
+    print('{:>13} {:>16} {:>14} {:>14}'.format('payload size', 'frames per recv', 'legacy', 'FrameDecoder'))
+    for payload_size in (16, 1024):
+        frame = make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * payload_size, 0, '0' * 32)).serialize()
+        for frames_per_recv in (1, 10, 100):
+            chunk = bytes(frame) * frames_per_recv
+            decoder = FrameDecoder()
+
+            def decode() -> int:
+                decoder.feed(chunk)
+                return sum(1 for _ in decoder)
+
+            legacy = measure(lambda: _legacy_decode(chunk))
+            current = measure(decode)
+            print('{:>13} {:>16} {:>14.0f} {:>14.0f}'.format(payload_size, frames_per_recv, legacy, current))
+
+
+def _legacy_unpack_to(msg: QMessage, pb: message.Message) -> message.Message:
+    # QMessage.unpack_to before the message registry: full Any parse per probe
+    any_pb = any_pb2.Any()
+    any_pb.ParseFromString(msg.payload())
+    return pb if any_pb.Unpack(pb) else None
+
+
+def bench_decode_dispatch():
+    registry = MessageRegistry(FetchResponse, BatchedFetchResponse, Ack)
+    msg = make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, 'request failed'))
+    probes = (FetchResponse, BatchedFetchResponse, Ack)
+
+    def legacy_probe() -> int:
+        for probe in probes:
+            if _legacy_unpack_to(msg, probe()) is not None:
+                return 1
+        return 0
+
+    def unpack_to_probe() -> int:
+        for probe in probes:
+            if msg.unpack_to(probe()) is not None:
+                return 1
+        return 0
+
+    print('Ack dispatch in Consumer (messages/sec)')
+    print('{:>24} {:>14.0f}'.format('Any.Unpack probing', measure(legacy_probe)))
+    print('{:>24} {:>14.0f}'.format('unpack_to probing', measure(unpack_to_probe)))
+    print('{:>24} {:>14.0f}'.format('MessageRegistry', measure(lambda: int(registry.decode(msg) is not None))))
+
+
+def bench_checksum_policies():
+    policies = [
+        ('inline', InlineChecksum()),
+        ('worker', WorkerChecksum()),
+        ('sampled 10%', SampledChecksum(0.1)),
+        ('deferred, read', DeferredChecksum()),
+        ('deferred, unread', DeferredChecksum()),
+    ]
+
+    print('checksum verification (MB/sec of frames decoded and read)')
+    print('{:>18} {:>12} {:>12}'.format('policy', '4 KB', '1 MB'))
+    for name, policy in policies:
+        results = []
+        for payload_size in (4 * 1024, 1024 * 1024):
+            frame = make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * payload_size, 0, '0' * 32)).serialize()
+            read_payload = name != 'deferred, unread'
+
+            def decode() -> int:
+                qmsg = make_qmessage_from_buffer(frame, checksum_policy=policy)
+                if read_payload:
+                    qmsg.payload()
+                return len(frame)
+
+            results.append(measure(decode) / (1024 * 1024))
+        print('{:>18} {:>12.1f} {:>12.1f}'.format(name, *results))
+
+        if isinstance(policy, WorkerChecksum):
+            policy.shutdown()
+
+
+def bench_put_encoder():
+    node_id = '0' * 32
+    encoder = PutRequestEncoder(node_id)
+
+    print('PutRequest encoding (publishes/sec)')
+    print('{:>13} {:>14} {:>18}'.format('payload size', 'protobuf', 'PutRequestEncoder'))
+    for payload_size in (16, 1024, 1024 * 1024):
+        data = b'x' * payload_size
+
+        def encode_protobuf() -> int:
+            make_qmessage_from_proto(MessageType.STREAM, put_msg(data, 1, node_id)).buffers()
+            return 1
+
+        def encode_fast_path() -> int:
+            encoder.encode(data, 1)
+            return 1
+
+        print('{:>13} {:>14.0f} {:>18.0f}'.format(payload_size, measure(encode_protobuf), measure(encode_fast_path)))
+
+
+def bench_lazy_batch():
+    batch = BatchedFetchResponse(magic=1101, last_offset=1000)
+    for i in range(1000):
+        batch.items.add(data=b'x' * 8 * 1024, offset=i, seq_num=i, node_id='0' * 32)
+    frame = make_qmessage_from_proto(MessageType.STREAM, batch).serialize()
+    eager = MessageRegistry(BatchedFetchResponse)
+    lazy = MessageRegistry()
+    lazy.register(BatchedFetchResponse, LazyBatchedFetchResponse)
+
+    def consume_eager() -> int:
+        decoded = eager.decode(make_qmessage_from_buffer(frame))
+        items = [(item.data, item.offset, item.seq_num, item.node_id) for item in decoded.items]
+        return len(items)
+
+    def consume_lazy() -> int:
+        return sum(1 for _ in lazy.decode(make_qmessage_from_buffer(frame)).items())
+
+    print('BatchedFetchResponse of 1000 x 8 KB records ({:.1f} MB frame)'.format(len(frame) / (1024 * 1024)))
+    print('{:>8} {:>14} {:>16}'.format('mode', 'records/sec', 'peak alloc MB'))
+    for name, consume in (('eager', consume_eager), ('lazy', consume_lazy)):
+        tracemalloc.start()
+        consume()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('{:>8} {:>14.0f} {:>16.1f}'.format(name, measure(consume), peak / (1024 * 1024)))
+
+
+def bench_receive():
+    frame = make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * 4 * 1024 * 1024, 0, '0' * 32)).serialize()
+    frames = 16
+
+    def receive_legacy(sock: socket.socket):
+        # ClientBase read path before recv_into: fixed 4 KB recv, copied into a growing buffer
+        msg_buf = bytearray(b'')
+        received = 0
+        while received < frames:
+            msg_buf += bytearray(sock.recv(4 * 1024))
+            while len(msg_buf) >= QHeader.HEADER_SIZE and \
+                    len(msg_buf) >= QHeader.HEADER_SIZE + QHeader.HEADER_STRUCT.unpack_from(msg_buf)[0]:
+                qmsg = make_qmessage_from_buffer(msg_buf)
+                msg_buf = msg_buf[QHeader.HEADER_SIZE + qmsg.length():]
+                received += 1
+
+    def receive_decoder(sock: socket.socket):
+        decoder = FrameDecoder()
+        received = 0
+        while received < frames:
+            decoder.recv_into(sock)
+            received += sum(1 for _ in decoder)
+
+    print('receiving {} frames of 4 MB over a socketpair (MB/sec)'.format(frames))
+    for name, receive in (('recv + copy', receive_legacy), ('recv_into', receive_decoder)):
+        reader, writer = socket.socketpair()
+        sender = threading.Thread(target=lambda: [writer.sendall(frame) for _ in range(frames)])
+        started = time.perf_counter()
+        sender.start()
+        receive(reader)
+        elapsed = time.perf_counter() - started
+        sender.join()
+        reader.close()
+        writer.close()
+        print('{:>14} {:>10.1f}'.format(name, len(frame) * frames / elapsed / (1024 * 1024)))
+
+
+def main():
+    bench_frame_decoder()
+    bench_receive()
+    bench_decode_dispatch()
+    bench_checksum_policies()
+    bench_put_encoder()
+    bench_lazy_batch()
+
+
+if __name__ == '__main__':
+    main()
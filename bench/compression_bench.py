@@ -0,0 +1,49 @@
+"""Bytes on the wire against CPU cost of the record compression codecs.
+
+Run from the repository root:
+
+    python -m bench.compression_bench
+"""
+import json
+from shapleqclient.compression import Compressor, ZlibCodec, Bz2Codec, LzmaCodec, decompress_payload
+from bench.codec_bench import measure
+
+
+def make_record(size: int) -> bytes:
+    items = []
+    while len(json.dumps(items)) < size:
+        i = len(items)
+        items.append({'id': i, 'user': 'user-{}'.format(i % 97), 'event': ['click', 'view', 'buy'][i % 3],
+                      'value': i * 0.25, 'tags': ['shapleq', 'python']})
+    return json.dumps(items).encode('utf-8')
+
+
+def main():
+    codecs = [('zlib-1', ZlibCodec(1)), ('zlib-6', ZlibCodec(6)), ('bz2-9', Bz2Codec(9)),
+              ('lzma-0', LzmaCodec(0)), ('lzma-6', LzmaCodec(6))]
+
+    for size in (1024, 64 * 1024):
+        record = make_record(size)
+        print('JSON record of {} bytes'.format(len(record)))
+        print('{:>10} {:>14} {:>8} {:>18} {:>20}'.format(
+            'codec', 'bytes on wire', 'ratio', 'compress MB/sec', 'decompress MB/sec'))
+        for name, codec in codecs:
+            compressor = Compressor(codec, threshold=0)
+            compressed = compressor.compress(record)
+
+            def compress() -> int:
+                compressor.compress(record)
+                return len(record)
+
+            def decompress() -> int:
+                decompress_payload(compressed)
+                return len(record)
+
+            print('{:>10} {:>14} {:>8.2f} {:>18.1f} {:>20.1f}'.format(
+                name, len(compressed), len(record) / len(compressed),
+                measure(compress) / (1024 * 1024), measure(decompress) / (1024 * 1024)))
+        print()
+
+
+if __name__ == '__main__':
+    main()
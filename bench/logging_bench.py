@@ -0,0 +1,78 @@
+"""Cost of per-frame logging on the subscriber receive path.
+
+`legacy` logs every recv at INFO and formats every response, data included,
+for a DEBUG message that is then dropped. `instrumented` counts into
+Metrics and logs through a SampledLogger. Both decode the same frames and
+the logger is at INFO with a handler writing to memory, as in a service
+that keeps INFO logs.
+
+Run from the repository root:
+
+    python -m bench.logging_bench
+"""
+import io
+import logging
+from shapleqclient.consumer import make_fetch_result
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.metrics import Metrics, SampledLogger
+from shapleqclient.proto.api_pb2 import FetchResponse
+from bench.codec_bench import measure
+
+FRAMES_PER_RECV = 10
+
+
+def make_logger(level: int, name: str = 'shapleq-python.bench') -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+    logger.propagate = False
+    logger.setLevel(level)
+    return logger
+
+
+def main():
+    registry = MessageRegistry(FetchResponse)
+    print('subscriber receive path (frames/sec), {} frames per recv'.format(FRAMES_PER_RECV))
+    print('{:>13} {:>12} {:>14} {:>8}'.format('payload size', 'legacy', 'instrumented', 'speedup'))
+    for payload_size in (16, 1024, 64 * 1024):
+        frame = make_qmessage_from_proto(MessageType.STREAM, FetchResponse(
+            data=b'x' * payload_size, offset=1, last_offset=1, seq_num=1, node_id='0' * 32)).serialize()
+        chunk = frame * FRAMES_PER_RECV
+        logger = make_logger(logging.INFO)
+
+        legacy_decoder = FrameDecoder()
+        # only the logging differs, so the legacy path builds results without logging
+        silent_log = SampledLogger(make_logger(logging.WARNING, 'shapleq-python.bench.silent'), 1)
+
+        def legacy() -> int:
+            legacy_decoder.feed(chunk)
+            logger.info('received data')
+            for msg in legacy_decoder:
+                received = registry.decode(msg)
+                logger.debug('received response - data: {}, offset: {}, last offset: {}, seq_num: {}, node_id: {}'
+                             .format(received.data, received.offset, received.last_offset, received.seq_num,
+                                     received.node_id))
+                make_fetch_result(received, silent_log)
+            return FRAMES_PER_RECV
+
+        metrics = Metrics()
+        frame_log = SampledLogger(logger, 100)
+        decoder = FrameDecoder(metrics=metrics)
+
+        def instrumented() -> int:
+            decoder.feed(chunk)
+            metrics.recv_calls += 1
+            frame_log.debug('received data - %d bytes', len(chunk))
+            for msg in decoder:
+                make_fetch_result(registry.decode(msg), frame_log)
+            return FRAMES_PER_RECV
+
+        legacy_rate, instrumented_rate = measure(legacy), measure(instrumented)
+        print('{:>13} {:>12.0f} {:>14.0f} {:>7.1f}x'.format(
+            payload_size, legacy_rate, instrumented_rate, instrumented_rate / legacy_rate))
+
+
+if __name__ == '__main__':
+    main()
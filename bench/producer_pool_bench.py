@@ -0,0 +1,78 @@
+"""Publish throughput of a ProducerPool over 1, 2, 4 and 8 worker processes.
+
+Records go to a sink in a process of its own that answers every frame with
+a canned PutResponse, so deliveries resolve without a broker decoding the
+records. Throughput is measured until every delivery resolved. A single
+in-process Producer gives the baseline.
+
+Scaling needs a core per worker, plus the parent and the sink.
+
+Run from the repository root:
+
+    python -m bench.producer_pool_bench
+"""
+import logging
+import multiprocessing
+import os
+import time
+from shapleqclient.base import QConfig
+from shapleqclient.producer import Producer
+from shapleqclient.producer_pool import ProducerPool
+from shapleqclient.testing import FakeZKClient
+from bench.batching_bench import Sink
+
+RECORDS = 100000
+RECORD_SIZE = 256
+NODE_ID = '0' * 32
+
+
+def serve(address_queue, stop):
+    sink = Sink(respond=True)
+    address_queue.put(sink.address)
+    stop.wait()
+    sink.close()
+
+
+def in_process(address: str) -> float:
+    config = QConfig(zk_client_factory=FakeZKClient.factory([address]))
+    producer = Producer(config, "bench", logging.getLogger("shapleq-python"), node_id=NODE_ID)
+    producer.setup()
+    started = time.perf_counter()
+    deliveries = producer.publish_many([b'x' * RECORD_SIZE] * RECORDS)
+    deliveries[-1].result(timeout=60)
+    elapsed = time.perf_counter() - started
+    producer.stop()
+    return RECORDS / elapsed
+
+
+def pooled(address: str, processes: int) -> float:
+    config = QConfig(zk_client_factory=FakeZKClient.factory([address]))
+    pool = ProducerPool(config, "bench", logging.getLogger("shapleq-python"), NODE_ID, processes)
+    pool.setup()
+    started = time.perf_counter()
+    pool.publish_many([b'x' * RECORD_SIZE] * RECORDS)
+    pool.wait(timeout=120)
+    elapsed = time.perf_counter() - started
+    pool.stop()
+    return RECORDS / elapsed
+
+
+def main():
+    ctx = multiprocessing.get_context('spawn')
+    address_queue, stop = ctx.Queue(), ctx.Event()
+    sink = ctx.Process(target=serve, args=(address_queue, stop), daemon=True)
+    sink.start()
+    address = address_queue.get()
+
+    print('publish throughput, {} records of {} bytes, {} cpus'.format(RECORDS, RECORD_SIZE, os.cpu_count()))
+    print('{:>12} {:>14}'.format('processes', 'records/sec'))
+    print('{:>12} {:>14.0f}'.format('in-process', in_process(address)))
+    for processes in (1, 2, 4, 8):
+        print('{:>12} {:>14.0f}'.format(processes, pooled(address, processes)))
+
+    stop.set()
+    sink.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Publish throughput of `Producer.publish` per record against `Producer.publish_many`.
+
+Records go to the discarding sink of `bench.batching_bench`, so only the
+producer's cost is measured. Throughput is measured until `flush()`
+returns, i.e. until every record is written to the socket.
+
+Run from the repository root:
+
+    python -m bench.publish_many_bench
+"""
+import logging
+import time
+from shapleqclient.base import QConfig
+from shapleqclient.producer import Producer
+from shapleqclient.testing import FakeZKClient
+from bench.batching_bench import Sink
+
+RECORDS = 100000
+NODE_ID = '0' * 32
+
+
+def run(sink: Sink, publish, record: bytes):
+    config = QConfig(zk_client_factory=FakeZKClient.factory([sink.address]))
+    producer = Producer(config, "bench", logging.getLogger("shapleq-python"), node_id=NODE_ID)
+    producer.setup()
+    producer.metrics().reset()
+
+    started = time.perf_counter()
+    publish(producer, [record] * RECORDS)
+    producer.flush()
+    elapsed = time.perf_counter() - started
+
+    send_calls = producer.metrics().send_calls
+    # the sink does not respond
+    producer._client.close()
+    return RECORDS / elapsed, send_calls
+
+
+def per_record(producer: Producer, records):
+    for seq, record in enumerate(records):
+        producer.publish(record, seq, NODE_ID)
+
+
+def many(producer: Producer, records):
+    producer.publish_many(records)
+
+
+def main():
+    print('publish throughput, {} records'.format(RECORDS))
+    print('{:>12} {:>13} {:>14} {:>12}'.format('record size', 'api', 'records/sec', 'send calls'))
+    sink = Sink()
+    for size in (16, 256):
+        record = b'x' * size
+        for name, publish in [('publish', per_record), ('publish_many', many)]:
+            rate, send_calls = run(sink, publish, record)
+            print('{:>12} {:>13} {:>14.0f} {:>12}'.format(size, name, rate, send_calls))
+    sink.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Threads and memory of many producers, with a receive thread each against a shared reactor.
+
+Each mode runs in a fresh interpreter against an in-process FakeBroker. Run
+from the repository root:
+
+    python -m bench.reactor_bench [producers]
+"""
+import logging
+import resource
+import subprocess
+import sys
+import threading
+import time
+from shapleqclient.base import QConfig
+from shapleqclient.producer import Producer
+from shapleqclient.reactor import Reactor
+from shapleqclient.testing import FakeBroker, FakeZKClient
+
+MODES = ('threads', 'reactor')
+
+
+def resident_kb() -> int:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def client_threads() -> int:
+    return sum(1 for th in threading.enumerate() if not th.name.startswith(FakeBroker.THREAD_NAME))
+
+
+def run(mode: str, count: int):
+    logger = logging.getLogger("shapleq-python")
+    broker = FakeBroker()
+    reactor = Reactor(logger) if mode == 'reactor' else None
+    config = QConfig(zk_client_factory=FakeZKClient.factory([broker.address]))
+    # both modes add the same broker threads to the RSS, so the difference between the modes is the receive side
+    threads_before, rss_before = client_threads(), resident_kb()
+
+    started = time.monotonic()
+    producers = []
+    for i in range(count):
+        producer = Producer(config, "topic{}".format(i), logger, reactor=reactor)
+        producer.setup()
+        producers.append(producer)
+    for producer in producers:
+        producer.publish(b'data', 1, '0' * 32)
+    elapsed = time.monotonic() - started
+
+    print('{:>8} {:>10} {:>14} {:>16} {:>12.2f}'.format(
+        mode, count, client_threads() - threads_before, resident_kb() - rss_before, elapsed))
+    sys.stdout.flush()
+
+    for producer in producers:
+        producer.stop()
+    if reactor is not None:
+        reactor.close()
+    broker.close()
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--mode':
+        run(sys.argv[2], int(sys.argv[3]))
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print('{:>8} {:>10} {:>14} {:>16} {:>12}'.format('mode', 'producers', 'added threads', 'added RSS (KB)',
+                                                     'setup sec'))
+    for mode in MODES:
+        subprocess.run([sys.executable, '-m', 'bench.reactor_bench', '--mode', mode, str(count)], check=True)
+
+
+if __name__ == '__main__':
+    main()
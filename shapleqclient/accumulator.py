@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Union
+from shapleqclient.common.exception import BufferFullError, SocketClosedError
+
+Frame = List[Union[bytes, memoryview]]
+
+
+class RecordAccumulator:
+    """Encoded frames waiting for a background sender, which writes them in batches.
+
+    The sender takes every queued frame at once when `batch_bytes` bytes are
+    queued, when the oldest frame has waited `linger_ms` milliseconds, or when
+    a flush is requested, and passes them to `send` in one call. At most
+    `buffer_memory` bytes are held, counting frames being sent; `append`
+    blocks for up to `block_timeout` seconds for room and then raises
+    `BufferFullError`. A frame larger than `buffer_memory` is accepted when
+    nothing else is held.
+
+    A failing `send` drops its batch. The error is raised to the next
+    `append` or `flush`, and later frames are still sent.
+
+    A frame can be appended with a tag, which `drop_oldest` returns when it
+    removes the frame before it is sent.
+    """
+    batch_bytes: int
+    linger_ms: int
+    buffer_memory: int
+    block_timeout: float
+    _send: Callable[[List[Frame]], None]
+    _frames: Deque[Frame]
+    # tags of the queued frames, in the same order
+    _tags: Deque[Any]
+    _queued_bytes: int
+    _held_bytes: int
+    _first_queued_at: float
+    _sending: bool
+    _flush_requested: bool
+    _closed: bool
+    _error: Optional[Exception]
+    _cond: threading.Condition
+
+    def __init__(self, send: Callable[[List[Frame]], None], batch_bytes: int, linger_ms: int, buffer_memory: int,
+                 block_timeout: float, logger: logging.Logger):
+        self.batch_bytes = batch_bytes
+        self.linger_ms = linger_ms
+        self.buffer_memory = buffer_memory
+        self.block_timeout = block_timeout
+        self.logger = logger
+        self._send = send
+        self._frames = deque()
+        self._tags = deque()
+        self._queued_bytes = 0
+        self._held_bytes = 0
+        self._first_queued_at = 0.0
+        self._sending = False
+        self._flush_requested = False
+        self._closed = False
+        self._error = None
+        self._cond = threading.Condition()
+        self._sender = threading.Thread(target=self._run, name='shapleq-sender', daemon=True)
+        self._sender.start()
+
+    def append(self, frame: Frame, tag: Any = None):
+        size = sum(len(buf) for buf in frame)
+        with self._cond:
+            self._raise_error()
+            if self._closed:
+                raise SocketClosedError()
+            if self._held_bytes > 0 and self._held_bytes + size > self.buffer_memory:
+                if not self._cond.wait_for(lambda: self._held_bytes == 0 or
+                                           self._held_bytes + size <= self.buffer_memory, self.block_timeout):
+                    raise BufferFullError()
+
+            if not self._frames:
+                self._first_queued_at = time.monotonic()
+                self._cond.notify_all()
+            self._frames.append(frame)
+            self._tags.append(tag)
+            self._queued_bytes += size
+            self._held_bytes += size
+            if self._queued_bytes >= self.batch_bytes:
+                self._cond.notify_all()
+
+    def drop_oldest(self) -> Any:
+        """Removes the oldest frame that is not being sent yet and returns its tag.
+
+        Returns None when no frame is waiting to be sent.
+        """
+        with self._cond:
+            if not self._frames:
+                return None
+            size = sum(len(buf) for buf in self._frames.popleft())
+            self._queued_bytes -= size
+            self._held_bytes -= size
+            self._cond.notify_all()
+            return self._tags.popleft()
+
+    def held_bytes(self) -> int:
+        return self._held_bytes
+
+    def flush(self):
+        """Sends every queued frame now and waits until they are written.
+
+        Raises `TimeoutError` when they are not written within `block_timeout` seconds; they are still sent.
+        """
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            written = self._cond.wait_for(lambda: not self._frames and not self._sending, self.block_timeout)
+            self._flush_requested = False
+            self._raise_error()
+            if not written:
+                raise TimeoutError("queued frames are not written yet")
+
+    def close(self):
+        """Sends the queued frames and stops the sender. Frames can not be appended afterwards."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if threading.current_thread() is not self._sender:
+            self._sender.join()
+        with self._cond:
+            self._raise_error()
+
+    def _run(self):
+        while (batch := self._next_batch()) is not None:
+            size = sum(len(buf) for frame in batch for buf in frame)
+            try:
+                self._send(batch)
+            except Exception as err:
+                self.logger.error(err)
+                with self._cond:
+                    self._error = err
+            finally:
+                with self._cond:
+                    self._sending = False
+                    self._held_bytes -= size
+                    self._cond.notify_all()
+
+    def _next_batch(self) -> Optional[List[Frame]]:
+        with self._cond:
+            while True:
+                if self._frames:
+                    if self._flush_requested or self._closed or self._queued_bytes >= self.batch_bytes:
+                        break
+                    remaining = self._first_queued_at + self.linger_ms / 1000 - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+
+            batch = list(self._frames)
+            self._frames.clear()
+            self._tags.clear()
+            self._queued_bytes = 0
+            self._sending = True
+            return batch
+
+    def _raise_error(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+import unittest
+from shapleqclient.accumulator import RecordAccumulator
+from shapleqclient.common.exception import BufferFullError, SocketWriteError
+
+
+class RecordAccumulatorTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+
+    def setUp(self):
+        self.batches = []
+        self.accumulator = None
+
+    def tearDown(self):
+        if self.accumulator is not None:
+            self.accumulator.close()
+
+    def send(self, batch):
+        self.batches.append([b''.join(frame) for frame in batch])
+
+    def make(self, send=None, batch_bytes=1024, linger_ms=60 * 1000, buffer_memory=1024 * 1024, block_timeout=1.0):
+        self.accumulator = RecordAccumulator(send or self.send, batch_bytes, linger_ms, buffer_memory,
+                                             block_timeout, self.logger)
+        return self.accumulator
+
+    def test_send_when_batch_is_full(self):
+        accumulator = self.make(batch_bytes=100)
+        for i in range(10):
+            accumulator.append([b'x' * 5, bytes([i]) * 5])
+        accumulator.flush()
+
+        self.assertEqual([[b'x' * 5 + bytes([i]) * 5 for i in range(10)]], self.batches)
+
+    def test_send_after_linger(self):
+        accumulator = self.make(linger_ms=50)
+        started = time.monotonic()
+        accumulator.append([b'record'])
+        while not self.batches and time.monotonic() - started < 5:
+            time.sleep(0.005)
+
+        self.assertEqual([[b'record']], self.batches)
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_flush_and_close_drain(self):
+        accumulator = self.make()
+        accumulator.append([b'first'])
+        accumulator.flush()
+        accumulator.append([b'second'])
+        accumulator.close()
+        self.accumulator = None
+
+        self.assertEqual([[b'first'], [b'second']], self.batches)
+
+    def test_append_blocks_then_raises_when_buffer_is_full(self):
+        release = threading.Event()
+
+        def stalled_send(batch):
+            release.wait()
+            self.send(batch)
+
+        accumulator = self.make(send=stalled_send, batch_bytes=1, buffer_memory=10, block_timeout=0.05)
+        accumulator.append([b'x' * 8])
+        with self.assertRaises(BufferFullError):
+            accumulator.append([b'x' * 8])
+
+        release.set()
+        accumulator.append([b'y' * 8])
+        accumulator.flush()
+        self.assertEqual([[b'x' * 8], [b'y' * 8]], self.batches)
+        self.assertEqual(0, accumulator.held_bytes())
+
+    def test_flush_times_out_on_stalled_send(self):
+        release = threading.Event()
+
+        def stalled_send(batch):
+            release.wait()
+            self.send(batch)
+
+        accumulator = self.make(send=stalled_send, block_timeout=0.05)
+        accumulator.append([b'record'])
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            accumulator.flush()
+        self.assertLess(time.monotonic() - started, 5)
+
+        release.set()
+        accumulator.flush()
+        self.assertEqual([[b'record']], self.batches)
+
+    def test_drop_oldest_queued_frame(self):
+        accumulator = self.make()
+        for i in range(3):
+            accumulator.append([bytes([i]) * 4], tag=i)
+
+        self.assertEqual(0, accumulator.drop_oldest())
+        self.assertEqual(8, accumulator.held_bytes())
+        accumulator.flush()
+        self.assertIsNone(accumulator.drop_oldest())
+        self.assertEqual([[bytes([1]) * 4, bytes([2]) * 4]], self.batches)
+
+    def test_send_error_is_raised_to_next_call(self):
+        def failing_send(batch):
+            raise SocketWriteError()
+
+        accumulator = self.make(send=failing_send, batch_bytes=1)
+        accumulator.append([b'record'])
+        with self.assertRaises(SocketWriteError):
+            accumulator.flush()
@@ -1,30 +1,41 @@
 import logging
 
 from shapleqclient.base import ClientBase, QConfig
-from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.pool import ConnectionPool
+from shapleqclient.message.qmessage import QMessage, MessageType, make_qmessage_from_proto
 from shapleqclient.message.api import create_topic_msg, delete_topic_msg, describe_topic_msg, list_topic_msg, ping_msg
 from shapleqclient.proto.api_pb2 import CreateTopicResponse, DeleteTopicResponse, ListTopicResponse, DescribeTopicResponse, Pong
 from shapleqclient.proto.data_pb2 import Topic
 from shapleqclient.common.exception import MessageDecodeError, RequestFailedError
 from shapleqclient.common.error import PQErrCode
-from typing import List
+from typing import List, Optional
 
 
 class Admin:
     _client: ClientBase
+    _pool: Optional[ConnectionPool]
     logger: logging.Logger
 
-    def __init__(self, broker_address: str, timeout: int, logger: logging.Logger):
+    # with a pool, the connection is checked out of it on setup and returned on stop
+    def __init__(self, broker_address: str, timeout: int, logger: logging.Logger,
+                 pool: Optional[ConnectionPool] = None):
         config = QConfig(timeout=timeout)
         self._broker_address = broker_address
         self._client = ClientBase(config, logger)
+        self._pool = pool
         self.logger = logger
 
     def setup(self):
-        self._client.connect_to_broker(self._broker_address)
+        if self._pool is not None:
+            self._client = self._pool.checkout_admin(self._broker_address)
+        else:
+            self._client.connect_to_broker(self._broker_address)
 
     def stop(self):
-        self._client.close()
+        if self._pool is not None:
+            self._pool.checkin(self._client)
+        else:
+            self._client.close()
 
     def create_topic(self, topic_name: str, topic_meta: str, num_partitions: int, replication_factor: int):
         msg = make_qmessage_from_proto(MessageType.TRANSACTION,
@@ -58,6 +69,16 @@ class Admin:
         self._client.send_message(msg)
         received = self._client.read_message()
 
+        return self._describe_topic_response(received)
+
+    def describe_topics(self, topic_names: List[str]) -> List[Topic]:
+        # requests are pipelined, so this takes one round trip for all topics
+        msgs = [make_qmessage_from_proto(MessageType.TRANSACTION, describe_topic_msg(topic_name))
+                for topic_name in topic_names]
+
+        return [self._describe_topic_response(received) for received in self._client.pipeline(msgs)]
+
+    def _describe_topic_response(self, received: QMessage) -> Topic:
         response = DescribeTopicResponse()
         if received.unpack_to(response) is None:
             raise MessageDecodeError(msg="cannot unpack to `DescribeTopicResponse`")
@@ -0,0 +1,409 @@
+"""asyncio client.
+
+One event loop drives any number of connections without a thread per
+connection. The wire format, message builders and codec are the same as
+those of the blocking `Producer`, `Consumer` and `Admin`; only the transport
+differs. Broker lookups go through kazoo, which blocks, so they run in the
+loop's default executor.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncGenerator, Deque, List, Optional, Union
+from shapleqclient.base import QConfig, make_zk_client, resolve_broker
+from shapleqclient.common.error import PQErrCode
+from shapleqclient.common.exception import SocketClosedError, RequestFailedError, InvalidMessageError, \
+    MessageDecodeError, ClientConnectionError
+from shapleqclient.compression import Compressor, get_codec
+from shapleqclient.consumer import FetchResult, make_fetch_result
+from shapleqclient.message.api import connect_msg, fetch_msg, create_topic_msg, delete_topic_msg, \
+    describe_topic_msg, list_topic_msg, ping_msg
+from shapleqclient.message.encoder import EncoderCache, Payload, payload_view
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.qmessage import QMessage, MessageType, make_qmessage_from_proto
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.metrics import Metrics, SampledLogger
+from shapleqclient.proto.api_pb2 import ConnectResponse, PutResponse, FetchResponse, BatchedFetchResponse, Ack, \
+    CreateTopicResponse, DeleteTopicResponse, DescribeTopicResponse, ListTopicResponse, Pong
+from shapleqclient.proto.data_pb2 import SessionType, Partition, Topic
+from shapleqclient.zk_client import ZKClient
+
+# queued on a stream once the connection is closed. frames of unregistered types are queued as None
+_END_OF_STREAM = object()
+
+
+class QProtocol(asyncio.Protocol):
+    """Frames a connection and matches responses to requests.
+
+    Responses arrive in the order requests were sent, so every `request` gets
+    a future that is resolved by the next response. An Ack resolves it with
+    `RequestFailedError`. Once `start_stream` is called, every message is
+    queued for `next_streamed` instead. Reading from the transport pauses
+    while `max_queued` messages are waiting, and resumes once half of them
+    were taken, so a slow reader does not buffer the stream in memory.
+
+    Received frames are decoded into protobuf messages right away, so nothing
+    handed out refers to the receive buffer.
+    """
+    _transport: Optional[asyncio.Transport]
+    _decoder: FrameDecoder
+    _registry: MessageRegistry
+    _waiters: Deque[asyncio.Future]
+    _stream: Optional[asyncio.Queue]
+    _max_queued: int
+    _reading_paused: bool
+    _closed: asyncio.Future
+    # futures of drain calls waiting for the transport to resume writing
+    _drain_waiters: Deque[asyncio.Future]
+
+    def __init__(self, config: QConfig, registry: MessageRegistry, logger: logging.Logger, metrics: Metrics):
+        self.logger = logger
+        self.metrics = metrics
+        self._transport = None
+        self._decoder = FrameDecoder(config.get_checksum_policy(), config.get_read_buffer_min_size(),
+                                     config.get_read_buffer_max_size(), metrics)
+        self._registry = registry
+        self._waiters = deque()
+        self._stream = None
+        self._max_queued = 0
+        self._reading_paused = False
+        self._closed = asyncio.get_running_loop().create_future()
+        self._paused = False
+        self._drain_waiters = deque()
+
+    def connection_made(self, transport: asyncio.Transport):
+        self._transport = transport
+
+    def data_received(self, data: bytes):
+        self.metrics.recv_calls += 1
+        self._decoder.feed(data)
+        try:
+            for msg in self._decoder:
+                self._dispatch(self._registry.decode(msg))
+        except (MessageDecodeError, InvalidMessageError) as err:
+            self.logger.error(err)
+            self._transport.close()
+
+    def _dispatch(self, received):
+        if self._stream is not None:
+            self._stream.put_nowait(received)
+            if not self._reading_paused and self._stream.qsize() >= self._max_queued:
+                self._reading_paused = True
+                self._transport.pause_reading()
+            return
+
+        if not self._waiters:
+            self.logger.error('received a message no request is waiting for')
+            return
+        waiter = self._waiters.popleft()
+        if waiter.done():
+            return
+        if isinstance(received, Ack):
+            waiter.set_exception(RequestFailedError(msg=received.msg))
+        elif received is None:
+            waiter.set_exception(InvalidMessageError())
+        else:
+            waiter.set_result(received)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(SocketClosedError())
+        if self._stream is not None:
+            self._stream.put_nowait(_END_OF_STREAM)
+        if not self._closed.done():
+            self._closed.set_result(None)
+        self._wake_drain()
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        self._wake_drain()
+
+    def is_connected(self) -> bool:
+        return self._transport is not None and not self._closed.done()
+
+    def send(self, buffers: List[Union[bytes, memoryview]]):
+        if not self.is_connected():
+            raise SocketClosedError()
+        self.metrics.frames_sent += 1
+        self.metrics.bytes_sent += sum(memoryview(buf).nbytes for buf in buffers)
+        self._transport.writelines(buffers)
+
+    def request(self, buffers: List[Union[bytes, memoryview]]) -> asyncio.Future:
+        self.send(buffers)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        return waiter
+
+    def start_stream(self, max_queued: int):
+        self._stream = asyncio.Queue()
+        self._max_queued = max_queued
+
+    async def next_streamed(self):
+        # returns None once the connection is closed. raises InvalidMessageError for a frame of an unregistered type
+        received = await self._stream.get()
+        if self._reading_paused and self._stream.qsize() <= self._max_queued // 2 and self.is_connected():
+            self._reading_paused = False
+            self._transport.resume_reading()
+        if received is _END_OF_STREAM:
+            return None
+        if received is None:
+            raise InvalidMessageError()
+        return received
+
+    async def drain(self):
+        # waits while the transport holds more than its high-water mark of unsent data
+        if self._paused and self.is_connected():
+            waiter = asyncio.get_running_loop().create_future()
+            self._drain_waiters.append(waiter)
+            await waiter
+
+    def _wake_drain(self):
+        while self._drain_waiters:
+            waiter = self._drain_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+    async def wait_closed(self):
+        await self._closed
+
+
+class AsyncClient:
+    config: QConfig
+    logger: logging.Logger
+    metrics: Metrics
+    frame_log: SampledLogger
+    _zk_client: ZKClient
+    _protocol: Optional[QProtocol]
+
+    def __init__(self, config: QConfig, logger: logging.Logger):
+        self.config = config
+        self.logger = logger
+        self.metrics = config.get_metrics() if config.get_metrics() is not None else Metrics()
+        self.frame_log = SampledLogger(logger, config.get_debug_log_sample_rate())
+        self._zk_client = make_zk_client(config)
+        self._protocol = None
+
+    def is_connected(self) -> bool:
+        return self._protocol is not None and self._protocol.is_connected()
+
+    async def connect_to_broker(self, host: str, registry: MessageRegistry) -> QProtocol:
+        if self.is_connected():
+            raise ClientConnectionError("already connected to broker")
+
+        addr = host.split(":")
+        try:
+            _, self._protocol = await asyncio.wait_for(
+                asyncio.get_running_loop().create_connection(
+                    lambda: QProtocol(self.config, registry, self.logger, self.metrics), addr[0], int(addr[1])),
+                self.config.get_timeout() / 1000)
+        except asyncio.TimeoutError:
+            raise ClientConnectionError("cannot connect to broker : timeout")
+        self.logger.info('connected to broker target {}'.format(host))
+        return self._protocol
+
+    async def connect(self, session_type: SessionType, topic: str, registry: MessageRegistry) -> QProtocol:
+        host = await asyncio.get_running_loop().run_in_executor(
+            None, resolve_broker, self._zk_client, session_type, topic)
+        protocol = await self.connect_to_broker(host, registry)
+
+        msg = make_qmessage_from_proto(MessageType.STREAM, connect_msg(session_type, topic))
+        try:
+            received = await asyncio.wait_for(protocol.request(msg.buffers()), self.config.get_timeout() / 1000)
+            if not isinstance(received, ConnectResponse):
+                raise InvalidMessageError()
+        except BaseException:
+            # the connection is not handed out, so nothing else would close it
+            protocol.close()
+            raise
+        self.logger.info('stream initialized')
+        return protocol
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._zk_client.close)
+        if self._protocol is not None:
+            self._protocol.close()
+            await self._protocol.wait_closed()
+            self.logger.info('connection closed')
+
+
+class AsyncProducer:
+    """Producer on asyncio.
+
+    `publish` writes the record right away and returns a future that resolves
+    to the partition the broker stored it in, or fails with
+    `asyncio.TimeoutError` when no response arrives within the timeout. Call `drain` now and then when
+    publishing in a tight loop, so the transport buffer does not grow without
+    bound.
+    """
+    topic: str
+    logger: logging.Logger
+    _client: AsyncClient
+    _protocol: Optional[QProtocol]
+    _encoders: EncoderCache
+    _compressor: Optional[Compressor]
+    _MESSAGES = MessageRegistry(ConnectResponse, PutResponse, Ack)
+
+    def __init__(self, config: QConfig, topic: str, logger: logging.Logger):
+        self._client = AsyncClient(config, logger)
+        self.logger = logger
+        self.topic = topic
+        self._protocol = None
+        self._encoders = EncoderCache()
+        self._compressor = None
+        if config.get_compression() is not None:
+            self._compressor = Compressor(get_codec(config.get_compression()), config.get_compression_threshold())
+
+    async def setup(self):
+        self._protocol = await self._client.connect(SessionType.PUBLISHER, self.topic, self._MESSAGES)
+
+    def is_connected(self) -> bool:
+        return self._client.is_connected()
+
+    async def stop(self):
+        await self._client.close()
+
+    def metrics(self) -> Metrics:
+        return self._client.metrics
+
+    def publish(self, data: Payload, seq_num: int, node_id: str) -> 'asyncio.Future[Partition]':
+        if not self.is_connected():
+            raise SocketClosedError()
+        encoder = self._encoders.get(node_id)
+        data = payload_view(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+
+        response = self._protocol.request(encoder.encode(data, seq_num))
+        loop = asyncio.get_running_loop()
+        partition = loop.create_future()
+        # like asyncio.wait_for, without a task per record
+        expiry = loop.call_later(self._client.config.get_timeout() / 1000, self._expire, partition)
+        response.add_done_callback(lambda done: self._resolve(done, partition, expiry))
+        return partition
+
+    @staticmethod
+    def _expire(partition: asyncio.Future):
+        if not partition.done():
+            partition.set_exception(asyncio.TimeoutError())
+
+    @staticmethod
+    def _resolve(response: asyncio.Future, partition: asyncio.Future, expiry: asyncio.TimerHandle):
+        expiry.cancel()
+        if partition.done():
+            return
+        if response.exception() is not None:
+            partition.set_exception(response.exception())
+        elif isinstance(response.result(), PutResponse):
+            partition.set_result(response.result().partition)
+        else:
+            partition.set_exception(InvalidMessageError())
+
+    async def drain(self):
+        if self._protocol is not None:
+            await self._protocol.drain()
+
+
+class AsyncConsumer:
+    # responses queued for a slow reader before reading from the connection pauses
+    MAX_QUEUED_RESPONSES = 64
+
+    topic: str
+    logger: logging.Logger
+    _client: AsyncClient
+    _protocol: Optional[QProtocol]
+    _MESSAGES = MessageRegistry(ConnectResponse, FetchResponse, BatchedFetchResponse, Ack)
+
+    def __init__(self, config: QConfig, topic: str, logger: logging.Logger):
+        self._client = AsyncClient(config, logger)
+        self.logger = logger
+        self.topic = topic
+        self._protocol = None
+
+    async def setup(self):
+        self._protocol = await self._client.connect(SessionType.SUBSCRIBER, self.topic, self._MESSAGES)
+
+    def is_connected(self) -> bool:
+        return self._client.is_connected()
+
+    async def stop(self):
+        await self._client.close()
+
+    def metrics(self) -> Metrics:
+        return self._client.metrics
+
+    # records of compressing producers are decompressed unless decompress=False, as with Consumer.subscribe
+    async def subscribe(self, start_offset: int, max_batch_size: int = 1, flush_interval: int = 100,
+                        decompress: bool = True) -> AsyncGenerator[FetchResult, None]:
+        if not self.is_connected():
+            raise SocketClosedError()
+
+        self._protocol.start_stream(self.MAX_QUEUED_RESPONSES)
+        msg = make_qmessage_from_proto(MessageType.STREAM, fetch_msg(start_offset, max_batch_size, flush_interval))
+        self._protocol.send(msg.buffers())
+
+        while (received := await self._protocol.next_streamed()) is not None:
+            yield make_fetch_result(received, self._client.frame_log,
+                                    self._client.config.get_max_decompressed_size() if decompress else None)
+
+
+class AsyncAdmin:
+    logger: logging.Logger
+    _client: AsyncClient
+    _protocol: Optional[QProtocol]
+    _MESSAGES = MessageRegistry(CreateTopicResponse, DeleteTopicResponse, DescribeTopicResponse, ListTopicResponse,
+                                Pong, Ack)
+
+    def __init__(self, broker_address: str, timeout: int, logger: logging.Logger):
+        self._broker_address = broker_address
+        self._client = AsyncClient(QConfig(timeout=timeout), logger)
+        self.logger = logger
+        self._protocol = None
+
+    async def setup(self):
+        self._protocol = await self._client.connect_to_broker(self._broker_address, self._MESSAGES)
+
+    async def stop(self):
+        await self._client.close()
+
+    async def create_topic(self, topic_name: str, topic_meta: str, num_partitions: int, replication_factor: int):
+        await self._request(create_topic_msg(topic_name, topic_meta, num_partitions, replication_factor),
+                            CreateTopicResponse)
+
+    async def delete_topic(self, topic_name: str):
+        await self._request(delete_topic_msg(topic_name), DeleteTopicResponse)
+
+    async def describe_topic(self, topic_name: str) -> Topic:
+        response = await self._request(describe_topic_msg(topic_name), DescribeTopicResponse)
+        return response.topic
+
+    async def list_topic(self) -> List[Topic]:
+        response = await self._request(list_topic_msg(), ListTopicResponse)
+        return response.topics
+
+    async def heartbeat(self, msg: str, broker_id: int) -> Pong:
+        return await self._request(ping_msg(msg, broker_id), Pong)
+
+    async def _request(self, request, response_type):
+        if self._protocol is None:
+            raise SocketClosedError()
+
+        msg: QMessage = make_qmessage_from_proto(MessageType.TRANSACTION, request)
+        response = await asyncio.wait_for(self._protocol.request(msg.buffers()),
+                                          self._client.config.get_timeout() / 1000)
+        if not isinstance(response, response_type):
+            raise MessageDecodeError(msg="cannot unpack to `{}`".format(response_type.DESCRIPTOR.name))
+
+        if hasattr(response, 'error_code') and response.error_code != PQErrCode.Success.value:
+            self.logger.error(response.error_message)
+            raise RequestFailedError(msg=response.error_message)
+
+        return response
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import unittest
+from shapleqclient.aio import AsyncProducer, AsyncConsumer, AsyncAdmin
+from shapleqclient.base import QConfig
+from shapleqclient.common.exception import InvalidMessageError, RequestFailedError, SocketClosedError
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.producer import Producer
+from shapleqclient.proto.api_pb2 import Pong
+from shapleqclient.testing import FakeBroker, FakeZKClient
+
+
+class AsyncClientTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+    topic = "test_topic"
+    node_id = "0" * 32
+
+    def setUp(self):
+        self.broker = FakeBroker()
+
+    def tearDown(self):
+        self.broker.close()
+
+    def make_producer(self, config: QConfig = None) -> AsyncProducer:
+        config = config or QConfig()
+        config.zk_client_factory = FakeZKClient.factory([self.broker.address])
+        return AsyncProducer(config, self.topic, self.logger)
+
+    def make_consumer(self) -> AsyncConsumer:
+        config = QConfig(zk_client_factory=FakeZKClient.factory([self.broker.address]))
+        return AsyncConsumer(config, self.topic, self.logger)
+
+    def test_publish_and_subscribe(self):
+        records = ['record{}'.format(i).encode() for i in range(100)]
+
+        async def run():
+            producer = self.make_producer()
+            await producer.setup()
+            partitions = await asyncio.gather(*(producer.publish(data, seq, self.node_id)
+                                                for seq, data in enumerate(records)))
+            await producer.stop()
+
+            consumer = self.make_consumer()
+            await consumer.setup()
+            received = []
+            async for result in consumer.subscribe(0, max_batch_size=8):
+                received.extend(item.data for item in result.items)
+                if len(received) == len(records):
+                    break
+            await consumer.stop()
+            return partitions, received
+
+        partitions, received = asyncio.run(run())
+
+        self.assertEqual(list(range(len(records))), [partition.offset for partition in partitions])
+        self.assertEqual(records, received)
+
+    def test_many_producers_on_one_loop(self):
+        async def publish(seq: int):
+            producer = self.make_producer()
+            await producer.setup()
+            partition = await producer.publish(b'data', seq, self.node_id)
+            await producer.stop()
+            return partition
+
+        async def run():
+            return await asyncio.gather(*(publish(seq) for seq in range(50)))
+
+        partitions = asyncio.run(run())
+
+        self.assertEqual(set(range(50)), {partition.offset for partition in partitions})
+        self.assertEqual(set(range(50)), {record.seq_num for record in self.broker.records(self.topic)})
+
+    def test_publish_failure_and_closed_connection(self):
+        self.broker.put_error = "failed"
+
+        async def run():
+            producer = self.make_producer()
+            await producer.setup()
+            with self.assertRaises(RequestFailedError):
+                await producer.publish(b'data', 1, self.node_id)
+
+            self.broker.put_error = None
+            self.broker.put_delay = 0.5
+            pending = producer.publish(b'data', 2, self.node_id)
+            self.broker.drop_connections()
+            with self.assertRaises(SocketClosedError):
+                await pending
+            with self.assertRaises(SocketClosedError):
+                producer.publish(b'data', 3, self.node_id)
+            await producer.stop()
+
+        asyncio.run(run())
+
+    def test_publish_times_out(self):
+        self.broker.put_delay = 0.5
+
+        async def run():
+            producer = self.make_producer(QConfig(timeout=100))
+            await producer.setup()
+            with self.assertRaises(asyncio.TimeoutError):
+                await producer.publish(b'data', 1, self.node_id)
+            await producer.stop()
+
+        asyncio.run(run())
+
+    def test_unexpected_streamed_message_raises(self):
+        async def run():
+            consumer = self.make_consumer()
+            await consumer.setup()
+            subscription = consumer.subscribe(0)
+            fetch = asyncio.ensure_future(subscription.__anext__())
+            await asyncio.sleep(0.05)
+            consumer._protocol.data_received(make_qmessage_from_proto(MessageType.STREAM, Pong()).serialize())
+            with self.assertRaises(InvalidMessageError):
+                await asyncio.wait_for(fetch, 5)
+            await consumer.stop()
+
+        asyncio.run(run())
+
+    def test_failed_handshake_closes_connection(self):
+        async def run():
+            closed = asyncio.Event()
+
+            async def respond(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+                # answers the connect request with a message the consumer does not expect
+                await reader.read(1)
+                writer.write(make_qmessage_from_proto(MessageType.STREAM, Pong()).serialize())
+                while await reader.read(4096):
+                    pass
+                closed.set()
+                writer.close()
+
+            server = await asyncio.start_server(respond, '127.0.0.1', 0)
+            address = '127.0.0.1:{}'.format(server.sockets[0].getsockname()[1])
+            config = QConfig(zk_client_factory=FakeZKClient.factory([address]))
+            consumer = AsyncConsumer(config, self.topic, self.logger)
+            with self.assertRaises(InvalidMessageError):
+                await consumer.setup()
+            await asyncio.wait_for(closed.wait(), 5)
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+    def test_concurrent_drains_wake_up(self):
+        async def run():
+            producer = self.make_producer()
+            await producer.setup()
+            protocol = producer._protocol
+            protocol.pause_writing()
+            drains = [asyncio.ensure_future(protocol.drain()) for _ in range(3)]
+            await asyncio.sleep(0)
+            protocol.resume_writing()
+            await asyncio.wait_for(asyncio.gather(*drains), 5)
+            await producer.stop()
+
+        asyncio.run(run())
+
+    def test_slow_reader_pauses_reading(self):
+        count = 2000
+        records = [b'%04d' % i + b'x' * 1000 for i in range(count)]
+        config = QConfig(zk_client_factory=FakeZKClient.factory([self.broker.address]))
+        producer = Producer(config, self.topic, self.logger, node_id=self.node_id)
+        producer.setup()
+        producer.publish_many(records)[-1].result(timeout=10)
+        producer.stop()
+
+        async def run():
+            consumer = self.make_consumer()
+            await consumer.setup()
+            received, queued = [], []
+            async for result in consumer.subscribe(0):
+                received.extend(item.data for item in result.items)
+                if len(received) % 100 == 0:
+                    # lets the broker fill the connection while nothing is taken
+                    await asyncio.sleep(0.05)
+                    queued.append(consumer._protocol._stream.qsize())
+                if len(received) == count:
+                    break
+            await consumer.stop()
+            return received, queued
+
+        received, queued = asyncio.run(run())
+
+        self.assertEqual(records, received)
+        # the read that fills the queue is decoded whole, and the transport reads up to 256 KiB at once
+        self.assertLessEqual(max(queued), AsyncConsumer.MAX_QUEUED_RESPONSES + 256 * 1024 // 1000)
+        self.assertLess(max(queued), count // 4)
+
+    def test_admin(self):
+        async def run():
+            admin = AsyncAdmin(self.broker.address, 3000, self.logger)
+            await admin.setup()
+            await admin.create_topic(self.topic, "meta", 1, 1)
+            topic = await admin.describe_topic(self.topic)
+            topics = await admin.list_topic()
+            await admin.delete_topic(self.topic)
+            with self.assertRaises(RequestFailedError):
+                await admin.describe_topic(self.topic)
+            await admin.stop()
+            return topic, topics
+
+        topic, topics = asyncio.run(run())
+
+        self.assertEqual(self.topic, topic.name)
+        self.assertEqual(1, len(topics))
@@ -1,11 +1,19 @@
+import select
 import socket
+import threading
 from shapleqclient.proto.data_pb2 import SessionType, PUBLISHER
 from shapleqclient.proto.api_pb2 import ConnectResponse, Ack
 from shapleqclient.common.exception import *
 from shapleqclient.message.qmessage import *
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.message.checksum import ChecksumPolicy, INLINE_CHECKSUM
 from shapleqclient.message.api import connect_msg
 from shapleqclient.common.error import PQErrCode
-from typing import Generator
+from shapleqclient.compression import DEFAULT_COMPRESSION_THRESHOLD, DEFAULT_MAX_DECOMPRESSED_SIZE
+from shapleqclient.write_buffer import WriteBuffer
+from shapleqclient.metrics import Metrics, SampledLogger
+from typing import Callable, Generator, Iterator, List, Optional, Union
 import logging
 import os
 from shapleqclient.zk_client import ZKClient, ZKLocalConfig, ZKProductionConfig
@@ -15,11 +23,98 @@ import random
 class QConfig:
     DEFAULT_TIMEOUT = 3000
     DEFAULT_ZK_QUORUM = "localhost:2181"
+    DEFAULT_FLUSH_SIZE = 16 * 1024
+    DEFAULT_FLUSH_DELAY = 0
+    DEFAULT_READ_BUFFER_MIN_SIZE = FrameDecoder.DEFAULT_MIN_SIZE
+    DEFAULT_READ_BUFFER_MAX_SIZE = FrameDecoder.DEFAULT_MAX_SIZE
+    DEFAULT_DEBUG_LOG_SAMPLE_RATE = 100
+    DEFAULT_LINGER_MS = 5
+    DEFAULT_BUFFER_MEMORY = 32 * 1024 * 1024
+    DEFAULT_RECONNECT_BACKOFF_MAX_MS = 10 * 1000
+    DEFAULT_RECONNECT_TIMEOUT_MS = 60 * 1000
+    DEFAULT_SPILL_SEGMENT_BYTES = 16 * 1024 * 1024
+    DEFAULT_SPILL_MAX_BYTES = 1024 * 1024 * 1024
+    # policies of a producer whose in-flight window is full
+    BLOCK = 'block'
+    RAISE = 'raise'
+    DROP_OLDEST = 'drop_oldest'
 
     # timeout should be milliseconds value
-    def __init__(self, zk_quorum: str = DEFAULT_ZK_QUORUM, timeout: int = DEFAULT_TIMEOUT):
+    # checksum_policy decides when checksums of received frames are verified (see message.checksum)
+    # compression is the codec name ('zlib', 'bz2' or 'lzma') producers compress records of at least
+    # compression_threshold bytes with. consumers decompress compressed records regardless of this setting, unless
+    # subscribing with decompress=False, and fail records that expand past max_decompressed_size bytes
+    # outgoing frames are written once flush_size bytes are pending or flush_delay milliseconds have passed.
+    # flush_delay 0 writes every frame right away
+    # send_buffer_size and receive_buffer_size set SO_SNDBUF and SO_RCVBUF; 0 keeps the system default
+    # the buffer frames are received into starts at read_buffer_min_size bytes and adapts up to read_buffer_max_size.
+    # it still grows to fit a larger frame, and shrinks back afterwards
+    # frames, bytes and socket calls are counted into metrics, which clients may share. each client counts into
+    # its own by default. per-frame events are logged at debug level for one of every debug_log_sample_rate frames
+    # producers batch records in the background when batch_bytes is over 0. a batch is sent once it holds
+    # batch_bytes bytes or its first record waited linger_ms milliseconds. at most buffer_memory bytes of records
+    # are held; publishing more blocks for up to timeout
+    # producers keep at most max_in_flight records and max_in_flight_bytes bytes of encoded records published but
+    # not responded to yet; 0 is unlimited. publishing into a full window follows in_flight_policy: BLOCK waits for
+    # up to timeout, RAISE fails right away, DROP_OLDEST drops the oldest record not sent yet, or the new record
+    # when all are sent
+    # producers reconnect a lost connection when reconnect_backoff_ms is over 0, looking the broker up in zookeeper
+    # again. attempts wait reconnect_backoff_ms milliseconds, doubling up to reconnect_backoff_max_ms, and stop once
+    # reconnect_timeout_ms milliseconds have passed
+    # with spill_dir set, records a reconnecting producer writes while its connection is down go to a log of
+    # memory-mapped files of spill_segment_bytes bytes under spill_dir rather than staying in memory. the log holds at
+    # most spill_max_bytes bytes and is sent in order once the connection is back. such a producer also starts when no
+    # broker can be reached, spilling until it connects. spill_dir needs reconnect_backoff_ms over 0
+    # zk_client_factory, if given, makes the zookeeper clients brokers are looked up with instead of connecting to
+    # zk_quorum, e.g. testing.FakeZKClient.factory. a ProducerPool pickles it with the config for its processes
+    def __init__(self, zk_quorum: str = DEFAULT_ZK_QUORUM, timeout: int = DEFAULT_TIMEOUT,
+                 checksum_policy: ChecksumPolicy = INLINE_CHECKSUM, compression: Optional[str] = None,
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                 max_decompressed_size: int = DEFAULT_MAX_DECOMPRESSED_SIZE,
+                 flush_size: int = DEFAULT_FLUSH_SIZE, flush_delay: int = DEFAULT_FLUSH_DELAY,
+                 tcp_nodelay: bool = False, send_buffer_size: int = 0, receive_buffer_size: int = 0,
+                 read_buffer_min_size: int = DEFAULT_READ_BUFFER_MIN_SIZE,
+                 read_buffer_max_size: int = DEFAULT_READ_BUFFER_MAX_SIZE, metrics: Optional[Metrics] = None,
+                 debug_log_sample_rate: int = DEFAULT_DEBUG_LOG_SAMPLE_RATE, batch_bytes: int = 0,
+                 linger_ms: int = DEFAULT_LINGER_MS, buffer_memory: int = DEFAULT_BUFFER_MEMORY,
+                 max_in_flight: int = 0, max_in_flight_bytes: int = 0, in_flight_policy: str = BLOCK,
+                 reconnect_backoff_ms: int = 0, reconnect_backoff_max_ms: int = DEFAULT_RECONNECT_BACKOFF_MAX_MS,
+                 reconnect_timeout_ms: int = DEFAULT_RECONNECT_TIMEOUT_MS, spill_dir: Optional[str] = None,
+                 spill_segment_bytes: int = DEFAULT_SPILL_SEGMENT_BYTES,
+                 spill_max_bytes: int = DEFAULT_SPILL_MAX_BYTES,
+                 zk_client_factory: Optional[Callable[[], ZKClient]] = None):
+        if in_flight_policy not in (self.BLOCK, self.RAISE, self.DROP_OLDEST):
+            raise ValueError("unknown in-flight policy `{}`".format(in_flight_policy))
+        if spill_dir is not None and reconnect_backoff_ms <= 0:
+            raise ValueError("spill_dir needs reconnect_backoff_ms over 0")
         self.zk_quorum = zk_quorum
         self.timeout = timeout
+        self.checksum_policy = checksum_policy
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.max_decompressed_size = max_decompressed_size
+        self.flush_size = flush_size
+        self.flush_delay = flush_delay
+        self.tcp_nodelay = tcp_nodelay
+        self.send_buffer_size = send_buffer_size
+        self.receive_buffer_size = receive_buffer_size
+        self.read_buffer_min_size = read_buffer_min_size
+        self.read_buffer_max_size = read_buffer_max_size
+        self.metrics = metrics
+        self.debug_log_sample_rate = debug_log_sample_rate
+        self.batch_bytes = batch_bytes
+        self.linger_ms = linger_ms
+        self.buffer_memory = buffer_memory
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.in_flight_policy = in_flight_policy
+        self.reconnect_backoff_ms = reconnect_backoff_ms
+        self.reconnect_backoff_max_ms = reconnect_backoff_max_ms
+        self.reconnect_timeout_ms = reconnect_timeout_ms
+        self.spill_dir = spill_dir
+        self.spill_segment_bytes = spill_segment_bytes
+        self.spill_max_bytes = spill_max_bytes
+        self.zk_client_factory = zk_client_factory
 
     def get_zk_quorum(self) -> str:
         return self.zk_quorum
@@ -27,25 +122,145 @@ class QConfig:
     def get_timeout(self) -> int:
         return self.timeout
 
+    def get_checksum_policy(self) -> ChecksumPolicy:
+        return self.checksum_policy
+
+    def get_compression(self) -> Optional[str]:
+        return self.compression
+
+    def get_compression_threshold(self) -> int:
+        return self.compression_threshold
+
+    def get_max_decompressed_size(self) -> int:
+        return self.max_decompressed_size
+
+    def get_flush_size(self) -> int:
+        return self.flush_size
+
+    def get_flush_delay(self) -> int:
+        return self.flush_delay
+
+    def get_tcp_nodelay(self) -> bool:
+        return self.tcp_nodelay
+
+    def get_send_buffer_size(self) -> int:
+        return self.send_buffer_size
+
+    def get_receive_buffer_size(self) -> int:
+        return self.receive_buffer_size
+
+    def get_read_buffer_min_size(self) -> int:
+        return self.read_buffer_min_size
+
+    def get_read_buffer_max_size(self) -> int:
+        return self.read_buffer_max_size
+
+    def get_metrics(self) -> Optional[Metrics]:
+        return self.metrics
+
+    def get_debug_log_sample_rate(self) -> int:
+        return self.debug_log_sample_rate
+
+    def get_batch_bytes(self) -> int:
+        return self.batch_bytes
+
+    def get_linger_ms(self) -> int:
+        return self.linger_ms
+
+    def get_buffer_memory(self) -> int:
+        return self.buffer_memory
+
+    def get_max_in_flight(self) -> int:
+        return self.max_in_flight
+
+    def get_max_in_flight_bytes(self) -> int:
+        return self.max_in_flight_bytes
+
+    def get_in_flight_policy(self) -> str:
+        return self.in_flight_policy
+
+    def get_reconnect_backoff_ms(self) -> int:
+        return self.reconnect_backoff_ms
+
+    def get_reconnect_backoff_max_ms(self) -> int:
+        return self.reconnect_backoff_max_ms
+
+    def get_reconnect_timeout_ms(self) -> int:
+        return self.reconnect_timeout_ms
+
+    def get_spill_dir(self) -> Optional[str]:
+        return self.spill_dir
+
+    def get_spill_segment_bytes(self) -> int:
+        return self.spill_segment_bytes
+
+    def get_spill_max_bytes(self) -> int:
+        return self.spill_max_bytes
+
+    def get_zk_client_factory(self) -> Optional[Callable[[], ZKClient]]:
+        return self.zk_client_factory
+
+
+def make_zk_client(config: QConfig) -> ZKClient:
+    if config.get_zk_client_factory() is not None:
+        return config.get_zk_client_factory()()
+    zk_config = None
+    if 'FLASK_ENV' in os.environ and os.environ['FLASK_ENV'] == 'production':
+        zk_config = ZKProductionConfig()
+    else:
+        zk_config = ZKLocalConfig()
+    zk_config.quorum = config.get_zk_quorum()
+    return ZKClient(config=zk_config)
+
+
+def resolve_broker(zk_client: ZKClient, session_type: SessionType, topic: str) -> str:
+    if len(topic) == 0:
+        raise TopicNotSetError()
+
+    zk_client.connect()
+    topic_brokers = zk_client.get_topic_brokers(topic)
+
+    if len(topic_brokers) > 0:
+        return topic_brokers[0]
+    elif session_type == PUBLISHER:  # if publisher, pick random broker unless topic broker exists
+        brokers = zk_client.get_brokers()
+        if len(brokers) == 0:
+            raise ClientConnectionError(msg="broker not exists")
+        else:
+            return brokers[random.randrange(0, len(brokers))]
+    else:
+        raise ClientConnectionError(msg="broker not exists")
+
 
 class ClientBase:
     connected: bool = False
     config: QConfig
     logger: logging.Logger
+    metrics: Metrics
+    frame_log: SampledLogger
     _sock: socket.socket
-    _RECEIVE_BUFFER_SIZE = 4 * 1024
+    _writer: WriteBuffer
+    _reader: FrameDecoder
+    # created by the first continuous_receive or interrupt_receive, so connections driven by a reactor or pooled
+    # without a receiving thread hold no extra descriptors
+    _wakeup_r: Optional[socket.socket]
+    _wakeup_w: Optional[socket.socket]
+    # number of continuous_receive calls in progress
+    _receivers: int
+    _receive_lock: threading.Lock
     _zk_client: ZKClient
+    _STREAM_MESSAGES = MessageRegistry(ConnectResponse, Ack)
+    # requests `pipeline` has outstanding at most
+    PIPELINE_DEPTH = 64
 
     def __init__(self, config: QConfig, logger: logging.Logger):
         self.config = config
         self.logger = logger
-        zk_config = None
-        if 'FLASK_ENV' in os.environ and os.environ['FLASK_ENV'] == 'production':
-            zk_config = ZKProductionConfig()
-        else:
-            zk_config = ZKLocalConfig()
-        zk_config.quorum = config.get_zk_quorum()
-        self._zk_client = ZKClient(config=zk_config)
+        self.metrics = config.get_metrics() if config.get_metrics() is not None else Metrics()
+        self.frame_log = SampledLogger(logger, config.get_debug_log_sample_rate())
+        self._zk_client = make_zk_client(config)
+        self._receive_lock = threading.Lock()
+        self._receivers = 0
 
     def is_connected(self) -> bool:
         return self.connected
@@ -54,55 +269,116 @@ class ClientBase:
         if self.connected:
             raise ClientConnectionError("already connected to broker")
 
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sock.settimeout(self.config.get_timeout() / 1000)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.config.get_timeout() / 1000)
+        self._configure_socket(sock)
         try:
             addr = host.split(":")
-            self._sock.connect((addr[0], int(addr[1])))
-            self.connected = True
+            sock.connect((addr[0], int(addr[1])))
+            self._attach(sock)
             self.logger.info('connected to broker target {}'.format(host))
 
         except socket.timeout:
+            sock.close()
             raise ClientConnectionError("cannot connect to broker : timeout")
 
+    def _configure_socket(self, sock: socket.socket):
+        if self.config.get_tcp_nodelay():
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.config.get_send_buffer_size() > 0:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.config.get_send_buffer_size())
+        if self.config.get_receive_buffer_size() > 0:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config.get_receive_buffer_size())
+
+    def _attach(self, sock: socket.socket):
+        self._sock = sock
+        self._writer = WriteBuffer(sock, self.config.get_flush_size(), self.config.get_flush_delay(), self.metrics)
+        self._reader = self._make_decoder()
+        self._wakeup_r, self._wakeup_w = None, None
+        self.connected = True
+
     def send_message(self, msg: QMessage):
-        if self._sock.send(msg.serialize()) <= 0:
-            raise SocketWriteError()
-        self.logger.info('sent data successfully')
+        # messages are requests the caller may wait on a response for, so they are not held back for coalescing
+        self.send_buffers(msg.buffers())
+        self._writer.flush()
+        self.frame_log.debug('sent data successfully')
 
+    def send_buffers(self, buffers: List[Union[bytes, memoryview]]):
+        if not self.is_connected():
+            raise SocketClosedError()
+        self.metrics.frames_sent += 1
+        self._writer.write(buffers)
+
+    def send_batch(self, frames: List[List[Union[bytes, memoryview]]], flush: bool = True,
+                   count: Optional[int] = None):
+        # all frames are written together, with one vectored send unless the socket takes fewer bytes.
+        # without flush, they are held back like frames of send_buffers. count is the number of frames when a buffer
+        # holds several
+        if not self.is_connected():
+            raise SocketClosedError()
+        self.metrics.frames_sent += len(frames) if count is None else count
+        self._writer.write([buf for buffers in frames for buf in buffers])
+        if flush:
+            self._writer.flush()
+
+    def flush(self):
+        if not self.is_connected():
+            raise SocketClosedError()
+        self._writer.flush()
+
+    def _make_decoder(self) -> FrameDecoder:
+        return FrameDecoder(self.config.get_checksum_policy(), self.config.get_read_buffer_min_size(),
+                            self.config.get_read_buffer_max_size(), self.metrics)
+
+    # read_message and continuous_receive share the read buffer of the connection, so frames received together
+    # with an earlier response are kept for the next read
     def read_message(self) -> QMessage:
-        msg_buf: bytearray = bytearray(b'')
         while True:
             if not self.is_connected():
                 raise SocketClosedError()
 
+            if (qmsg := self._reader.next_message()) is not None:
+                return qmsg
+
             try:
-                received = self._sock.recv(self._RECEIVE_BUFFER_SIZE)
-                if not received:
+                if self._reader.recv_into(self._sock) == 0:
                     self.close()
                     raise SocketClosedError()
-                self.logger.info('read data successfully')
-
-                msg_buf += bytearray(received)
-
-                return make_qmessage_from_buffer(msg_buf)
-            except NotEnoughBufferError:
-                continue
+                self.frame_log.debug('read data successfully')
             except socket.error as msg:
                 self.logger.error(msg)
                 self.close()
                 raise SocketReadError()
 
     def continuous_receive(self) -> Generator[QMessage, None, None]:
-        msg_buf: bytearray = bytearray(b'')
+        with self._receive_lock:
+            if not self.is_connected():
+                raise SocketClosedError()
+            self._open_wakeup()
+            self._receivers += 1
+        try:
+            yield from self._receive()
+        finally:
+            with self._receive_lock:
+                self._receivers -= 1
+                if not self.connected and self._receivers == 0:
+                    self._wakeup_r.close()
+
+    def _receive(self) -> Generator[QMessage, None, None]:
+        # frames left over from earlier reads
+        yield from self._reader
 
         while True:
             if not self.is_connected():
                 raise SocketClosedError()
 
             try:
-                received = self._sock.recv(self._RECEIVE_BUFFER_SIZE)
-                if not received:
+                if self._wait_readable():
+                    if not self.is_connected():
+                        raise SocketClosedError()
+                    self._clear_interrupt()
+                    return
+                if (received := self._reader.recv_into(self._sock)) == 0:
                     self.close()
                     raise SocketClosedError()
             except socket.timeout:
@@ -114,20 +390,99 @@ class ClientBase:
                 self.close()
                 raise SocketReadError()
 
-            self.logger.info('received data')
-            msg_buf += bytearray(received)
+            self.frame_log.debug('received data - %d bytes', received)
 
             # unmarshal QMessages from received buffer
-            while True:
-                try:
-                    qmsg = make_qmessage_from_buffer(msg_buf)
-                    yield qmsg
+            yield from self._reader
+
+    def _wait_readable(self) -> bool:
+        # blocks without a timeout until the socket has data or the receive is interrupted, so an idle connection
+        # does not wake up at all. close() interrupts it by closing the write end of the wakeup pair.
+        # returns True if interrupted
+        try:
+            if hasattr(select, 'poll'):
+                poller = select.poll()
+                poller.register(self._sock, select.POLLIN)
+                poller.register(self._wakeup_r, select.POLLIN)
+                wakeup_fd = self._wakeup_r.fileno()
+                return any(fd == wakeup_fd for fd, _ in poller.poll())
+            else:
+                readable, _, _ = select.select([self._sock, self._wakeup_r], [], [])
+                return self._wakeup_r in readable
+        except ValueError:
+            # closed while starting to wait
+            return True
+
+    def interrupt_receive(self):
+        """Ends a `continuous_receive` blocked in another thread, leaving the connection open."""
+        with self._receive_lock:
+            if self.is_connected():
+                self._open_wakeup()
+                self._wakeup_w.send(b'\0')
+
+    def _open_wakeup(self):
+        # called with the receive lock held
+        if self._wakeup_r is None:
+            self._wakeup_r, self._wakeup_w = socket.socketpair()
+            self._wakeup_r.setblocking(False)
+
+    def _clear_interrupt(self):
+        try:
+            self._wakeup_r.recv(4096)
+        except BlockingIOError:
+            pass
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def buffered_messages(self) -> Iterator[QMessage]:
+        # frames already in the read buffer, e.g. received together with the response to a request
+        return iter(self._reader)
 
-                    read_bytes = QHeader.HEADER_SIZE + qmsg.length()
-                    msg_buf = msg_buf[read_bytes:]
+    def receive_ready(self) -> Iterator[QMessage]:
+        """Reads once from a socket that polled readable and returns the complete frames received so far.
 
-                except NotEnoughBufferError:
-                    break
+        For callers that multiplex many connections themselves (see `reactor.Reactor`).
+        """
+        if not self.is_connected():
+            raise SocketClosedError()
+
+        try:
+            if self._reader.recv_into(self._sock) == 0:
+                self.close()
+                raise SocketClosedError()
+        except (BlockingIOError, socket.timeout):
+            pass
+        except socket.error as msg:
+            self.logger.error(msg)
+            self.close()
+            raise SocketReadError()
+
+        return iter(self._reader)
+
+    def pipeline(self, msgs: List[QMessage], depth: int = PIPELINE_DEPTH) -> List[QMessage]:
+        """Sends requests without waiting for each response, and returns one response per request in order.
+
+        At most `depth` requests are outstanding. Once that many are, responses are read until half of them
+        are left, since a broker that answers each request before reading the next stops reading while its
+        responses are not read, and would never get to read the rest of the requests.
+
+        The responses are detached from the read buffer, since later reads would overwrite them.
+        """
+        if depth < 1:
+            raise ValueError("pipeline depth should be at least 1")
+        responses = []
+        for sent, msg in enumerate(msgs, 1):
+            self.send_buffers(msg.buffers())
+            if sent - len(responses) >= depth:
+                self.flush()
+                while sent - len(responses) > depth // 2:
+                    responses.append(self.read_message().detach())
+        self.flush()
+
+        while len(responses) < len(msgs):
+            responses.append(self.read_message().detach())
+        return responses
 
     def _init_stream(self, session_type: SessionType, topic: str):
         if not self.is_connected():
@@ -135,40 +490,38 @@ class ClientBase:
 
         msg = make_qmessage_from_proto(MessageType.STREAM, connect_msg(session_type, topic))
         self.send_message(msg)
-        received = self.read_message()
+        received = self._STREAM_MESSAGES.decode(self.read_message())
 
-        if received.unpack_to(ConnectResponse()) is not None:
+        if isinstance(received, ConnectResponse):
             self.logger.info('stream initialized')
             return
-        elif (ack := msg.unpack_to(Ack())) is not None:
-            raise RequestFailedError(msg=ack.msg)
+        elif isinstance(received, Ack):
+            raise RequestFailedError(msg=received.msg)
         else:
             raise InvalidMessageError()
 
-    def connect(self, session_type: SessionType, topic: str):
-        if len(topic) == 0:
-            raise TopicNotSetError()
-
-        self._zk_client.connect()
-        topic_brokers = self._zk_client.get_topic_brokers(topic)
-
-        if len(topic_brokers) > 0:
-            self.connect_to_broker(topic_brokers[0])
-        elif session_type == PUBLISHER:  # if publisher, pick random broker unless topic broker exists
-            brokers = self._zk_client.get_brokers()
-            print(brokers)
-            if len(brokers) == 0:
-                raise ClientConnectionError(msg="broker not exists")
-            else:
-                self.connect_to_broker(brokers[random.randrange(0,len(brokers))])
-        else:
-            raise ClientConnectionError(msg="broker not exists")
-
+    # host is looked up in zookeeper unless given
+    def connect(self, session_type: SessionType, topic: str, host: Optional[str] = None):
+        if host is None:
+            host = resolve_broker(self._zk_client, session_type, topic)
+        self.connect_to_broker(host)
         self._init_stream(session_type, topic)
 
     def close(self):
         self._zk_client.close()
         if self.connected:
-            self.connected = False
-            self._sock.close()
+            try:
+                self._writer.flush()
+            except SocketWriteError as err:
+                self.logger.error(err)
+            self._writer.close()
+            with self._receive_lock:
+                self.connected = False
+                # wakes a receive blocked in another thread; closing the socket alone would not.
+                # the read end stays open until such a receive ends, so its poll can not miss the wakeup
+                if self._wakeup_w is not None:
+                    self._wakeup_w.close()
+                self._sock.close()
+                if self._receivers == 0 and self._wakeup_r is not None:
+                    self._wakeup_r.close()
             self.logger.info('connection closed')
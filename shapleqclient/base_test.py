@@ -0,0 +1,232 @@
+import logging
+import socket
+import threading
+import time
+import unittest
+from shapleqclient.base import ClientBase, QConfig
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.api import put_msg, ack_msg
+from shapleqclient.proto.api_pb2 import Ack
+from shapleqclient.common.exception import SocketClosedError
+
+
+class ClientBaseTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+
+    def connect(self, config: QConfig):
+        self.client = ClientBase(config, self.logger)
+        self.peer, sock = socket.socketpair()
+        self.client._attach(sock)
+
+    def tearDown(self):
+        self.client.close()
+        self.peer.close()
+
+    def _read_all(self, size: int, received: bytearray):
+        while len(received) < size:
+            chunk = self.peer.recv(64 * 1024)
+            if not chunk:
+                return
+            received += chunk
+
+    def test_send_large_message_with_short_writes(self):
+        self.connect(QConfig())
+        self.client._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        msg = make_qmessage_from_proto(MessageType.STREAM, put_msg(bytes(range(256)) * 4096, 1, '0' * 32))
+        expected = msg.serialize()
+
+        received = bytearray()
+        reader = threading.Thread(target=self._read_all, args=(len(expected), received))
+        reader.start()
+        self.client.send_message(msg)
+        reader.join()
+
+        self.assertEqual(expected, bytes(received))
+
+    def test_coalesce_frames_until_flush_size(self):
+        self.connect(QConfig(flush_size=1024, flush_delay=60 * 1000))
+        self.peer.setblocking(False)
+        frame = make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * 100, 1, '0' * 32)).serialize()
+
+        frames = 0
+        while len(frame) * (frames + 1) < 1024:
+            self.client.send_buffers([frame])
+            frames += 1
+        with self.assertRaises(BlockingIOError):
+            self.peer.recv(64 * 1024)
+
+        self.client.send_buffers([frame])
+        self.assertEqual(frame * (frames + 1), self.peer.recv(64 * 1024))
+        self.assertEqual(0, self.client._writer.pending_bytes())
+
+    def test_flush_after_delay(self):
+        self.connect(QConfig(flush_size=1024 * 1024, flush_delay=50))
+        frame = make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * 100, 1, '0' * 32)).serialize()
+
+        started = time.monotonic()
+        self.client.send_buffers([frame])
+        self.client.send_buffers([frame])
+        self.assertEqual(frame * 2, self.peer.recv(64 * 1024))
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_socket_options(self):
+        self.client = ClientBase(QConfig(tcp_nodelay=True, send_buffer_size=64 * 1024), self.logger)
+        self.peer = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.client._configure_socket(self.peer)
+
+        self.assertEqual(1, self.peer.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertGreaterEqual(self.peer.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF), 64 * 1024)
+
+    def test_continuous_receive_large_and_small_frames(self):
+        self.connect(QConfig(read_buffer_min_size=1024, read_buffer_max_size=8 * 1024))
+        frames = [make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * size, 1, '0' * 32)).serialize()
+                  for size in (10, 100000, 10, 10)]
+        writer = threading.Thread(target=self.peer.sendall, args=(b''.join(frames),))
+        writer.start()
+
+        received = []
+        for msg in self.client.continuous_receive():
+            received.append(msg.serialize())
+            if len(received) == len(frames):
+                break
+        writer.join()
+
+        self.assertEqual(frames, received)
+
+    def test_read_message_keeps_leftover_frames(self):
+        self.connect(QConfig())
+        frames = [make_qmessage_from_proto(MessageType.STREAM, ack_msg(i, "test{}".format(i))) for i in range(3)]
+        self.peer.sendall(b''.join(frame.serialize() for frame in frames))
+
+        self.assertEqual("test0", self.client.read_message().unpack_to(Ack()).msg)
+        self.assertEqual("test1", self.client.read_message().unpack_to(Ack()).msg)
+        self.assertEqual("test2", next(self.client.continuous_receive()).unpack_to(Ack()).msg)
+
+    def test_pipeline(self):
+        self.connect(QConfig())
+        requests = [make_qmessage_from_proto(MessageType.TRANSACTION, ack_msg(i, "request{}".format(i)))
+                    for i in range(10)]
+
+        def respond():
+            decoder = FrameDecoder()
+            received = []
+            while len(received) < len(requests):
+                decoder.recv_into(self.peer)
+                received.extend(msg.unpack_to(Ack()).code for msg in decoder)
+            self.peer.sendall(b''.join(
+                make_qmessage_from_proto(MessageType.TRANSACTION, ack_msg(code, "response{}".format(code))).serialize()
+                for code in received))
+
+        responder = threading.Thread(target=respond)
+        responder.start()
+        responses = self.client.pipeline(requests)
+        responder.join()
+
+        self.assertEqual(["response{}".format(i) for i in range(10)], [msg.unpack_to(Ack()).msg for msg in responses])
+
+    def test_pipeline_to_peer_answering_each_request(self):
+        self.connect(QConfig(timeout=10000))
+        count = 5000
+        requests = [make_qmessage_from_proto(MessageType.TRANSACTION, ack_msg(i, "request")) for i in range(count)]
+
+        def respond():
+            # answers every request before reading the next, blocking while its responses are not read
+            decoder = FrameDecoder()
+            answered = 0
+            while answered < count:
+                decoder.recv_into(self.peer)
+                for msg in decoder:
+                    code = msg.unpack_to(Ack()).code
+                    self.peer.sendall(make_qmessage_from_proto(MessageType.TRANSACTION,
+                                                               ack_msg(code, "r" * 1000)).serialize())
+                    answered += 1
+
+        responder = threading.Thread(target=respond, daemon=True)
+        responder.start()
+        responses = self.client.pipeline(requests, depth=16)
+        responder.join(10)
+
+        self.assertEqual(list(range(count)), [msg.unpack_to(Ack()).code for msg in responses])
+
+    def _receive_in_background(self, received: list) -> threading.Thread:
+        def receive():
+            try:
+                for msg in self.client.continuous_receive():
+                    received.append(msg.detach())
+            except SocketClosedError:
+                received.append(None)
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        return receiver
+
+    def test_idle_receive_does_not_wake_up(self):
+        # with a 10ms timeout, a loop waking up on socket timeouts would read 100 times a second
+        self.connect(QConfig(timeout=10))
+        reads = []
+        recv_into = self.client._reader.recv_into
+        self.client._reader.recv_into = lambda sock: reads.append(1) or recv_into(sock)
+        received = []
+        receiver = self._receive_in_background(received)
+
+        cpu_started = time.process_time()
+        time.sleep(1)
+        cpu_used = time.process_time() - cpu_started
+
+        self.assertEqual([], reads)
+        self.assertLess(cpu_used, 0.05)
+
+        self.peer.sendall(make_qmessage_from_proto(MessageType.STREAM, ack_msg(0, "test")).serialize())
+        deadline = time.monotonic() + 5
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.client.close()
+        receiver.join()
+        self.assertEqual(1, len(reads))
+        self.assertEqual("test", received[0].unpack_to(Ack()).msg)
+
+    def test_close_interrupts_blocked_receive(self):
+        self.connect(QConfig(timeout=60 * 1000))
+        received = []
+        receiver = self._receive_in_background(received)
+        time.sleep(0.1)
+
+        started = time.monotonic()
+        self.client.close()
+        receiver.join(5)
+        latency = time.monotonic() - started
+
+        self.assertFalse(receiver.is_alive())
+        self.assertLess(latency, 0.1)
+        self.assertEqual([None], received)
+
+    def test_wakeup_pair_is_opened_by_the_first_receive(self):
+        self.connect(QConfig())
+        # connections of a reactor or a pool are read without continuous_receive
+        self.assertIsNone(self.client._wakeup_r)
+        self.client.send_buffers([make_qmessage_from_proto(MessageType.STREAM, ack_msg(0, "test")).serialize()])
+        self.client.flush()
+        self.assertIsNone(self.client._wakeup_r)
+
+        received = []
+        receiver = self._receive_in_background(received)
+        time.sleep(0.1)
+        self.client.interrupt_receive()
+        receiver.join(5)
+        self.assertFalse(receiver.is_alive())
+        self.assertIsNotNone(self.client._wakeup_r)
+
+    def test_metrics_count_frames_bytes_and_calls(self):
+        self.connect(QConfig(flush_size=1024 * 1024, flush_delay=60 * 1000))
+        frame = make_qmessage_from_proto(MessageType.STREAM, ack_msg(0, "test")).serialize()
+        for _ in range(3):
+            self.client.send_buffers([frame])
+        self.client.flush()
+        self.peer.sendall(frame * 2)
+        self.client.read_message()
+        self.client.read_message()
+
+        self.assertEqual({'frames_sent': 3, 'bytes_sent': 3 * len(frame), 'send_calls': 1,
+                          'frames_received': 2, 'bytes_received': 2 * len(frame), 'recv_calls': 1},
+                         self.client.metrics.snapshot())
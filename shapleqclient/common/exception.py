@@ -71,6 +71,38 @@ class RequestFailedError(Exception):
         return self.msg
 
 
+class BufferFullError(Exception):
+    def __init__(self, msg="buffer is full"):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class WindowFullError(Exception):
+    def __init__(self, msg="in-flight window is full"):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class RecordDroppedError(Exception):
+    def __init__(self, msg="record dropped from a full in-flight window"):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class SpillFullError(Exception):
+    def __init__(self, msg="spill log is full"):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
 class PathNotExists(Exception):
     def __init__(self, path: str):
         self.path = path
@@ -0,0 +1,137 @@
+import abc
+import bz2
+import lzma
+import zlib
+from typing import Dict, Optional, Union
+from shapleqclient.common.exception import MessageDecodeError
+
+# compressed records start with this magic and the codec id. records without it are passed through as they are,
+# so compressing producers and plain producers can share a topic. a compressing producer stores a record that
+# starts with the magic itself under STORED_CODEC_ID, so it is not taken for an envelope.
+ENVELOPE_MAGIC = b'\xffSQC'
+ENVELOPE_SIZE = len(ENVELOPE_MAGIC) + 1
+STORED_CODEC_ID = 0
+
+DEFAULT_COMPRESSION_THRESHOLD = 512
+DEFAULT_MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+
+class Codec(abc.ABC):
+    codec_id: int
+    name: str
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def decompressor(self):
+        """Returns a streaming decompressor with `decompress(data, max_length)` and `eof`."""
+
+    def decompress(self, data: bytes, max_size: int = DEFAULT_MAX_DECOMPRESSED_SIZE) -> bytes:
+        """Decompresses data, raising `MessageDecodeError` if they are cut short or expand past `max_size` bytes."""
+        decompressor = self.decompressor()
+        decompressed = decompressor.decompress(data, max_size + 1)
+        if len(decompressed) > max_size:
+            raise MessageDecodeError(msg="decompressed record exceeds {} bytes".format(max_size))
+        if not decompressor.eof:
+            raise MessageDecodeError(msg="compressed record is truncated")
+        return decompressed
+
+
+class ZlibCodec(Codec):
+    codec_id = 1
+    name = 'zlib'
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompressor(self):
+        return zlib.decompressobj()
+
+
+class Bz2Codec(Codec):
+    codec_id = 2
+    name = 'bz2'
+
+    def __init__(self, level: int = 9):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return bz2.compress(data, self.level)
+
+    def decompressor(self):
+        return bz2.BZ2Decompressor()
+
+
+class LzmaCodec(Codec):
+    codec_id = 3
+    name = 'lzma'
+
+    def __init__(self, preset: int = 6):
+        self.preset = preset
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=self.preset)
+
+    def decompressor(self):
+        return lzma.LZMADecompressor()
+
+
+_CODECS: Dict[str, type] = {codec.name: codec for codec in (ZlibCodec, Bz2Codec, LzmaCodec)}
+_CODECS_BY_ID: Dict[int, Codec] = {codec.codec_id: codec() for codec in (ZlibCodec, Bz2Codec, LzmaCodec)}
+
+
+def get_codec(name: str) -> Codec:
+    if name not in _CODECS:
+        raise ValueError("unknown compression codec `{}`".format(name))
+    return _CODECS[name]()
+
+
+class Compressor:
+    """Wraps records of at least `threshold` bytes into a compressed envelope.
+
+    Records that are smaller, or that do not get smaller by compressing,
+    are sent as they are, unless they start with `ENVELOPE_MAGIC`; those
+    are wrapped uncompressed in a stored envelope.
+    """
+    codec: Codec
+    threshold: int
+
+    def __init__(self, codec: Codec, threshold: int = DEFAULT_COMPRESSION_THRESHOLD):
+        self.codec = codec
+        self.threshold = threshold
+        self._envelope = ENVELOPE_MAGIC + bytes((codec.codec_id,))
+        self._stored = ENVELOPE_MAGIC + bytes((STORED_CODEC_ID,))
+
+    # data are bytes or a byte view (see message.encoder.payload_view), so their length is their size in bytes
+    def compress(self, data: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+        if len(data) >= self.threshold:
+            compressed = self.codec.compress(data)
+            if len(compressed) + ENVELOPE_SIZE < len(data):
+                return self._envelope + compressed
+        if data[:len(ENVELOPE_MAGIC)] == ENVELOPE_MAGIC:
+            return self._stored + data
+        return data
+
+
+def decompress_payload(data: Union[bytes, memoryview],
+                       max_size: int = DEFAULT_MAX_DECOMPRESSED_SIZE) -> Union[bytes, memoryview]:
+    """Unwraps a record of a compressing producer. Records without an envelope are returned as they are."""
+    if len(data) < ENVELOPE_SIZE or data[:len(ENVELOPE_MAGIC)] != ENVELOPE_MAGIC:
+        return data
+
+    codec_id = data[len(ENVELOPE_MAGIC)]
+    if codec_id == STORED_CODEC_ID:
+        return data[ENVELOPE_SIZE:]
+    codec: Optional[Codec] = _CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise MessageDecodeError(msg="unknown compression codec id {}".format(codec_id))
+
+    try:
+        return codec.decompress(memoryview(data)[ENVELOPE_SIZE:], max_size)
+    except (zlib.error, OSError, lzma.LZMAError, EOFError) as err:
+        raise MessageDecodeError(msg="cannot decompress record: {}".format(err))
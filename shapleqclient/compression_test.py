@@ -0,0 +1,60 @@
+import json
+import unittest
+import zlib
+from shapleqclient.common.exception import MessageDecodeError
+from shapleqclient.compression import Compressor, Codec, ENVELOPE_MAGIC, get_codec, decompress_payload
+
+
+class CompressionTest(unittest.TestCase):
+    record = json.dumps([{'id': i, 'name': 'record', 'tags': ['a', 'b']} for i in range(100)]).encode('utf-8')
+
+    def test_round_trip(self):
+        for name in ('zlib', 'bz2', 'lzma'):
+            compressor = Compressor(get_codec(name), threshold=64)
+            compressed = compressor.compress(self.record)
+
+            self.assertTrue(compressed.startswith(ENVELOPE_MAGIC), msg=name)
+            self.assertLess(len(compressed), len(self.record), msg=name)
+            self.assertEqual(self.record, decompress_payload(compressed), msg=name)
+            self.assertEqual(self.record, decompress_payload(memoryview(compressed)), msg=name)
+
+    def test_below_threshold(self):
+        compressor = Compressor(get_codec('zlib'), threshold=len(self.record) + 1)
+
+        self.assertIs(self.record, compressor.compress(self.record))
+        self.assertIs(self.record, decompress_payload(self.record))
+
+    def test_incompressible(self):
+        compressor = Compressor(get_codec('zlib'), threshold=0)
+        record = bytes(range(256))
+
+        self.assertIs(record, compressor.compress(record))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            get_codec('snappy')
+        with self.assertRaises(MessageDecodeError):
+            decompress_payload(ENVELOPE_MAGIC + b'\x7fdata')
+
+    def test_raw_record_starting_with_magic(self):
+        compressor = Compressor(get_codec('zlib'), threshold=64)
+        # looks like a zlib envelope, and is too small to be compressed
+        record = ENVELOPE_MAGIC + b'\x01' + zlib.compress(b'hidden')
+        stored = compressor.compress(record)
+
+        self.assertNotEqual(record, stored)
+        self.assertEqual(record, bytes(decompress_payload(stored)))
+        self.assertEqual(record, bytes(decompress_payload(compressor.compress(memoryview(record)))))
+
+    def test_decompressed_size_is_capped(self):
+        for name in ('zlib', 'bz2', 'lzma'):
+            compressed = Compressor(get_codec(name), threshold=0).compress(b'\0' * (1024 * 1024))
+            self.assertEqual(1024 * 1024, len(decompress_payload(compressed, max_size=1024 * 1024)), msg=name)
+            with self.assertRaises(MessageDecodeError, msg=name):
+                decompress_payload(compressed, max_size=1024 * 1024 - 1)
+            with self.assertRaises(MessageDecodeError, msg=name):
+                decompress_payload(compressed[:-8])
+
+    def test_codec_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Codec()
@@ -1,17 +1,22 @@
 import logging
 from dataclasses import dataclass
 from shapleqclient.base import ClientBase, QConfig
-from shapleqclient.common.exception import InvalidMessageError, SocketClosedError, RequestFailedError
+from shapleqclient.common.exception import InvalidMessageError, SocketClosedError, RequestFailedError, \
+    NotEnoughBufferError
 from shapleqclient.proto.data_pb2 import SessionType
 from shapleqclient.proto.api_pb2 import FetchResponse, BatchedFetchResponse, Ack
-from typing import Generator, Iterable
+from typing import Generator, Iterable, List, Optional, Union
 from shapleqclient.message.qmessage import QMessage, MessageType, make_qmessage_from_proto
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.message.batch import LazyBatchedFetchResponse
+from shapleqclient.compression import decompress_payload
 from shapleqclient.message.api import fetch_msg
+from shapleqclient.metrics import Metrics, SampledLogger
 
 
 @dataclass
 class FetchedData:
-    data: bytes
+    data: Union[bytes, memoryview]
     offset: int
     seq_num: int
     node_id: str
@@ -27,6 +32,9 @@ class Consumer:
     topic: str
     _client: ClientBase
     logger: logging.Logger
+    _MESSAGES = MessageRegistry(FetchResponse, BatchedFetchResponse, Ack)
+    _LAZY_MESSAGES = MessageRegistry(FetchResponse, Ack)
+    _LAZY_MESSAGES.register(BatchedFetchResponse, LazyBatchedFetchResponse)
 
     def __init__(self, config: QConfig, topic: str, logger: logging.Logger):
         self._client = ClientBase(config, logger)
@@ -42,7 +50,15 @@ class Consumer:
     def stop(self):
         self._client.close()
 
-    def subscribe(self, start_offset: int, max_batch_size: int = 1, flush_interval: int = 100) -> Generator[FetchResult, None, None]:
+    def metrics(self) -> Metrics:
+        return self._client.metrics
+
+    # with lazy=True, batched items are decoded while iterating `FetchResult.items` and their data are views
+    # into the received frame. they are valid only until the next result is requested.
+    # records of compressing producers are decompressed (see compression). with decompress=False, data are returned
+    # as received
+    def subscribe(self, start_offset: int, max_batch_size: int = 1, flush_interval: int = 100,
+                  lazy: bool = False, decompress: bool = True) -> Generator[FetchResult, None, None]:
         if not self._client.is_connected():
             raise SocketClosedError()
 
@@ -50,34 +66,75 @@ class Consumer:
             msg = make_qmessage_from_proto(MessageType.STREAM, fetch_msg(start_offset, max_batch_size, flush_interval))
             self._client.send_message(msg)
             for received in self._client.continuous_receive():
-                yield self._handle_message(received)
+                yield self._handle_message(received, lazy, decompress)
         except SocketClosedError:
             return
 
-    def _handle_message(self, msg: QMessage) -> FetchResult:
-
-        if (fetch_response := msg.unpack_to(FetchResponse())) is not None:
-            self.logger.debug('received response - data: {}, offset: {}, last offset: {}, seq_num: {}, node_id: {}'.format(
-                fetch_response.data, fetch_response.offset, fetch_response.last_offset, fetch_response.seq_num, fetch_response.node_id))
-
-            fetched = FetchedData(data=fetch_response.data,
-                                  offset=fetch_response.offset,
-                                  seq_num=fetch_response.seq_num,
-                                  node_id=fetch_response.node_id)
-            return FetchResult(items=[fetched], last_offset=fetch_response.last_offset)
-
-        elif (batched_fetch_response := msg.unpack_to(BatchedFetchResponse())) is not None:
-            self.logger.debug('received response - items: {}, last offset: {}'.format(
-                batched_fetch_response.items, batched_fetch_response.last_offset))
-            items = []
-            for item in batched_fetch_response.items:
-                items.append(FetchedData(data=item.data,
-                                         offset=item.offset,
-                                         seq_num=item.seq_num,
-                                         node_id=item.node_id))
-            return FetchResult(items=items, last_offset=batched_fetch_response.last_offset)
-
-        elif (ack := msg.unpack_to(Ack())) is not None:
-            raise RequestFailedError(msg=ack.msg)
-        else:
-            raise InvalidMessageError()
+    def _handle_message(self, msg: QMessage, lazy: bool = False, decompress: bool = True) -> FetchResult:
+        return make_fetch_result((self._LAZY_MESSAGES if lazy else self._MESSAGES).decode(msg),
+                                 self._client.frame_log,
+                                 self._client.config.get_max_decompressed_size() if decompress else None)
+
+
+def read_into(items: Iterable[FetchedData], out, start: int = 0) -> List[int]:
+    """Copies the data of fetched records back to back into `out`, from byte `start`, and returns their sizes.
+
+    `out` is any writable C-contiguous buffer, e.g. a preallocated bytearray,
+    array.array or numpy array, so records of fixed-size vectors land in
+    their rows without a bytes object per record. With `subscribe(lazy=True)`
+    the data of batched records are views into the received frame, and this
+    is the only copy made. Raises `NotEnoughBufferError` before copying a
+    record that does not fit; the records copied until then stay in `out`.
+    """
+    target = memoryview(out).cast('B')
+    sizes = []
+    pos = start
+    for item in items:
+        data = item.data
+        size = len(data)
+        if pos + size > target.nbytes:
+            raise NotEnoughBufferError()
+        target[pos:pos + size] = data
+        pos += size
+        sizes.append(size)
+    return sizes
+
+
+# received is a message decoded by the registry of a subscriber session.
+# record data are not logged; at high rates formatting them would cost more than receiving them.
+# records are decompressed into at most decompress_limit bytes each when it is given
+def make_fetch_result(received, frame_log: SampledLogger, decompress_limit: Optional[int] = None) -> FetchResult:
+    def unwrap(data: Union[bytes, memoryview]) -> Union[bytes, memoryview]:
+        return data if decompress_limit is None else decompress_payload(data, decompress_limit)
+
+    if isinstance(received, FetchResponse):
+        frame_log.debug('received response - data: %d bytes, offset: %d, last offset: %d, seq_num: %d, node_id: %s',
+                        len(received.data), received.offset, received.last_offset, received.seq_num,
+                        received.node_id)
+
+        fetched = FetchedData(data=unwrap(received.data),
+                              offset=received.offset,
+                              seq_num=received.seq_num,
+                              node_id=received.node_id)
+        return FetchResult(items=[fetched], last_offset=received.last_offset)
+
+    elif isinstance(received, BatchedFetchResponse):
+        frame_log.debug('received response - items: %d, last offset: %d', len(received.items), received.last_offset)
+        items = []
+        for item in received.items:
+            items.append(FetchedData(data=unwrap(item.data),
+                                     offset=item.offset,
+                                     seq_num=item.seq_num,
+                                     node_id=item.node_id))
+        return FetchResult(items=items, last_offset=received.last_offset)
+
+    elif isinstance(received, LazyBatchedFetchResponse):
+        frame_log.debug('received response - lazy items, last offset: %d', received.last_offset)
+        items = (FetchedData(data=unwrap(data), offset=offset, seq_num=seq_num, node_id=node_id)
+                 for data, offset, seq_num, node_id in received.items())
+        return FetchResult(items=items, last_offset=received.last_offset)
+
+    elif isinstance(received, Ack):
+        raise RequestFailedError(msg=received.msg)
+    else:
+        raise InvalidMessageError()
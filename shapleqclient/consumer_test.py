@@ -0,0 +1,90 @@
+import array
+import logging
+import unittest
+from typing import List
+from shapleqclient.base import QConfig
+from shapleqclient.common.exception import NotEnoughBufferError, MessageDecodeError
+from shapleqclient.compression import ENVELOPE_MAGIC
+from shapleqclient.consumer import Consumer, FetchedData, read_into
+from shapleqclient.producer import Producer
+from shapleqclient.testing import FakeBroker, FakeZKClient
+
+
+class ConsumerTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+    topic = "test_topic"
+    node_id = "0" * 32
+
+    def setUp(self):
+        self.broker = FakeBroker()
+
+    def tearDown(self):
+        self.broker.close()
+
+    def config(self, **kwargs) -> QConfig:
+        return QConfig(zk_client_factory=FakeZKClient.factory([self.broker.address]), **kwargs)
+
+    def test_vectors_round_trip_into_preallocated_array(self):
+        dim, count = 16, 50
+        vectors = array.array('f', (float(i) for i in range(dim * count)))
+        rows = memoryview(vectors).cast('B')
+        row_size = dim * vectors.itemsize
+
+        producer = Producer(self.config(), self.topic, self.logger, node_id=self.node_id)
+        producer.setup()
+        # each record is a view of one row; nothing is copied to publish it
+        deliveries = producer.publish_many(rows[i * row_size:(i + 1) * row_size] for i in range(count))
+        producer.flush()
+        for delivery in deliveries:
+            delivery.result(timeout=5)
+        producer.stop()
+
+        consumer = Consumer(self.config(), self.topic, self.logger)
+        consumer.setup()
+        received = array.array('f', bytes(len(vectors) * vectors.itemsize))
+        pos = 0
+        for result in consumer.subscribe(0, max_batch_size=8, lazy=True):
+            pos += sum(read_into(result.items, received, pos))
+            if pos == len(rows):
+                break
+        consumer.stop()
+
+        self.assertEqual(vectors, received)
+
+    def fetch(self, config: QConfig, count: int, decompress: bool = True) -> List[bytes]:
+        config.zk_client_factory = FakeZKClient.factory([self.broker.address])
+        consumer = Consumer(config, self.topic, self.logger)
+        consumer.setup()
+        fetched = []
+        try:
+            for result in consumer.subscribe(0, max_batch_size=8, decompress=decompress):
+                fetched += [bytes(item.data) for item in result.items]
+                if len(fetched) == count:
+                    break
+        finally:
+            consumer.stop()
+        return fetched
+
+    def test_decompression_is_on_by_default(self):
+        record = b'compressible ' * 100
+        producer = Producer(self.config(compression='zlib', compression_threshold=64), self.topic, self.logger)
+        producer.setup()
+        producer.publish(record, 1, self.node_id).result(timeout=5)
+        producer.stop()
+
+        raw, = self.fetch(QConfig(), 1, decompress=False)
+        self.assertTrue(raw.startswith(ENVELOPE_MAGIC))
+        self.assertEqual([record], self.fetch(QConfig(), 1))
+        with self.assertRaises(MessageDecodeError):
+            self.fetch(QConfig(max_decompressed_size=len(record) - 1), 1)
+
+    def test_read_into_stops_at_end_of_buffer(self):
+        items = [FetchedData(data=b'abcd', offset=i, seq_num=i, node_id=self.node_id) for i in range(3)]
+        out = bytearray(10)
+        with self.assertRaises(NotEnoughBufferError):
+            read_into(items, out, 1)
+        self.assertEqual(bytearray(b'\0abcdabcd\0'), out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Union
+from shapleqclient.proto.data_pb2 import Partition
+
+
+class Delivery:
+    """Outcome of one published record, resolved when the broker responds to it.
+
+    A delivery resolves with the partition the record was written to, or
+    fails with `RequestFailedError` when the broker rejects the record, with
+    `SocketClosedError` when the connection closes first and is not
+    reconnected, and with `RecordDroppedError` when a full in-flight window
+    drops the record.
+    Responses resolve deliveries in the order their records were published.
+
+    `published_at` and `acked_at` are `time.monotonic()` timestamps, taken
+    when the record was published and when its response arrived.
+
+    All deliveries of a producer wait on one condition of the producer, so a
+    delivery holds no lock or event of its own.
+    """
+    __slots__ = ('seq_num', 'size', 'published_at', 'acked_at', '_partition', '_error', '_done', '_callbacks',
+                 '_cond', '_dispatcher', '_frame')
+
+    seq_num: int
+    # bytes of the encoded record
+    size: int
+    published_at: float
+    acked_at: float
+    _partition: Optional[Partition]
+    _error: Optional[Exception]
+    _done: bool
+    _callbacks: Optional[List[Callable[['Delivery'], None]]]
+    _cond: threading.Condition
+    _dispatcher: 'CallbackDispatcher'
+    # the encoded record, kept by a reconnecting producer to send it again on a new connection
+    _frame: Optional[List[Union[bytes, memoryview]]]
+
+    def __init__(self, seq_num: int, size: int, cond: threading.Condition, dispatcher: 'CallbackDispatcher'):
+        self.seq_num = seq_num
+        self.size = size
+        self.published_at = time.monotonic()
+        self.acked_at = 0.0
+        self._partition = None
+        self._error = None
+        self._done = False
+        self._callbacks = None
+        self._cond = cond
+        self._dispatcher = dispatcher
+        self._frame = None
+
+    def done(self) -> bool:
+        return self._done
+
+    def result(self, timeout: Optional[float] = None) -> Partition:
+        """Waits for the response and returns the partition, or raises why the record was not written."""
+        self._wait(timeout)
+        if self._error is not None:
+            raise self._error
+        return self._partition
+
+    def exception(self, timeout: Optional[float] = None) -> Optional[Exception]:
+        self._wait(timeout)
+        return self._error
+
+    def latency(self) -> float:
+        """Seconds from publishing the record to its response."""
+        if not self._done:
+            raise ValueError("delivery is not resolved yet")
+        return self.acked_at - self.published_at
+
+    def add_done_callback(self, callback: Callable[['Delivery'], None]):
+        """Calls `callback` with this delivery once it resolves, on the producer's callback thread.
+
+        Callbacks of deliveries resolved together are run together, in
+        publish order. A callback added to a resolved delivery is called
+        right away in the calling thread.
+        """
+        with self._cond:
+            if not self._done:
+                if self._callbacks is None:
+                    self._callbacks = []
+                self._callbacks.append(callback)
+                return
+        self._dispatcher.run(self, callback)
+
+    def _wait(self, timeout: Optional[float]):
+        if self._done:
+            return
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._done, timeout):
+                raise TimeoutError("record is not acknowledged yet")
+
+    # called with the producer's condition held. returns whether callbacks should be scheduled
+    def _resolve(self, partition: Optional[Partition], error: Optional[Exception], acked_at: float) -> bool:
+        self._partition = partition
+        self._error = error
+        self.acked_at = acked_at
+        self._done = True
+        self._frame = None
+        return self._callbacks is not None
+
+
+class CallbackDispatcher:
+    """Runs the callbacks of resolved deliveries on a thread of its own.
+
+    The receiving thread only queues resolved deliveries, so slow callbacks
+    do not hold back responses. The callback thread is woken when the queue
+    becomes non-empty and then runs every queued callback, so a burst of
+    responses costs one wakeup rather than one per record. The thread is
+    started with the first callback.
+    """
+    logger: logging.Logger
+    _pending: List[Delivery]
+    _cond: threading.Condition
+    _thread: Optional[threading.Thread]
+    _running_batch: bool
+    _closed: bool
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running_batch = False
+        self._closed = False
+
+    def schedule(self, deliveries: List[Delivery]):
+        with self._cond:
+            if self._closed:
+                # nobody will run them later
+                closed = True
+            else:
+                closed = False
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='shapleq-callbacks', daemon=True)
+                    self._thread.start()
+                was_empty = not self._pending
+                self._pending.extend(deliveries)
+                if was_empty:
+                    self._cond.notify_all()
+        if closed:
+            self._run_batch(deliveries)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every scheduled callback has run."""
+        if threading.current_thread() is self._thread:
+            return not self._pending
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._running_batch, timeout)
+
+    def close(self):
+        """Runs the callbacks scheduled so far and stops the thread. Later callbacks run in the scheduling thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def run(self, delivery: Delivery, callback: Callable[[Delivery], None]):
+        try:
+            callback(delivery)
+        except Exception as err:
+            # a failing callback must not stop the callbacks of other records
+            self.logger.error('delivery callback failed: {}'.format(err))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                self._running_batch = True
+            try:
+                self._run_batch(batch)
+            finally:
+                with self._cond:
+                    self._running_batch = False
+                    self._cond.notify_all()
+
+    def _run_batch(self, batch: List[Delivery]):
+        for delivery in batch:
+            callbacks, delivery._callbacks = delivery._callbacks, None
+            for callback in callbacks or ():
+                self.run(delivery, callback)
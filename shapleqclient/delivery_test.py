@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+import unittest
+from shapleqclient.delivery import CallbackDispatcher, Delivery
+from shapleqclient.proto.data_pb2 import Partition
+
+
+class DeliveryTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+
+    def setUp(self):
+        self.cond = threading.Condition()
+        self.dispatcher = CallbackDispatcher(self.logger)
+
+    def tearDown(self):
+        self.dispatcher.close()
+
+    def resolve(self, deliveries, partition=None, error=None):
+        with self.cond:
+            scheduled = [delivery for delivery in deliveries if delivery._resolve(partition, error, time.monotonic())]
+            self.cond.notify_all()
+        self.dispatcher.schedule(scheduled)
+
+    def test_result_waits_for_resolve(self):
+        delivery = Delivery(1, 0, self.cond, self.dispatcher)
+        with self.assertRaises(TimeoutError):
+            delivery.result(timeout=0.01)
+
+        timer = threading.Timer(0.05, lambda: self.resolve([delivery], Partition(partition_id=1, offset=7)))
+        timer.start()
+        self.assertEqual(7, delivery.result(timeout=5).offset)
+        timer.join()
+        self.assertTrue(delivery.done())
+        self.assertIsNone(delivery.exception())
+
+    def test_failed_delivery_raises(self):
+        delivery = Delivery(1, 0, self.cond, self.dispatcher)
+        self.resolve([delivery], error=ValueError("rejected"))
+
+        self.assertIsInstance(delivery.exception(), ValueError)
+        with self.assertRaises(ValueError):
+            delivery.result()
+
+    def test_callbacks_run_in_order_in_one_batch(self):
+        called = []
+        batches = []
+        done = threading.Event()
+
+        def callback(delivery: Delivery):
+            called.append(delivery.seq_num)
+            batches.append(threading.current_thread().name)
+            if len(called) == 3:
+                done.set()
+
+        deliveries = [Delivery(seq, 0, self.cond, self.dispatcher) for seq in range(3)]
+        for delivery in deliveries:
+            delivery.add_done_callback(callback)
+        self.resolve(deliveries, Partition())
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual([0, 1, 2], called)
+        self.assertEqual({'shapleq-callbacks'}, set(batches))
+
+    def test_failing_callback_does_not_stop_others(self):
+        called = []
+        deliveries = [Delivery(seq, 0, self.cond, self.dispatcher) for seq in range(2)]
+        deliveries[0].add_done_callback(lambda delivery: 1 / 0)
+        deliveries[1].add_done_callback(lambda delivery: called.append(delivery.seq_num))
+        self.resolve(deliveries, Partition())
+
+        self.assertTrue(self.dispatcher.wait_idle(5))
+        self.assertEqual([1], called)
+
+    def test_callback_on_resolved_delivery_runs_right_away(self):
+        delivery = Delivery(1, 0, self.cond, self.dispatcher)
+        self.resolve([delivery], Partition())
+        called = []
+        delivery.add_done_callback(lambda d: called.append(threading.current_thread()))
+
+        self.assertEqual([threading.current_thread()], called)
+        self.assertGreaterEqual(delivery.latency(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+from typing import Union
 from shapleqclient.proto import data_pb2, api_pb2
 
 MAGIC_NUM: int = 1101
@@ -58,10 +59,11 @@ def connect_msg(session_type: data_pb2.SessionType, topic_name: str) -> api_pb2.
     return msg
 
 
-def put_msg(data: bytes, seq_num: int, node_id: str) -> api_pb2.PutRequest:
+def put_msg(data: Union[bytes, bytearray, memoryview], seq_num: int, node_id: str) -> api_pb2.PutRequest:
     msg = api_pb2.PutRequest()
     msg.magic = MAGIC_NUM
-    msg.data = data
+    # protobuf only takes bytes, so other buffers are copied. producers encode with message.encoder, which does not
+    msg.data = data if isinstance(data, bytes) else bytes(data)
     msg.seq_num = seq_num
     msg.node_id = node_id
 
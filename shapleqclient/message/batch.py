@@ -0,0 +1,95 @@
+from typing import Iterator, Tuple
+from shapleqclient.message.wire import WIRE_VARINT, WIRE_LENGTH_DELIMITED, read_varint, skip_field
+from shapleqclient.common.exception import MessageDecodeError
+from shapleqclient.proto.api_pb2 import BatchedFetchResponse
+
+_FIELDS = BatchedFetchResponse.DESCRIPTOR.fields_by_name
+_ITEM_FIELDS = BatchedFetchResponse.Fetched.DESCRIPTOR.fields_by_name
+
+_MAGIC = _FIELDS['magic'].number
+_ITEMS = _FIELDS['items'].number
+_LAST_OFFSET = _FIELDS['last_offset'].number
+
+_ITEM_DATA = _ITEM_FIELDS['data'].number
+_ITEM_OFFSET = _ITEM_FIELDS['offset'].number
+_ITEM_SEQ_NUM = _ITEM_FIELDS['seq_num'].number
+_ITEM_NODE_ID = _ITEM_FIELDS['node_id'].number
+
+
+class LazyBatchedFetchResponse:
+    """A serialized BatchedFetchResponse whose items are decoded one at a time.
+
+    Only the top level fields are read up front. `items` walks the wire format
+    of the repeated field and yields each record as a
+    `(data, offset, seq_num, node_id)` tuple, with `data` as a view into the
+    frame, so records are neither parsed into protobuf messages nor copied.
+    Like the frame itself, the views are only valid until the next read on
+    the connection.
+    """
+    magic: int
+    last_offset: int
+    _value: memoryview
+
+    def __init__(self, value: memoryview):
+        self._value = value
+        self.magic = 0
+        self.last_offset = 0
+
+        pos = 0
+        end = len(value)
+        while pos < end:
+            tag, pos = read_varint(value, pos)
+            field_number, wire_type = tag >> 3, tag & 0x07
+            if wire_type == WIRE_VARINT and field_number == _MAGIC:
+                self.magic, pos = read_varint(value, pos)
+            elif wire_type == WIRE_VARINT and field_number == _LAST_OFFSET:
+                self.last_offset, pos = read_varint(value, pos)
+            else:
+                pos = skip_field(value, pos, wire_type)
+
+    def items(self) -> Iterator[Tuple[memoryview, int, int, str]]:
+        value = self._value
+        pos = 0
+        end = len(value)
+        while pos < end:
+            tag, pos = read_varint(value, pos)
+            field_number, wire_type = tag >> 3, tag & 0x07
+            if wire_type == WIRE_LENGTH_DELIMITED and field_number == _ITEMS:
+                length, pos = read_varint(value, pos)
+                if pos + length > end:
+                    raise MessageDecodeError(msg="truncated field")
+                yield self._decode_item(value[pos:pos + length])
+                pos += length
+            else:
+                pos = skip_field(value, pos, wire_type)
+
+    @staticmethod
+    def _decode_item(value: memoryview) -> Tuple[memoryview, int, int, str]:
+        data = value[0:0]
+        offset = seq_num = 0
+        node_id = ""
+        pos = 0
+        end = len(value)
+        while pos < end:
+            tag, pos = read_varint(value, pos)
+            field_number, wire_type = tag >> 3, tag & 0x07
+            if wire_type == WIRE_VARINT and field_number == _ITEM_OFFSET:
+                offset, pos = read_varint(value, pos)
+            elif wire_type == WIRE_VARINT and field_number == _ITEM_SEQ_NUM:
+                seq_num, pos = read_varint(value, pos)
+            elif wire_type == WIRE_LENGTH_DELIMITED and field_number in (_ITEM_DATA, _ITEM_NODE_ID):
+                length, pos = read_varint(value, pos)
+                if pos + length > end:
+                    raise MessageDecodeError(msg="truncated field")
+                if field_number == _ITEM_DATA:
+                    data = value[pos:pos + length]
+                else:
+                    try:
+                        node_id = str(value[pos:pos + length], 'utf-8')
+                    except UnicodeDecodeError:
+                        raise MessageDecodeError(msg="node id is not utf-8")
+                pos += length
+            else:
+                pos = skip_field(value, pos, wire_type)
+
+        return data, offset, seq_num, node_id
@@ -0,0 +1,47 @@
+import unittest
+from shapleqclient.common.exception import MessageDecodeError
+from shapleqclient.message.batch import LazyBatchedFetchResponse
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto, make_qmessage_from_buffer
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.proto.api_pb2 import BatchedFetchResponse
+
+
+class LazyBatchedFetchResponseTest(unittest.TestCase):
+
+    def test_items(self):
+        expected = BatchedFetchResponse(magic=1101, last_offset=12)
+        for i in range(10):
+            expected.items.add(data=b'data' * i, offset=i, seq_num=i * 2, node_id='node{}'.format(i))
+
+        registry = MessageRegistry()
+        registry.register(BatchedFetchResponse, LazyBatchedFetchResponse)
+        buf = bytearray(make_qmessage_from_proto(MessageType.STREAM, expected).serialize())
+        actual = registry.decode(make_qmessage_from_buffer(buf))
+
+        self.assertIsInstance(actual, LazyBatchedFetchResponse)
+        self.assertEqual(expected.magic, actual.magic)
+        self.assertEqual(expected.last_offset, actual.last_offset)
+
+        items = list(actual.items())
+        self.assertEqual(len(expected.items), len(items))
+        for item, (data, offset, seq_num, node_id) in zip(expected.items, items):
+            self.assertIsInstance(data, memoryview)
+            self.assertEqual(item.data, data)
+            self.assertEqual(item.offset, offset)
+            self.assertEqual(item.seq_num, seq_num)
+            self.assertEqual(item.node_id, node_id)
+
+    def test_malformed_node_id(self):
+        response = BatchedFetchResponse(magic=1101)
+        response.items.add(data=b'data', offset=1, seq_num=1, node_id='node')
+        buf = response.SerializeToString().replace(b'node', b'\xffode')
+        actual = LazyBatchedFetchResponse(memoryview(buf))
+
+        with self.assertRaises(MessageDecodeError):
+            list(actual.items())
+
+    def test_empty_batch(self):
+        actual = LazyBatchedFetchResponse(memoryview(BatchedFetchResponse(magic=1101).SerializeToString()))
+
+        self.assertEqual(0, actual.last_offset)
+        self.assertEqual([], list(actual.items()))
@@ -0,0 +1,95 @@
+import abc
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from shapleqclient.message.qmessage import QMessage
+
+
+class ChecksumPolicy(abc.ABC):
+    """Decides when the checksum of a received frame is verified.
+
+    `apply` is called once for every frame decoded from a receive buffer.
+    A frame that is not verified by then is verified the first time its
+    payload is read, and raises `InvalidChecksumError` at that point.
+
+    One policy is shared by every decoder made from a config, so `apply`
+    may be called from several receive threads at once.
+    """
+
+    @abc.abstractmethod
+    def apply(self, msg: 'QMessage'):
+        """Verifies the frame of `msg` now, later, or not at all."""
+
+
+class InlineChecksum(ChecksumPolicy):
+    """Verify every frame on the receive thread before it is handed out."""
+
+    def apply(self, msg: 'QMessage'):
+        msg.verify()
+
+
+class DeferredChecksum(ChecksumPolicy):
+    """Verify a frame only when its payload is read.
+
+    Frames that are dropped unread are never checksummed.
+    """
+
+    def apply(self, msg: 'QMessage'):
+        pass
+
+
+class SampledChecksum(ChecksumPolicy):
+    """Verify an evenly spread `rate` fraction of frames and trust the rest."""
+    rate: float
+    _credit: float
+    _lock: threading.Lock
+
+    def __init__(self, rate: float):
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError("sample rate should be between 0 and 1")
+        self.rate = rate
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    def apply(self, msg: 'QMessage'):
+        with self._lock:
+            self._credit += self.rate
+            sampled = self._credit >= 1.0
+            if sampled:
+                self._credit -= 1.0
+        if sampled:
+            msg.verify()
+        else:
+            msg.skip_verify()
+
+
+class WorkerChecksum(ChecksumPolicy):
+    """Compute checksums of large frames on worker threads.
+
+    zlib releases the GIL while hashing large buffers, so the receive thread
+    keeps decoding while the checksum runs. Reading the payload waits for the
+    result. Frames smaller than `min_size` are not worth the hand-off and are
+    verified inline.
+    """
+    DEFAULT_MIN_SIZE = 64 * 1024
+
+    min_size: int
+    _executor: ThreadPoolExecutor
+
+    def __init__(self, max_workers: int = 1, min_size: int = DEFAULT_MIN_SIZE):
+        self.min_size = min_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shapleq-checksum')
+
+    def apply(self, msg: 'QMessage'):
+        if msg.length() < self.min_size:
+            msg.verify()
+        else:
+            msg.verify_on(self._executor)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+INLINE_CHECKSUM = InlineChecksum()
@@ -0,0 +1,81 @@
+import threading
+import unittest
+from shapleqclient.common.exception import InvalidChecksumError
+from shapleqclient.message.checksum import ChecksumPolicy, InlineChecksum, DeferredChecksum, SampledChecksum, WorkerChecksum
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_buffer, make_qmessage_from_proto
+from shapleqclient.message.api import put_msg
+
+
+class ChecksumPolicyTest(unittest.TestCase):
+
+    @staticmethod
+    def make_frame(size: int, corrupt: bool = False) -> bytearray:
+        frame = bytearray(make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * size, 1, '0' * 32)).serialize())
+        if corrupt:
+            frame[-1] ^= 0xff
+        return frame
+
+    def test_inline(self):
+        make_qmessage_from_buffer(self.make_frame(16), checksum_policy=InlineChecksum())
+
+        with self.assertRaises(InvalidChecksumError):
+            make_qmessage_from_buffer(self.make_frame(16, corrupt=True), checksum_policy=InlineChecksum())
+
+    def test_deferred(self):
+        msg = make_qmessage_from_buffer(self.make_frame(16, corrupt=True), checksum_policy=DeferredChecksum())
+        self.assertFalse(msg.is_verified())
+
+        with self.assertRaises(InvalidChecksumError):
+            msg.payload()
+
+    def test_sampled(self):
+        policy = SampledChecksum(0.25)
+        verified = 0
+        for _ in range(100):
+            try:
+                make_qmessage_from_buffer(self.make_frame(16, corrupt=True), checksum_policy=policy)
+            except InvalidChecksumError:
+                verified += 1
+
+        self.assertEqual(25, verified)
+
+    def test_sampled_is_shared_by_threads(self):
+        policy = SampledChecksum(0.25)
+        verified = []
+
+        def decode():
+            count = 0
+            for _ in range(2000):
+                try:
+                    make_qmessage_from_buffer(self.make_frame(16, corrupt=True), checksum_policy=policy)
+                except InvalidChecksumError:
+                    count += 1
+            verified.append(count)
+
+        threads = [threading.Thread(target=decode) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2000, sum(verified))
+
+    def test_policy_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ChecksumPolicy()
+
+    def test_worker(self):
+        policy = WorkerChecksum(min_size=1024)
+        try:
+            msg = make_qmessage_from_buffer(self.make_frame(4096), checksum_policy=policy)
+            self.assertFalse(msg.is_verified())
+            self.assertTrue(msg.detach().is_verified())
+
+            msg = make_qmessage_from_buffer(self.make_frame(4096, corrupt=True), checksum_policy=policy)
+            self.assertFalse(msg.is_verified())
+            with self.assertRaises(InvalidChecksumError):
+                msg.payload()
+
+            with self.assertRaises(InvalidChecksumError):
+                make_qmessage_from_buffer(self.make_frame(16, corrupt=True), checksum_policy=policy)
+        finally:
+            policy.shutdown()
@@ -0,0 +1,138 @@
+import threading
+from collections import OrderedDict
+from typing import List, Tuple, Union
+import zlib
+from shapleqclient.common.exception import InvalidNodeIdError
+from shapleqclient.message.api import MAGIC_NUM
+from shapleqclient.message.qmessage import QHeader, MessageType
+from shapleqclient.message.wire import WIRE_VARINT, WIRE_LENGTH_DELIMITED, ANY_TYPE_URL_FIELD, ANY_VALUE_FIELD, \
+    make_tag, encode_varint
+from shapleqclient.proto.api_pb2 import PutRequest
+
+NODE_ID_LENGTH = 32
+
+# record data may be any object supporting the buffer protocol, e.g. bytearray, memoryview, mmap, array.array or a
+# numpy array, and are sent without copying
+Payload = Union[bytes, bytearray, memoryview]
+
+_ANY_TYPE_URL = 'type.googleapis.com/' + PutRequest.DESCRIPTOR.full_name
+_FIELDS = PutRequest.DESCRIPTOR.fields_by_name
+
+
+def payload_view(data: Payload) -> Union[bytes, memoryview]:
+    """Returns record data as bytes or as a flat byte view of its buffer, without copying.
+
+    The buffer should be C-contiguous; a strided view, such as a column of a
+    numpy array, can not be sent without copying it first.
+    """
+    if isinstance(data, bytes):
+        return data
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    if not view.c_contiguous:
+        raise TypeError("record data should be a C-contiguous buffer")
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+
+class PutRequestEncoder:
+    """Encodes PutRequest frames of one node id without building protobuf messages.
+
+    The `Any` type url, the magic number and the node id field never change
+    for a producer, so they are encoded once here; `encode` only adds the
+    varints of the sequence number and data length around the payload.
+    The frames are byte-identical to
+    `make_qmessage_from_proto(MessageType.STREAM, put_msg(data, seq_num, node_id))`.
+    """
+    node_id: str
+    _any_prefix: bytes
+    _magic: bytes
+    _data_tag: bytes
+    _seq_num_tag: bytes
+    _node_id_field: bytes
+
+    def __init__(self, node_id: str):
+        if len(node_id) != NODE_ID_LENGTH:
+            raise InvalidNodeIdError()
+        self.node_id = node_id
+
+        type_url = _ANY_TYPE_URL.encode('utf-8')
+        self._any_prefix = make_tag(ANY_TYPE_URL_FIELD, WIRE_LENGTH_DELIMITED) + encode_varint(len(type_url)) + \
+            type_url + make_tag(ANY_VALUE_FIELD, WIRE_LENGTH_DELIMITED)
+        self._magic = make_tag(_FIELDS['magic'].number, WIRE_VARINT) + encode_varint(MAGIC_NUM)
+        self._data_tag = make_tag(_FIELDS['data'].number, WIRE_LENGTH_DELIMITED)
+        self._seq_num_tag = make_tag(_FIELDS['seq_num'].number, WIRE_VARINT)
+
+        encoded_node_id = node_id.encode('utf-8')
+        self._node_id_field = make_tag(_FIELDS['node_id'].number, WIRE_LENGTH_DELIMITED) + \
+            encode_varint(len(encoded_node_id)) + encoded_node_id
+
+    def encode(self, data: Payload, seq_num: int) -> List[Union[bytes, memoryview]]:
+        """Returns the frame as buffers for `ClientBase.send_buffers`; the payload is not copied."""
+        data = payload_view(data)
+        header, head, tail = self._wrap(data, seq_num)
+        return [header, head, data, tail]
+
+    def encode_into(self, out: bytearray, data: Payload, seq_num: int) -> int:
+        """Appends the frame to `out` and returns its length, so frames of many records share one buffer."""
+        data = payload_view(data)
+        header, head, tail = self._wrap(data, seq_num)
+        start = len(out)
+        out += header
+        out += head
+        out += data
+        out += tail
+        return len(out) - start
+
+    def _wrap(self, data: Union[bytes, memoryview], seq_num: int) -> Tuple[bytes, bytes, bytes]:
+        # the frame header and the encoded fields before and after the payload
+        data_len = len(data)
+
+        # proto3 leaves out fields holding default values
+        fields = self._magic
+        if data_len > 0:
+            fields += self._data_tag + encode_varint(data_len)
+        tail = self._seq_num_tag + encode_varint(seq_num) if seq_num > 0 else b''
+        tail += self._node_id_field
+
+        inner_len = len(fields) + data_len + len(tail)
+        head = self._any_prefix + encode_varint(inner_len) + fields
+        frame_len = len(head) + data_len + len(tail)
+        checksum = zlib.crc32(tail, zlib.crc32(data, zlib.crc32(head)))
+
+        return QHeader.HEADER_STRUCT.pack(frame_len, checksum, MessageType.STREAM.value), head, tail
+
+
+class EncoderCache:
+    """Encoders of the node ids most recently published with, keeping at most `size` of them.
+
+    Node ids are validated once, when their encoder is created. A producer
+    usually publishes with one node id or a few; callers passing many
+    different ones evict the least recently used encoders instead of
+    growing the cache.
+    """
+    DEFAULT_SIZE = 16
+
+    size: int
+    _encoders: 'OrderedDict[str, PutRequestEncoder]'
+    _lock: threading.Lock
+
+    def __init__(self, size: int = DEFAULT_SIZE):
+        if size < 1:
+            raise ValueError("cache size should be at least 1")
+        self.size = size
+        self._encoders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, node_id: str) -> PutRequestEncoder:
+        with self._lock:
+            if (encoder := self._encoders.get(node_id)) is not None:
+                self._encoders.move_to_end(node_id)
+                return encoder
+            encoder = self._encoders[node_id] = PutRequestEncoder(node_id)
+            if len(self._encoders) > self.size:
+                self._encoders.popitem(last=False)
+            return encoder
+
+    def __len__(self) -> int:
+        return len(self._encoders)
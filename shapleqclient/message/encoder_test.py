@@ -0,0 +1,68 @@
+import array
+import mmap
+import unittest
+from shapleqclient.common.exception import InvalidNodeIdError
+from shapleqclient.message.encoder import EncoderCache, PutRequestEncoder
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.message.api import put_msg
+
+
+class PutRequestEncoderTest(unittest.TestCase):
+    node_id = '0123456789abcdef0123456789abcdef'
+
+    def test_identical_to_protobuf(self):
+        encoder = PutRequestEncoder(self.node_id)
+        cases = [(b'', 0), (b'data', 0), (b'', 1), (b'data', 127), (b'data', 128),
+                 (b'x' * 300, 2 ** 32), (b'y' * 70000, 2 ** 64 - 1)]
+
+        for data, seq_num in cases:
+            expected = make_qmessage_from_proto(MessageType.STREAM, put_msg(data, seq_num, self.node_id)).serialize()
+            actual = b''.join(encoder.encode(data, seq_num))
+            self.assertEqual(expected, actual, msg='data length {}, seq_num {}'.format(len(data), seq_num))
+
+    def test_encode_into_appends_frames(self):
+        encoder = PutRequestEncoder(self.node_id)
+        cases = [(b'data', 1), (b'', 0), (b'x' * 300, 2)]
+        out = bytearray(b'prefix')
+        sizes = [encoder.encode_into(out, data, seq_num) for data, seq_num in cases]
+
+        expected = b''.join(b''.join(encoder.encode(data, seq_num)) for data, seq_num in cases)
+        self.assertEqual(b'prefix' + expected, bytes(out))
+        self.assertEqual(len(expected), sum(sizes))
+
+    def test_buffer_payloads(self):
+        encoder = PutRequestEncoder(self.node_id)
+        data = bytes(range(256)) * 4
+        mapped = mmap.mmap(-1, len(data))
+        mapped.write(data)
+        payloads = [bytearray(data), memoryview(data), memoryview(b'xx' + data)[2:], mapped,
+                    array.array('d', memoryview(data).cast('d'))]
+
+        expected = b''.join(encoder.encode(data, 7))
+        for payload in payloads:
+            self.assertEqual(expected, b''.join(encoder.encode(payload, 7)), msg=type(payload).__name__)
+            out = bytearray()
+            encoder.encode_into(out, payload, 7)
+            self.assertEqual(expected, bytes(out), msg=type(payload).__name__)
+        mapped.close()
+
+    def test_strided_payload_is_rejected(self):
+        with self.assertRaises(TypeError):
+            PutRequestEncoder(self.node_id).encode(memoryview(b'abcdef')[::2], 1)
+
+    def test_invalid_node_id(self):
+        with self.assertRaises(InvalidNodeIdError):
+            PutRequestEncoder('short')
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = EncoderCache(size=2)
+        first = cache.get('a' * 32)
+        cache.get('b' * 32)
+        self.assertIs(first, cache.get('a' * 32))
+        cache.get('c' * 32)
+
+        self.assertEqual(2, len(cache))
+        self.assertIs(first, cache.get('a' * 32))
+        with self.assertRaises(InvalidNodeIdError):
+            cache.get('short')
+        self.assertEqual(2, len(cache))
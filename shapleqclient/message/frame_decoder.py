@@ -0,0 +1,152 @@
+import socket
+from typing import Iterator, Optional
+from shapleqclient.message.qmessage import QMessage, QHeader, make_qmessage_from_buffer
+from shapleqclient.message.checksum import ChecksumPolicy, INLINE_CHECKSUM
+from shapleqclient.metrics import Metrics
+
+
+class FrameDecoder:
+    """Receive buffer that decodes QMessage frames behind a read cursor.
+
+    Bytes are received straight into a preallocated buffer with `recv_into`.
+    Decoded frames only advance the read cursor; the undecoded tail is moved
+    to the front at most once per read, so a recv holding many frames costs a
+    single compaction instead of one tail copy per frame. While decoded
+    messages still view the buffer, the tail is moved to a new buffer
+    instead, so their bytes are never written over.
+
+    The buffer adapts its size: it grows to fit a frame as soon as the frame
+    header announces its length, doubles (up to `max_size`) while reads keep
+    filling it, and shrinks back towards `min_size` once reads stay small.
+
+    Decoded messages are views into this buffer (see `QMessage`); they keep
+    the buffer they were decoded from, even while a checksum is computed on
+    them on another thread.
+    """
+    DEFAULT_MIN_SIZE = 4 * 1024
+    DEFAULT_MAX_SIZE = 1024 * 1024
+    _SHRINK_AFTER_READS = 16
+
+    min_size: int
+    max_size: int
+    _buf: bytearray
+    _start: int
+    _end: int
+    _small_reads: int
+    _filled: bool
+    _checksum_policy: ChecksumPolicy
+    _metrics: Metrics
+
+    def __init__(self, checksum_policy: ChecksumPolicy = INLINE_CHECKSUM,
+                 min_size: int = DEFAULT_MIN_SIZE, max_size: int = DEFAULT_MAX_SIZE,
+                 metrics: Optional[Metrics] = None):
+        if not 0 < min_size <= max_size:
+            raise ValueError("receive buffer sizes should be 0 < min_size <= max_size")
+        self.min_size = min_size
+        self.max_size = max_size
+        self._buf = bytearray(min_size)
+        self._start = 0
+        self._end = 0
+        self._small_reads = 0
+        self._filled = False
+        self._checksum_policy = checksum_policy
+        self._metrics = metrics if metrics is not None else Metrics()
+
+    def recv_into(self, sock: socket.socket) -> int:
+        """Read from `sock` into the free space of the buffer. Returns 0 if the peer closed the connection."""
+        self._prepare_read(0)
+        free = len(self._buf) - self._end
+        received = sock.recv_into(memoryview(self._buf)[self._end:])
+        self._metrics.recv_calls += 1
+        self._metrics.bytes_received += received
+        self._end += received
+        self._adapt(received, free)
+        return received
+
+    def feed(self, data: bytes):
+        size = len(data)
+        self._prepare_read(size)
+        self._buf[self._end:self._end + size] = data
+        self._end += size
+        self._metrics.bytes_received += size
+
+    def pending(self) -> int:
+        return self._end - self._start
+
+    def capacity(self) -> int:
+        return len(self._buf)
+
+    def next_message(self) -> Optional[QMessage]:
+        # check the frame is complete here, so an incomplete tail does not cost an exception
+        available = self._end - self._start
+        if available < QHeader.HEADER_SIZE:
+            return None
+        frame_len = QHeader.HEADER_SIZE + QHeader.HEADER_STRUCT.unpack_from(self._buf, self._start)[0]
+        if available < frame_len:
+            return None
+
+        qmsg = make_qmessage_from_buffer(self._buf, self._start, self._checksum_policy)
+        self._start += frame_len
+        self._metrics.frames_received += 1
+        return qmsg
+
+    def __iter__(self) -> Iterator[QMessage]:
+        while (qmsg := self.next_message()) is not None:
+            yield qmsg
+
+    def _prepare_read(self, size: int):
+        # make room for at least `size` more bytes, and for the whole of a frame whose header has arrived
+        pending = self._end - self._start
+        required = pending + size
+        if pending >= QHeader.HEADER_SIZE:
+            frame_len = QHeader.HEADER_SIZE + QHeader.HEADER_STRUCT.unpack_from(self._buf, self._start)[0]
+            required = max(required, frame_len)
+
+        target = len(self._buf)
+        if self._filled:
+            target = min(2 * target, self.max_size)
+        elif target > self.max_size:
+            # an oversized frame has been consumed
+            target = self.max_size
+        elif self._small_reads >= self._SHRINK_AFTER_READS:
+            target = max(target // 2, self.min_size)
+        target = max(target, required)
+        self._filled = False
+
+        if target != len(self._buf) or self._start > 0 and self._viewed():
+            self._resize(target)
+        elif self._start > 0:
+            # move the undecoded tail to the front, over frames nothing views any more
+            self._buf[0:pending] = self._buf[self._start:self._end]
+            self._start = 0
+            self._end = pending
+
+    def _viewed(self) -> bool:
+        # a bytearray can not change its size while views are exported, so taking off its last byte tells whether
+        # decoded messages still view it. neither the pop nor the append reallocates
+        try:
+            last = self._buf.pop()
+        except BufferError:
+            return True
+        self._buf.append(last)
+        return False
+
+    def _resize(self, size: int):
+        # a new buffer rather than resizing in place, since decoded messages may still hold views on the old one
+        pending = self._end - self._start
+        buf = bytearray(size)
+        buf[0:pending] = self._buf[self._start:self._end]
+        self._buf = buf
+        self._start = 0
+        self._end = pending
+        self._small_reads = 0
+
+    def _adapt(self, received: int, free: int):
+        if received == free:
+            # the read filled the buffer, so more data is probably waiting. grow before the next read
+            self._filled = True
+            self._small_reads = 0
+        elif received < len(self._buf) // 4:
+            self._small_reads += 1
+        else:
+            self._small_reads = 0
@@ -0,0 +1,96 @@
+import socket
+import unittest
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.message.api import ack_msg, put_msg
+from shapleqclient.proto.api_pb2 import Ack
+
+
+class FrameDecoderTest(unittest.TestCase):
+
+    def test_decode_multiple_frames_in_one_feed(self):
+        expected = [ack_msg(i, "test{}".format(i)) for i in range(10)]
+        buf = b''.join(make_qmessage_from_proto(MessageType.STREAM, msg).serialize() for msg in expected)
+
+        decoder = FrameDecoder()
+        decoder.feed(buf)
+
+        actual = [qmsg.unpack_to(Ack()) for qmsg in decoder]
+        self.assertEqual([msg.msg for msg in expected], [msg.msg for msg in actual])
+        self.assertEqual(0, decoder.pending())
+
+    def test_decode_split_frames(self):
+        expected = [ack_msg(i, "test{}".format(i)) for i in range(3)]
+        buf = b''.join(make_qmessage_from_proto(MessageType.STREAM, msg).serialize() for msg in expected)
+
+        decoder = FrameDecoder()
+        actual = []
+        for i in range(0, len(buf), 7):
+            decoder.feed(buf[i:i + 7])
+            actual.extend(qmsg.unpack_to(Ack()) for qmsg in decoder)
+
+        self.assertEqual([msg.msg for msg in expected], [msg.msg for msg in actual])
+        self.assertEqual(0, decoder.pending())
+
+    def test_partial_frame_is_kept(self):
+        buf = make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, "test")).serialize()
+
+        decoder = FrameDecoder()
+        decoder.feed(buf[:-1])
+        self.assertIsNone(decoder.next_message())
+        self.assertEqual(len(buf) - 1, decoder.pending())
+
+        decoder.feed(buf[-1:])
+        self.assertEqual("test", decoder.next_message().unpack_to(Ack()).msg)
+
+    def test_feed_while_messages_are_alive(self):
+        buf = make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, "test")).serialize()
+        # as long as the first frame, so compacting would write it over the first message
+        other = make_qmessage_from_proto(MessageType.STREAM, ack_msg(2, "TEST")).serialize()
+
+        decoder = FrameDecoder()
+        decoder.feed(buf + other[:5])
+        first = decoder.next_message()
+        decoder.feed(other[5:])
+        second = decoder.next_message()
+
+        self.assertEqual("test", first.unpack_to(Ack()).msg)
+        self.assertEqual("TEST", second.unpack_to(Ack()).msg)
+
+    def test_compacts_in_place_once_messages_are_released(self):
+        buf = make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, "test")).serialize()
+
+        decoder = FrameDecoder()
+        decoder.feed(buf + buf[:5])
+        self.assertEqual("test", decoder.next_message().detach().unpack_to(Ack()).msg)
+        before = decoder._buf
+        decoder.feed(buf[5:])
+
+        self.assertIs(before, decoder._buf)
+        self.assertEqual("test", decoder.next_message().unpack_to(Ack()).msg)
+
+    def test_recv_into_adapts_buffer_size(self):
+        small = make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, "test")).serialize()
+        large = make_qmessage_from_proto(MessageType.STREAM, put_msg(b'x' * 100000, 1, '0' * 32)).serialize()
+        decoder = FrameDecoder(min_size=1024, max_size=16 * 1024)
+        reader, writer = socket.socketpair()
+        try:
+            # grows to the announced length of a large frame
+            writer.sendall(large)
+            decoded = []
+            while not decoded:
+                self.assertGreater(decoder.recv_into(reader), 0)
+                decoded.extend(decoder)
+            self.assertEqual(large, decoded[0].serialize())
+            self.assertGreaterEqual(decoder.capacity(), len(large))
+
+            # back to max_size once the large frame is consumed, then down to min_size after small reads
+            for _ in range(FrameDecoder._SHRINK_AFTER_READS * 8):
+                writer.sendall(small)
+                decoder.recv_into(reader)
+                self.assertEqual(small, next(iter(decoder)).serialize())
+                self.assertLessEqual(decoder.capacity(), 16 * 1024)
+            self.assertEqual(1024, decoder.capacity())
+        finally:
+            reader.close()
+            writer.close()
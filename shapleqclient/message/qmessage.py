@@ -1,8 +1,12 @@
 from dataclasses import dataclass
-from struct import pack, unpack, calcsize
+from struct import Struct
 from google.protobuf import message, any_pb2
 from shapleqclient.common.exception import NotEnoughBufferError, InvalidChecksumError, MessageDecodeError
+from shapleqclient.message.wire import split_any
+from shapleqclient.message.checksum import ChecksumPolicy, INLINE_CHECKSUM
+from concurrent.futures import Executor, Future
 from enum import Enum
+from typing import List, Optional, Union
 import zlib
 
 
@@ -13,7 +17,8 @@ class MessageType(Enum):
 
 @dataclass
 class QHeader:
-    HEADER_SIZE = calcsize('IIH')
+    HEADER_STRUCT = Struct('!IIH')
+    HEADER_SIZE = HEADER_STRUCT.size
 
     len: int
     checksum: int
@@ -21,17 +26,35 @@ class QHeader:
 
 
 class QMessage:
+    """A decoded frame.
+
+    Messages made by `make_qmessage_from_buffer` hold a memoryview over the
+    receive buffer instead of a copy of the payload. That view is only valid
+    until the connection reads from the socket again; call `detach` to keep
+    the message beyond that point.
+
+    The checksum of a received message is verified according to the
+    `ChecksumPolicy` it was decoded with; if that has not happened yet, it
+    happens on the first `payload` access.
+    """
     _header: QHeader
-    _data: bytes
+    _data: Union[bytes, memoryview]
+    _verified: bool
+    _computed_checksum: Optional[Future]
 
-    def __init__(self, header: QHeader, data: bytes):
+    def __init__(self, header: QHeader, data: Union[bytes, memoryview], verified: bool = True):
         self._header = header
         self._data = data
+        self._verified = verified
+        self._computed_checksum = None
 
     def serialize(self) -> bytes:
-        serialized = bytearray(
-            pack('!IIH', self._header.len, self._header.checksum, self._header.msg_type)) + self._data
-        return serialized
+        return b''.join(self.buffers())
+
+    def buffers(self) -> List[Union[bytes, memoryview]]:
+        # header and payload as separate buffers, to be written with one vectored send without joining them
+        header = QHeader.HEADER_STRUCT.pack(self._header.len, self._header.checksum, self._header.msg_type)
+        return [header, self._data]
 
     def length(self) -> int:
         return self._header.len
@@ -42,25 +65,63 @@ class QMessage:
     def is_same_msg(self, msg: message.Message) -> bool:
         return msg.SerializeToString() == self._data.hex()
 
+    def payload(self) -> memoryview:
+        if not self._verified:
+            self.verify()
+        return memoryview(self._data)
+
+    def is_verified(self) -> bool:
+        return self._verified
+
+    def verify(self):
+        if self._computed_checksum is not None:
+            checksum = self._computed_checksum.result()
+            self._computed_checksum = None
+        else:
+            checksum = zlib.crc32(self._data)
+
+        if checksum != self._header.checksum:
+            raise InvalidChecksumError()
+        self._verified = True
+
+    def verify_on(self, executor: Executor):
+        # compute the checksum in the background; it is compared when the payload is read
+        self._computed_checksum = executor.submit(zlib.crc32, self._data)
+
+    def skip_verify(self):
+        self._verified = True
+
+    def is_detached(self) -> bool:
+        return not isinstance(self._data, memoryview)
+
+    def detach(self) -> 'QMessage':
+        # copy the payload out of the receive buffer so the message outlives the next read
+        if not self.is_detached():
+            self._data = self.payload().tobytes()
+        return self
+
     def unpack_to(self, msg: message.Message) -> message.Message:
         try:
-            any_pb = any_pb2.Any()
-            any_pb.ParseFromString(self._data)
+            type_url, value = split_any(self.payload())
+            if type_url.split('/')[-1] != msg.DESCRIPTOR.full_name:
+                return None
+            msg.ParseFromString(value)
 
         except message.DecodeError as err:
             raise MessageDecodeError(msg=err)
 
-        return msg if any_pb.Unpack(msg) else None
+        return msg
 
 
-def make_qmessage_from_buffer(buf: bytes) -> QMessage:
-    buffer_len = len(buf)
+def make_qmessage_from_buffer(buf: bytes, offset: int = 0,
+                              checksum_policy: ChecksumPolicy = INLINE_CHECKSUM) -> QMessage:
+    buffer_len = len(buf) - offset
 
     # check header
     if buffer_len < QHeader.HEADER_SIZE:
         raise NotEnoughBufferError()
 
-    header_struct = unpack('!IIH', buf[:QHeader.HEADER_SIZE])
+    header_struct = QHeader.HEADER_STRUCT.unpack_from(buf, offset)
     actual_data_len = header_struct[0]
     actual_checksum = header_struct[1]
     msg_type = header_struct[2]
@@ -70,15 +131,17 @@ def make_qmessage_from_buffer(buf: bytes) -> QMessage:
     if received_data_len < actual_data_len:
         raise NotEnoughBufferError()
 
-    data = buf[QHeader.HEADER_SIZE:QHeader.HEADER_SIZE + actual_data_len]
-
-    if actual_checksum != zlib.crc32(data):
-        raise InvalidChecksumError()
+    data_offset = offset + QHeader.HEADER_SIZE
+    data = memoryview(buf)[data_offset:data_offset + actual_data_len]
 
-    return QMessage(
+    qmsg = QMessage(
         header=QHeader(actual_data_len, actual_checksum, msg_type),
-        data=data
+        data=data,
+        verified=False
     )
+    checksum_policy.apply(qmsg)
+
+    return qmsg
 
 
 def make_qmessage_from_proto(msg_type: MessageType, msg: message.Message) -> QMessage:
@@ -1,7 +1,9 @@
 import unittest
 from shapleqclient.message.qmessage import *
 from struct import pack
+from shapleqclient.common.exception import MessageDecodeError
 from shapleqclient.message.api import ack_msg
+from shapleqclient.message.wire import split_any
 from shapleqclient.proto.api_pb2 import Ack, Ping
 
 
@@ -32,3 +34,24 @@ class QMessageTest(unittest.TestCase):
 
         fake = Ping()
         self.assertIsNone(actual_msg.unpack_to(fake))
+
+    def test_malformed_type_url(self):
+        data = make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, "test")).serialize()[QHeader.HEADER_SIZE:]
+        with self.assertRaises(MessageDecodeError):
+            split_any(memoryview(data.replace(b'type.googleapis.com', b'\xffype.googleapis.com')))
+
+    def test_payload_is_view_until_detached(self):
+        buf = bytearray(make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, "test")).serialize())
+        msg = make_qmessage_from_buffer(buf)
+        self.assertFalse(msg.is_detached())
+
+        # overwriting the receive buffer is visible through an attached message
+        buf[QHeader.HEADER_SIZE:] = bytes(len(buf) - QHeader.HEADER_SIZE)
+        self.assertEqual(bytes(msg.length()), bytes(msg.serialize()[QHeader.HEADER_SIZE:]))
+
+        buf = bytearray(make_qmessage_from_proto(MessageType.STREAM, ack_msg(1, "test")).serialize())
+        msg = make_qmessage_from_buffer(buf).detach()
+        self.assertTrue(msg.is_detached())
+
+        buf[QHeader.HEADER_SIZE:] = bytes(len(buf) - QHeader.HEADER_SIZE)
+        self.assertEqual("test", msg.unpack_to(Ack()).msg)
@@ -0,0 +1,43 @@
+from typing import Any, Callable, Dict, Optional, Type
+from google.protobuf import message
+from shapleqclient.common.exception import MessageDecodeError
+from shapleqclient.message.qmessage import QMessage
+from shapleqclient.message.wire import split_any
+
+
+class MessageRegistry:
+    """Table of the message types a session expects, keyed by their `Any` type name.
+
+    `decode` reads the type url of a frame once and parses the payload straight
+    into the registered type, instead of probing it with `unpack_to` per type.
+    A type can be registered with its own decoder, which gets a view of the
+    serialized message instead.
+    """
+    _decoders: Dict[str, Callable[[memoryview], Any]]
+
+    def __init__(self, *message_types: Type[message.Message]):
+        self._decoders = {}
+        for message_type in message_types:
+            self.register(message_type)
+
+    def register(self, message_type: Type[message.Message], decoder: Callable[[memoryview], Any] = None):
+        if decoder is None:
+            def decoder(value: memoryview) -> message.Message:
+                decoded = message_type()
+                decoded.ParseFromString(value)
+                return decoded
+
+        self._decoders[message_type.DESCRIPTOR.full_name] = decoder
+
+    def decode(self, msg: QMessage) -> Optional[Any]:
+        # returns None if the message is not of a registered type
+        try:
+            type_url, value = split_any(msg.payload())
+            decoder = self._decoders.get(type_url.rpartition('/')[2])
+            if decoder is None:
+                return None
+
+            return decoder(value)
+
+        except message.DecodeError as err:
+            raise MessageDecodeError(msg=err)
@@ -0,0 +1,24 @@
+import unittest
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto, make_qmessage_from_buffer
+from shapleqclient.message.api import ack_msg, fetch_msg
+from shapleqclient.proto.api_pb2 import Ack, FetchResponse
+
+
+class MessageRegistryTest(unittest.TestCase):
+
+    def test_decode_registered_type(self):
+        registry = MessageRegistry(FetchResponse, Ack)
+        msg = make_qmessage_from_buffer(make_qmessage_from_proto(MessageType.STREAM, ack_msg(3, "test")).serialize())
+
+        decoded = registry.decode(msg)
+
+        self.assertIsInstance(decoded, Ack)
+        self.assertEqual(3, decoded.code)
+        self.assertEqual("test", decoded.msg)
+
+    def test_decode_unregistered_type(self):
+        registry = MessageRegistry(FetchResponse, Ack)
+        msg = make_qmessage_from_proto(MessageType.STREAM, fetch_msg(0, 1, 100))
+
+        self.assertIsNone(registry.decode(msg))
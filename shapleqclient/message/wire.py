@@ -0,0 +1,94 @@
+from typing import Tuple
+from shapleqclient.common.exception import MessageDecodeError
+
+# protobuf wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+ANY_TYPE_URL_FIELD = 1
+ANY_VALUE_FIELD = 2
+
+
+def make_tag(field_number: int, wire_type: int) -> bytes:
+    return encode_varint(field_number << 3 | wire_type)
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0x80:
+        return _SMALL_VARINTS[value]
+
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+_SMALL_VARINTS = [bytes((value,)) for value in range(0x80)]
+
+
+def read_varint(buf: memoryview, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    end = len(buf)
+    while pos < end:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            break
+    raise MessageDecodeError(msg="truncated or too long varint")
+
+
+def skip_field(buf: memoryview, pos: int, wire_type: int) -> int:
+    if wire_type == WIRE_VARINT:
+        return read_varint(buf, pos)[1]
+    elif wire_type == WIRE_FIXED64:
+        pos += 8
+    elif wire_type == WIRE_LENGTH_DELIMITED:
+        length, pos = read_varint(buf, pos)
+        pos += length
+    elif wire_type == WIRE_FIXED32:
+        pos += 4
+    else:
+        raise MessageDecodeError(msg="unsupported wire type {}".format(wire_type))
+
+    if pos > len(buf):
+        raise MessageDecodeError(msg="truncated field")
+    return pos
+
+
+def split_any(buf: memoryview) -> Tuple[str, memoryview]:
+    """Split a serialized `google.protobuf.Any` into its type url and a view of its value.
+
+    The value is not copied, so it stays valid only as long as `buf` does.
+    """
+    type_url = ""
+    value = buf[0:0]
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        tag, pos = read_varint(buf, pos)
+        field_number, wire_type = tag >> 3, tag & 0x07
+        if wire_type == WIRE_LENGTH_DELIMITED and field_number in (ANY_TYPE_URL_FIELD, ANY_VALUE_FIELD):
+            length, pos = read_varint(buf, pos)
+            if pos + length > end:
+                raise MessageDecodeError(msg="truncated field")
+            if field_number == ANY_TYPE_URL_FIELD:
+                try:
+                    type_url = str(buf[pos:pos + length], 'utf-8')
+                except UnicodeDecodeError:
+                    raise MessageDecodeError(msg="type url is not utf-8")
+            else:
+                value = buf[pos:pos + length]
+            pos += length
+        else:
+            pos = skip_field(buf, pos, wire_type)
+
+    return type_url, value
@@ -0,0 +1,57 @@
+import logging
+from typing import Dict
+
+
+class Metrics:
+    """Counters of frames, bytes and socket calls of one or more connections.
+
+    Counting is a plain integer addition, cheap enough for every frame. The
+    counters are not locked, so increments racing between threads may
+    occasionally be lost; they are meant for monitoring, not accounting.
+    """
+    __slots__ = ('frames_sent', 'bytes_sent', 'send_calls', 'frames_received', 'bytes_received', 'recv_calls')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.send_calls = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.recv_calls = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SampledLogger:
+    """Debug logging for per-frame events that logs one of every `rate` events.
+
+    Messages take logging's %-style arguments, so nothing is formatted
+    unless a record is emitted, and events are not even counted while DEBUG
+    is disabled. Arguments that are costly to compute should be guarded with
+    `is_enabled`.
+    """
+    rate: int
+    _logger: logging.Logger
+    _count: int
+
+    def __init__(self, logger: logging.Logger, rate: int):
+        if rate < 1:
+            raise ValueError("sample rate should be at least 1")
+        self.rate = rate
+        self._logger = logger
+        self._count = 0
+
+    def is_enabled(self) -> bool:
+        return self._logger.isEnabledFor(logging.DEBUG)
+
+    def debug(self, msg: str, *args):
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return
+        self._count += 1
+        if self._count >= self.rate:
+            self._count = 0
+            self._logger.debug(msg, *args)
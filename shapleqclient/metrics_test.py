@@ -0,0 +1,60 @@
+import logging
+import unittest
+from shapleqclient.metrics import Metrics, SampledLogger
+
+
+class FailingArgument:
+    def __str__(self):
+        raise AssertionError("formatted while logging is disabled")
+
+    __repr__ = __str__
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+class SampledLoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("shapleq-python.metrics-test")
+        self.logger.propagate = False
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_logs_one_of_rate_events(self):
+        self.logger.setLevel(logging.DEBUG)
+        frame_log = SampledLogger(self.logger, 10)
+        for i in range(1, 31):
+            frame_log.debug('frame %d', i)
+
+        self.assertEqual(['frame 10', 'frame 20', 'frame 30'], self.handler.messages)
+
+    def test_nothing_is_formatted_while_disabled(self):
+        self.logger.setLevel(logging.INFO)
+        frame_log = SampledLogger(self.logger, 1)
+        frame_log.debug('frame %s', FailingArgument())
+
+        self.assertFalse(frame_log.is_enabled())
+        self.assertEqual([], self.handler.messages)
+
+
+class MetricsTest(unittest.TestCase):
+    def test_snapshot_and_reset(self):
+        metrics = Metrics()
+        metrics.frames_sent += 2
+        metrics.bytes_received += 100
+
+        snapshot = metrics.snapshot()
+        metrics.reset()
+
+        self.assertEqual(2, snapshot['frames_sent'])
+        self.assertEqual(100, snapshot['bytes_received'])
+        self.assertEqual(0, metrics.snapshot()['frames_sent'])
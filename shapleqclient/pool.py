@@ -0,0 +1,268 @@
+import dataclasses
+import logging
+import select
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Tuple
+from shapleqclient.base import ClientBase, QConfig, make_zk_client, resolve_broker
+from shapleqclient.common.exception import ClientConnectionError
+from shapleqclient.proto.data_pb2 import SessionType, ADMIN, SUBSCRIBER
+from shapleqclient.zk_client import ZKClient
+
+# broker address, session type and topic of a connection. admin connections have no topic
+PoolKey = Tuple[str, int, str]
+
+
+@dataclasses.dataclass
+class PoolStats:
+    checkouts: int = 0
+    # checkouts served with an idle connection
+    reused: int = 0
+    created: int = 0
+    # idle connections closed for being idle too long, unhealthy, or to make room under the cap
+    evicted: int = 0
+    # time spent on broker lookups, connects and stream handshakes of created connections
+    connect_seconds: float = 0.0
+    # connect time reused connections would have cost, estimated from the connections created for the same key
+    saved_seconds: float = 0.0
+
+    def saved_per_checkout(self) -> float:
+        return self.saved_seconds / self.checkouts if self.checkouts > 0 else 0.0
+
+
+class _IdleConnection:
+    def __init__(self, client: ClientBase):
+        self.client = client
+        self.since = time.monotonic()
+
+
+class ConnectionPool:
+    """Connected clients kept warm for reuse, per broker and session.
+
+    `checkout` hands out an idle connection of the same broker, session type
+    and topic when there is one, and otherwise looks the broker up, connects
+    and initializes the stream. `checkin` returns it for the next checkout.
+    Connections are made with the pool's config.
+
+    An idle connection is checked before it is handed out: one the broker
+    closed, or with unexpected data waiting, is dropped. Connections idle for
+    longer than `idle_timeout` milliseconds are closed. At most
+    `max_per_broker` connections, idle or checked out, are open to one broker;
+    a checkout over the cap closes an idle connection of another session to
+    make room, or waits up to the config timeout for a checkin.
+
+    Subscriber sessions are not pooled, since the broker keeps streaming to
+    them once they fetch.
+    """
+    DEFAULT_MAX_PER_BROKER = 8
+    DEFAULT_IDLE_TIMEOUT = 60 * 1000
+
+    config: QConfig
+    logger: logging.Logger
+    max_per_broker: int
+    idle_timeout: int
+    _zk_client: ZKClient
+    _idle: Dict[PoolKey, Deque[_IdleConnection]]
+    _leased: Dict[ClientBase, PoolKey]
+    _open: Dict[str, int]
+    _brokers: Dict[Tuple[int, str], str]
+    # total time and number of the connections created per key
+    _connect_seconds: Dict[PoolKey, Tuple[float, int]]
+    _stats: PoolStats
+    _cond: threading.Condition
+
+    def __init__(self, config: QConfig, logger: logging.Logger, max_per_broker: int = DEFAULT_MAX_PER_BROKER,
+                 idle_timeout: int = DEFAULT_IDLE_TIMEOUT):
+        if max_per_broker < 1:
+            raise ValueError("max_per_broker should be at least 1")
+        self.config = config
+        self.logger = logger
+        self.max_per_broker = max_per_broker
+        self.idle_timeout = idle_timeout
+        self._zk_client = make_zk_client(config)
+        self._idle = {}
+        self._leased = {}
+        self._open = {}
+        self._brokers = {}
+        self._connect_seconds = {}
+        self._stats = PoolStats()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def checkout(self, session_type: SessionType, topic: str) -> ClientBase:
+        if session_type == SUBSCRIBER:
+            raise ValueError("subscriber sessions cannot be pooled")
+
+        lookup_seconds = 0.0
+        with self._cond:
+            address = self._brokers.get((session_type, topic))
+        if address is None:
+            started = time.monotonic()
+            address = resolve_broker(self._zk_client, session_type, topic)
+            lookup_seconds = time.monotonic() - started
+            with self._cond:
+                self._brokers[(session_type, topic)] = address
+
+        return self._checkout((address, session_type, topic),
+                              lambda client: client.connect(session_type, topic, address), lookup_seconds)
+
+    def checkout_admin(self, address: str) -> ClientBase:
+        return self._checkout((address, ADMIN, ''), lambda client: client.connect_to_broker(address), 0.0)
+
+    def checkin(self, client: ClientBase):
+        """Returns a checked out client. It should not be receiving, and should have no responses outstanding."""
+        with self._cond:
+            key = self._leased.pop(client, None)
+            if key is None:
+                raise ValueError("client is not checked out of this pool")
+            pooled = not self._closed and client.is_connected()
+            if pooled:
+                self._idle.setdefault(key, deque()).append(_IdleConnection(client))
+            elif not self._closed:
+                self._open[key[0]] -= 1
+            self._cond.notify_all()
+        if not pooled:
+            client.close()
+        self.evict_idle()
+
+    def evict_idle(self):
+        """Closes connections idle for longer than `idle_timeout`. Checkouts and checkins do it as well."""
+        deadline = time.monotonic() - self.idle_timeout / 1000
+        closing = []
+        with self._cond:
+            for key, idle in self._idle.items():
+                while idle and idle[0].since < deadline:
+                    closing.append(self._drop(key, idle.popleft()))
+        self._close_all(closing)
+
+    def stats(self) -> PoolStats:
+        with self._cond:
+            return dataclasses.replace(self._stats)
+
+    def close(self):
+        with self._cond:
+            # connections still checked out are closed when they are checked in
+            self._closed = True
+            closing = [conn.client for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+            self._open.clear()
+        self._close_all(closing)
+        self._zk_client.close()
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _checkout(self, key: PoolKey, connect: Callable[[ClientBase], None], lookup_seconds: float) -> ClientBase:
+        if self._closed:
+            raise ClientConnectionError("connection pool is closed")
+        self.evict_idle()
+        if (client := self._take_idle(key)) is not None:
+            return client
+
+        self._reserve(key)
+        client = ClientBase(self.config, self.logger)
+        started = time.monotonic()
+        try:
+            connect(client)
+        except Exception:
+            client.close()
+            with self._cond:
+                self._open[key[0]] -= 1
+                # the broker may have moved
+                self._brokers.pop((key[1], key[2]), None)
+                self._cond.notify_all()
+            raise
+        elapsed = time.monotonic() - started + lookup_seconds
+
+        with self._cond:
+            total, count = self._connect_seconds.get(key, (0.0, 0))
+            self._connect_seconds[key] = (total + elapsed, count + 1)
+            self._leased[client] = key
+            self._stats.checkouts += 1
+            self._stats.created += 1
+            self._stats.connect_seconds += elapsed
+        return client
+
+    def _take_idle(self, key: PoolKey):
+        closing = []
+        try:
+            with self._cond:
+                idle = self._idle.get(key)
+                while idle:
+                    # the most recently used connection is the least likely to have been dropped
+                    conn = idle.pop()
+                    if not self._healthy(conn.client):
+                        closing.append(self._drop(key, conn))
+                        continue
+
+                    total, count = self._connect_seconds.get(key, (0.0, 1))
+                    saved = total / count
+                    self._leased[conn.client] = key
+                    self._stats.checkouts += 1
+                    self._stats.reused += 1
+                    self._stats.saved_seconds += saved
+                    self.logger.debug('reused connection to {}, saved {:.3f} sec'.format(key[0], saved))
+                    return conn.client
+                return None
+        finally:
+            self._close_all(closing)
+
+    def _reserve(self, key: PoolKey):
+        # counts a connection to be created against the cap of its broker
+        address = key[0]
+        deadline = time.monotonic() + self.config.get_timeout() / 1000
+        closing = []
+        try:
+            with self._cond:
+                while self._open.get(address, 0) >= self.max_per_broker:
+                    if (victim := self._oldest_idle(address)) is not None:
+                        closing.append(self._drop(*victim))
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise ClientConnectionError("too many connections to broker {}".format(address))
+                    self._cond.wait(remaining)
+                self._open[address] = self._open.get(address, 0) + 1
+        finally:
+            self._close_all(closing)
+
+    def _oldest_idle(self, address: str):
+        oldest = None
+        for key, idle in self._idle.items():
+            if key[0] == address and idle and (oldest is None or idle[0].since < oldest[1].since):
+                oldest = (key, idle[0])
+        return oldest
+
+    def _drop(self, key: PoolKey, conn: _IdleConnection) -> ClientBase:
+        # called with the lock held; the returned client is closed after releasing it
+        idle = self._idle[key]
+        if conn in idle:
+            idle.remove(conn)
+        self._open[key[0]] -= 1
+        self._stats.evicted += 1
+        return conn.client
+
+    @staticmethod
+    def _healthy(client: ClientBase) -> bool:
+        # an idle connection has nothing to read. if it is readable, the broker closed it or sent something
+        # nobody waits for
+        if not client.is_connected():
+            return False
+        try:
+            if hasattr(select, 'poll'):
+                poller = select.poll()
+                poller.register(client.fileno(), select.POLLIN)
+                return not poller.poll(0)
+            readable, _, _ = select.select([client.fileno()], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def _close_all(clients):
+        for client in clients:
+            client.close()
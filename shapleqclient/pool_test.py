@@ -0,0 +1,105 @@
+import logging
+import time
+import unittest
+from shapleqclient.admin import Admin
+from shapleqclient.base import QConfig
+from shapleqclient.common.exception import ClientConnectionError
+from shapleqclient.pool import ConnectionPool
+from shapleqclient.producer import Producer
+from shapleqclient.proto.data_pb2 import PUBLISHER
+from shapleqclient.testing import FakeBroker, FakeZKClient
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+    node_id = "0" * 32
+
+    def setUp(self):
+        self.broker = FakeBroker()
+
+    def tearDown(self):
+        self.pool.close()
+        self.broker.close()
+
+    def make_pool(self, **kwargs) -> ConnectionPool:
+        config = QConfig(timeout=200, zk_client_factory=FakeZKClient.factory([self.broker.address]))
+        self.pool = ConnectionPool(config, self.logger, **kwargs)
+        return self.pool
+
+    def wait_connections(self, count: int):
+        deadline = time.monotonic() + 5
+        while self.broker.connection_count() != count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(count, self.broker.connection_count())
+
+    def test_producers_reuse_connection(self):
+        pool = self.make_pool()
+        for seq in range(3):
+            producer = Producer(QConfig(), "topic", self.logger, pool=pool)
+            producer.setup()
+            producer.publish(b'data', seq, self.node_id)
+            producer.stop()
+
+        stats = pool.stats()
+        self.assertEqual(1, self.broker.connection_count())
+        self.assertEqual([0, 1, 2], [record.seq_num for record in self.broker.records("topic")])
+        self.assertEqual((3, 2, 1), (stats.checkouts, stats.reused, stats.created))
+        self.assertGreater(stats.saved_seconds, 0)
+        self.assertAlmostEqual(stats.saved_seconds / 3, stats.saved_per_checkout())
+
+    def test_connection_with_outstanding_responses_is_closed(self):
+        pool = self.make_pool()
+        self.broker.put_delay = 1
+        producer = Producer(QConfig(), "topic", self.logger, pool=pool)
+        producer.setup()
+        producer.publish(b'data', 1, self.node_id)
+        producer.stop()
+
+        self.assertEqual(0, sum(len(idle) for idle in pool._idle.values()))
+        self.assertEqual(0, pool._open[self.broker.address])
+
+    def test_unhealthy_connection_is_replaced(self):
+        pool = self.make_pool()
+        pool.checkin(pool.checkout(PUBLISHER, "topic"))
+        self.broker.drop_connections()
+        time.sleep(0.1)
+
+        client = pool.checkout(PUBLISHER, "topic")
+
+        self.assertTrue(client.is_connected())
+        self.assertEqual((1, 2), (pool.stats().evicted, pool.stats().created))
+        pool.checkin(client)
+
+    def test_idle_connections_are_evicted(self):
+        pool = self.make_pool(idle_timeout=50)
+        pool.checkin(pool.checkout(PUBLISHER, "topic"))
+        self.wait_connections(1)
+        time.sleep(0.1)
+        pool.evict_idle()
+
+        self.assertEqual(1, pool.stats().evicted)
+        self.wait_connections(0)
+
+    def test_connections_per_broker_are_capped(self):
+        pool = self.make_pool(max_per_broker=1)
+        first = pool.checkout(PUBLISHER, "topic1")
+        with self.assertRaises(ClientConnectionError):
+            pool.checkout(PUBLISHER, "topic2")
+
+        # the idle connection of the other topic makes room
+        pool.checkin(first)
+        second = pool.checkout(PUBLISHER, "topic2")
+        self.assertEqual(1, pool.stats().evicted)
+        pool.checkin(second)
+        self.wait_connections(1)
+
+    def test_admin_reuses_connection(self):
+        pool = self.make_pool()
+        for _ in range(2):
+            admin = Admin(self.broker.address, 200, self.logger, pool=pool)
+            admin.setup()
+            self.assertEqual([], admin.list_topic())
+            admin.stop()
+
+        self.assertEqual(1, pool.stats().reused)
+        self.assertEqual(1, self.broker.connection_count())
@@ -1,55 +1,668 @@
+import dataclasses
 import logging
 import threading
+import time
 from shapleqclient.base import ClientBase, QConfig
-from shapleqclient.common.exception import InvalidMessageError, SocketClosedError, RequestFailedError, InvalidNodeIdError
+from shapleqclient.common.exception import InvalidMessageError, SocketClosedError, RequestFailedError, \
+    SocketWriteError, SocketReadError, WindowFullError, RecordDroppedError, InvalidNodeIdError, SpillFullError, \
+    TopicNotSetError
 from shapleqclient.proto.api_pb2 import PutResponse, Ack
-from shapleqclient.proto.data_pb2 import SessionType
-from shapleqclient.message.qmessage import QMessage, MessageType, make_qmessage_from_proto
-from shapleqclient.message.api import put_msg
+from shapleqclient.proto.data_pb2 import SessionType, Partition
+from shapleqclient.message.qmessage import QMessage
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.message.encoder import EncoderCache, Payload, payload_view
+from shapleqclient.compression import Compressor, get_codec
+from shapleqclient.reactor import Reactor
+from shapleqclient.pool import ConnectionPool
+from shapleqclient.metrics import Metrics
+from shapleqclient.accumulator import RecordAccumulator
+from shapleqclient.delivery import CallbackDispatcher, Delivery
+from shapleqclient.spill import SpillLog
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple, Union
+
+Frame = List[Union[bytes, memoryview]]
+
+
+@dataclasses.dataclass
+class WindowStats:
+    # records and bytes published but not responded to yet
+    records: int = 0
+    bytes: int = 0
+    # publishes that waited for room in a full window
+    waits: int = 0
+    # publishes that failed for a full window
+    rejected: int = 0
+    # records dropped for a full window
+    dropped: int = 0
+    # records in flight held in the spill log
+    spilled: int = 0
+    # records failed for a full spill log
+    spill_failed: int = 0
 
 
 class Producer:
+    # bytes of payloads publish_many encodes into one buffer
+    MANY_CHUNK_SIZE = 64 * 1024
+    # bytes of spilled records sent with one send once the connection is back
+    SPILL_DRAIN_BYTES = 256 * 1024
+
     topic: str
+    node_id: Optional[str]
     _client: ClientBase
     logger: logging.Logger
+    _encoders: EncoderCache
+    _compressor: Optional[Compressor]
+    _reactor: Optional[Reactor]
+    _pool: Optional[ConnectionPool]
+    _receiver: Optional[threading.Thread]
+    _accumulator: Optional[RecordAccumulator]
+    # deliveries of the published records the broker has not responded to yet, in publish order
+    _in_flight: Deque[Delivery]
+    _in_flight_bytes: int
+    _window: WindowStats
+    _responded: threading.Condition
+    _callbacks: CallbackDispatcher
+    # taken to add a record to the records in flight and queue its frame, so frames are written in the order
+    # deliveries are resolved in
+    _publish_lock: threading.Lock
+    # frames published without batching that no thread has written yet, with the number of records each holds.
+    # appended under the publish lock, taken without it, since a publisher may hold it while waiting for room in
+    # the window
+    _pending: Deque[Tuple[Frame, int]]
+    # held by the thread writing frames for every publisher
+    _write_lock: threading.Lock
+    # records in flight no writer has taken yet. these are the newest ones, and the ones before them are what a
+    # reconnect sends again
+    _unsent: int
+    # whether lost connections are reconnected, with deliveries keeping their frames to send them again
+    _replays: bool
+    # set while a lost connection is not reconnected: before setup, after stop and once reconnecting gave up
+    _closed: threading.Event
+    _host: Optional[str]
+    # frames written while the connection is down, when config.spill_dir is set. their records come after the ones
+    # taken by writers before and before the unsent ones
+    _spill: Optional[SpillLog]
+    _spilled: int
+    # sequence number of the next record of publish_many
+    _seq_num: int
+    _MESSAGES = MessageRegistry(PutResponse, Ack)
 
-    def __init__(self, config: QConfig, topic: str, logger: logging.Logger):
+    # responses are received on a thread of its own for each producer, unless a reactor is given.
+    # producers sharing a reactor share its threads.
+    # with a pool, the connection is checked out of it on setup and returned on stop.
+    # with config.batch_bytes over 0, publish queues records for a background sender. published data are referenced
+    # until they are sent, so a mutable buffer must not be modified after publishing it.
+    # publish returns a Delivery resolved by the broker's response; responses arrive in publish order.
+    # publish may be called from many threads at once. a publishing thread that finds no other thread writing writes
+    # the frames every thread queued meanwhile, together.
+    # publish_many publishes with node_id, which is checked here, and numbers records from first_seq_num
+    # with config.reconnect_backoff_ms over 0, and neither a reactor nor a pool, a lost connection is reconnected and
+    # the records sent on it but not responded to are sent again with their own sequence numbers, so the broker can
+    # tell them from new records. records may be published meanwhile. published data are then referenced until
+    # their responses arrive. with config.spill_dir set, records written while the connection is down are moved to a
+    # log on disk instead, which counts toward the in-flight window like other records
+    def __init__(self, config: QConfig, topic: str, logger: logging.Logger, reactor: Optional[Reactor] = None,
+                 pool: Optional[ConnectionPool] = None, node_id: Optional[str] = None, first_seq_num: int = 0):
+        self.config = config
         self._client = ClientBase(config, logger)
         self.logger = logger
         self.topic = topic
+        self._reactor = reactor
+        self._pool = pool
+        self._receiver = None
+        self._accumulator = None
+        self._in_flight = deque()
+        self._in_flight_bytes = 0
+        self._window = WindowStats()
+        self._responded = threading.Condition()
+        self._callbacks = CallbackDispatcher(logger)
+        self._publish_lock = threading.Lock()
+        self._pending = deque()
+        self._write_lock = threading.Lock()
+        self._unsent = 0
+        self._replays = config.get_reconnect_backoff_ms() > 0 and reactor is None and pool is None
+        self._closed = threading.Event()
+        self._closed.set()
+        self._host = None
+        self._spill = None
+        self._spilled = 0
+        if config.get_spill_dir() is not None and not self._replays:
+            raise ValueError("spill_dir needs reconnect_backoff_ms over 0, and neither a reactor nor a pool")
+        self._seq_num = first_seq_num
+        self._encoders = EncoderCache()
+        self.node_id = node_id
+        if node_id is not None:
+            self._encoders.get(node_id)
+        self._compressor = None
+        if config.get_compression() is not None:
+            self._compressor = Compressor(get_codec(config.get_compression()), config.get_compression_threshold())
 
-    def setup(self):
-        self._client.connect(SessionType.PUBLISHER, self.topic)
-        th = threading.Thread(target=self._receive_message)
-        th.start()
+    # host is looked up in zookeeper unless given
+    # with config.spill_dir set, a producer that can not connect starts disconnected, spilling records, and connects
+    # like it reconnects a lost connection
+    def setup(self, host: Optional[str] = None):
+        if self._spill is None and self.config.get_spill_dir() is not None:
+            self._spill = SpillLog(self.config.get_spill_dir(), self.config.get_spill_segment_bytes(),
+                                   self.config.get_spill_max_bytes())
+        if self._pool is not None:
+            self._client = self._pool.checkout(SessionType.PUBLISHER, self.topic)
+        else:
+            try:
+                self._client.connect(SessionType.PUBLISHER, self.topic, host)
+            except TopicNotSetError:
+                raise
+            except Exception as err:
+                if self._spill is None:
+                    raise
+                self._client.close()
+                self.logger.error('cannot connect, spilling records until connected: {}'.format(err))
+        self._host = host
+        self._closed.clear()
+        if self.config.get_batch_bytes() > 0:
+            self._accumulator = RecordAccumulator(self._send_batch, self.config.get_batch_bytes(),
+                                                  self.config.get_linger_ms(), self.config.get_buffer_memory(),
+                                                  self.config.get_timeout() / 1000, self.logger)
+        if self._reactor is not None:
+            self._reactor.register(self._client, self._handle_message)
+            return
+        self._receiver = threading.Thread(target=self._receive_message)
+        self._receiver.start()
 
     def is_connected(self) -> bool:
         return self._client.is_connected()
 
+    def flush(self):
+        """Writes every published record to the broker, or to the spill log while reconnecting.
+
+        With batching, raises `TimeoutError` when the queued records are not written within the config timeout.
+        """
+        self._write_all()
+        self._write_lock.acquire()
+        try:
+            # records are written again once the connection is back
+            if self._client.is_connected() or not self._reconnects():
+                self._client.flush()
+        finally:
+            self._release_write_lock()
+
     def stop(self):
-        self._client.close()
+        # with batching, the queued records are sent and their responses waited for, since closing a connection
+        # with responses unread resets it and the broker may drop records it has not read yet
+        drained = False
+        if self._accumulator is not None or self._pool is not None:
+            drained = self._drain()
+        if self._reactor is not None:
+            self._reactor.unregister(self._client)
+        self._closed.set()
+        if self._pool is None:
+            self._client.close()
+            if self._replays:
+                if self._receiver is not None and self._receiver is not threading.current_thread():
+                    # the receiving thread may be reconnecting
+                    self._receiver.join()
+                # records may be being sent again after a reconnect, under the write lock
+                with self._write_lock:
+                    self._fail_in_flight(SocketClosedError())
+                    if self._spill is not None:
+                        self._spill.close()
+            else:
+                self._fail_in_flight(SocketClosedError())
+            self._callbacks.close()
+            return
+
+        # the next producer must not receive responses to this one's records, so the connection goes back
+        # only once all of them arrived. otherwise it is closed
+        if self._reactor is None and self._receiver is not None and self._receiver is not threading.current_thread():
+            self._client.interrupt_receive()
+            self._receiver.join()
+        if not drained:
+            self._client.close()
+        self._pool.checkin(self._client)
+        self._fail_in_flight(SocketClosedError())
+        self._callbacks.close()
+
+    def metrics(self) -> Metrics:
+        return self._client.metrics
+
+    def window_stats(self) -> WindowStats:
+        with self._responded:
+            return dataclasses.replace(self._window, records=len(self._in_flight), bytes=self._in_flight_bytes,
+                                       spilled=self._spilled)
 
-    def publish(self, data: bytes, seq_num: int, node_id: str):
+    def _drain(self) -> bool:
+        # sends every published record and waits for their responses. returns whether all of them arrived
+        if self._accumulator is not None:
+            try:
+                self._accumulator.close()
+            except (SocketClosedError, SocketWriteError) as err:
+                self.logger.error(err)
         if not self._client.is_connected():
+            return False
+        try:
+            self._client.flush()
+        except SocketWriteError as err:
+            self.logger.error(err)
+            return False
+        return self._wait_responses(self._client.config.get_timeout() / 1000)
+
+    def _wait_responses(self, timeout: float) -> bool:
+        with self._responded:
+            return self._responded.wait_for(lambda: not self._in_flight or not self._client.is_connected(),
+                                            timeout) and not self._in_flight
+
+    def _fail_in_flight(self, error: Exception):
+        # responses to the records still in flight will not arrive any more
+        with self._responded:
+            failed, self._in_flight = list(self._in_flight), deque()
+            self._in_flight_bytes = 0
+            self._spilled = 0
+            now = time.monotonic()
+            with_callbacks = [delivery for delivery in failed if delivery._resolve(None, error, now)]
+            self._responded.notify_all()
+        if with_callbacks:
+            self._callbacks.schedule(with_callbacks)
+
+    def publish(self, data: Payload, seq_num: int, node_id: str,
+                callback: Optional[Callable[[Delivery], None]] = None) -> Delivery:
+        """Sends a record and returns its delivery, which resolves with the partition once the broker responds.
+
+        `data` may be any C-contiguous buffer; it is sent without copying.
+        `callback`, if given, is added to the delivery with `Delivery.add_done_callback`.
+        """
+        if not self._client.is_connected() and not self._reconnects():
             raise SocketClosedError()
-        if len(node_id) != 32:
+        data = payload_view(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        buffers = self._encoders.get(node_id).encode(data, seq_num)
+        delivery = Delivery(seq_num, sum(len(buf) for buf in buffers), self._responded, self._callbacks)
+        if self._replays:
+            delivery._frame = buffers
+        if callback is not None:
+            delivery.add_done_callback(callback)
+        with self._publish_lock:
+            # in flight before sending, since the response may arrive before send returns
+            if not self._enter_window(delivery):
+                return delivery
+            try:
+                if self._accumulator is not None:
+                    self._accumulator.append(buffers, delivery)
+                else:
+                    self._pending.append((buffers, 1))
+            except Exception:
+                with self._responded:
+                    self._in_flight.remove(delivery)
+                    self._in_flight_bytes -= delivery.size
+                    self._unsent -= 1
+                    self._responded.notify_all()
+                raise
+
+        self._write_queued()
+        return delivery
+
+    def publish_many(self, payloads: Iterable[Payload],
+                     callback: Optional[Callable[[Delivery], None]] = None) -> List[Delivery]:
+        """Publishes records numbered by the producer and returns their deliveries, in order.
+
+        Records take the producer's node id and consecutive sequence numbers
+        from its counter. They are encoded back to back into buffers of about
+        `MANY_CHUNK_SIZE` bytes, each written with one send. If the in-flight
+        window raises, the records published before are still sent, and
+        `next_seq_num` is the sequence number of the record that failed.
+        """
+        if self.node_id is None:
             raise InvalidNodeIdError()
-        msg = make_qmessage_from_proto(MessageType.STREAM, put_msg(data, seq_num, node_id))
-        self._client.send_message(msg)
+        if not self._client.is_connected() and not self._reconnects():
+            raise SocketClosedError()
+        encoder = self._encoders.get(self.node_id)
+        deliveries = []
+        for chunk in self._chunks(payloads):
+            with self._publish_lock:
+                out = bytearray()
+                # deliveries and frame offsets of the records encoded into out
+                encoded: List[Tuple[Delivery, int]] = []
+                try:
+                    for data in chunk:
+                        start = len(out)
+                        delivery = Delivery(self._seq_num, encoder.encode_into(out, data, self._seq_num),
+                                            self._responded, self._callbacks)
+                        if callback is not None:
+                            delivery.add_done_callback(callback)
+                        with self._responded:
+                            full = self._window_full(delivery.size)
+                        if encoded and full:
+                            # the window may wait for responses to the records encoded so far, so they are sent first
+                            self._queue_encoded(out[:start], encoded)
+                            del out[:start]
+                            encoded = []
+                            start = 0
+                            self._write_all()
+                        try:
+                            entered = self._enter_window(delivery)
+                        except Exception:
+                            del out[start:]
+                            raise
+                        if entered:
+                            encoded.append((delivery, start))
+                        else:
+                            del out[start:]
+                        self._seq_num += 1
+                        deliveries.append(delivery)
+                finally:
+                    self._queue_encoded(out, encoded)
+            self._write_queued()
+        return deliveries
+
+    def next_seq_num(self) -> int:
+        return self._seq_num
+
+    def _chunks(self, payloads: Iterable[Payload]) -> Iterator[List[Union[bytes, memoryview]]]:
+        # payloads are compressed before taking the publish lock
+        chunk, size = [], 0
+        for data in payloads:
+            data = payload_view(data)
+            if self._compressor is not None:
+                data = self._compressor.compress(data)
+            chunk.append(data)
+            size += len(data)
+            if size >= self.MANY_CHUNK_SIZE:
+                yield chunk
+                chunk, size = [], 0
+        if chunk:
+            yield chunk
+
+    def _queue_encoded(self, out: bytearray, encoded: List[Tuple[Delivery, int]]):
+        # queues frames encoded back to back into out, called with the publish lock held
+        if not encoded:
+            return
+        if self._accumulator is None and not self._replays:
+            self._pending.append(([out], len(encoded)))
+            return
+        view = memoryview(out)
+        for i, (delivery, start) in enumerate(encoded):
+            end = encoded[i + 1][1] if i + 1 < len(encoded) else len(out)
+            frame = [view[start:end]]
+            if self._replays:
+                delivery._frame = frame
+            if self._accumulator is not None:
+                self._accumulator.append(frame, delivery)
+        if self._accumulator is None:
+            self._pending.append(([out], len(encoded)))
+
+    def _write_queued(self):
+        # whichever thread takes the write lock writes for every thread that queued a frame meanwhile. a thread that
+        # finds it taken leaves its frame to the writer, which looks for new frames again after releasing the lock
+        while self._pending and self._write_lock.acquire(blocking=False):
+            try:
+                self._write_pending()
+            finally:
+                self._write_lock.release()
+
+    def _write_all(self):
+        # writes every queued frame before returning
+        if self._accumulator is not None:
+            self._accumulator.flush()
+        self._write_lock.acquire()
+        try:
+            self._write_pending()
+        finally:
+            self._release_write_lock()
+
+    def _release_write_lock(self):
+        # publishers that found the lock taken left their frames to the holder, which may not be in _write_queued
+        self._write_lock.release()
+        try:
+            self._write_queued()
+        except (SocketClosedError, SocketWriteError) as err:
+            # the records of those frames are failed, and their publishers see it through their deliveries
+            self.logger.error(err)
+
+    def _write_pending(self):
+        # called with the write lock held
+        frames, count = [], 0
+        try:
+            while True:
+                frame, records = self._pending.popleft()
+                frames.append(frame)
+                count += records
+        except IndexError:
+            pass
+        if frames:
+            self._write(frames, False, count)
+
+    def _send_batch(self, frames: List[Frame]):
+        # sends a batch of the background sender
+        with self._write_lock:
+            self._write(frames, True, len(frames))
+
+    def _write(self, frames: List[Frame], flush: bool, count: int):
+        # called with the write lock held
+        with self._responded:
+            first = len(self._in_flight) - self._unsent
+            self._unsent -= count
+            # once records are spilled, later ones follow them into the log until it is sent
+            if self._spill is not None and (self._spilled > 0 or not self._client.is_connected()) and \
+                    self._reconnects():
+                spilled = list(islice(self._in_flight, first, first + count))
+            else:
+                spilled = None
+        if spilled is not None:
+            self._write_spill(spilled)
+            return
+        try:
+            self._client.send_batch(frames, flush, count)
+        except (SocketClosedError, SocketWriteError) as err:
+            # frames of other publishers may be lost or cut short, and the broker can not read past a partial frame
+            self._client.close()
+            if self._reconnects():
+                # the frames are sent again once the connection is back
+                return
+            self._fail_in_flight(err)
+            raise
+
+    def _write_spill(self, deliveries: List[Delivery]):
+        # moves the frames of records written while the connection is down to the spill log.
+        # called with the write lock held. the writing thread may write for other publishers, so records that do not
+        # fit fail through their deliveries only
+        spilled = 0
+        try:
+            for delivery in deliveries:
+                self._spill.append(delivery._frame)
+                delivery._frame = None
+                spilled += 1
+        except SpillFullError as err:
+            self.logger.error(err)
+            # the records left out fail, so the spilled records stay next to each other in flight
+            failed = deliveries[spilled:]
+            with self._responded:
+                for delivery in failed:
+                    self._in_flight.remove(delivery)
+                    self._in_flight_bytes -= delivery.size
+                self._window.spill_failed += len(failed)
+                now = time.monotonic()
+                with_callbacks = [delivery for delivery in failed if delivery._resolve(None, err, now)]
+                self._responded.notify_all()
+            if with_callbacks:
+                self._callbacks.schedule(with_callbacks)
+        finally:
+            with self._responded:
+                self._spilled += spilled
+
+    def _window_full(self, size: int) -> bool:
+        # called with the responded condition held
+        max_records, max_bytes = self.config.get_max_in_flight(), self.config.get_max_in_flight_bytes()
+        if max_records > 0 and len(self._in_flight) >= max_records:
+            return True
+        # a record larger than the window is let in when nothing else is in flight
+        return max_bytes > 0 and self._in_flight_bytes > 0 and self._in_flight_bytes + size > max_bytes
+
+    def _enter_window(self, delivery: Delivery) -> bool:
+        # adds the delivery to the records in flight, making room by the window policy.
+        # returns False if the record itself was dropped
+        dropped: List[Delivery] = []
+        try:
+            with self._responded:
+                if self._window_full(delivery.size):
+                    policy = self.config.get_in_flight_policy()
+                    if policy == QConfig.RAISE:
+                        self._window.rejected += 1
+                        raise WindowFullError()
+                    elif policy == QConfig.DROP_OLDEST:
+                        while self._window_full(delivery.size):
+                            oldest = self._accumulator.drop_oldest() if self._accumulator is not None else None
+                            if oldest is None:
+                                # every record in flight is sent already
+                                dropped.append(delivery)
+                                break
+                            self._in_flight.remove(oldest)
+                            self._in_flight_bytes -= oldest.size
+                            self._unsent -= 1
+                            dropped.append(oldest)
+                        self._window.dropped += len(dropped)
+                        if dropped and dropped[-1] is delivery:
+                            return False
+                    else:
+                        self._window.waits += 1
+                        if not self._responded.wait_for(lambda: not self._window_full(delivery.size) or
+                                                        not self._client.is_connected() and not self._reconnects(),
+                                                        self.config.get_timeout() / 1000):
+                            self._window.rejected += 1
+                            raise WindowFullError()
+                        if not self._client.is_connected() and not self._reconnects():
+                            raise SocketClosedError()
+                self._in_flight.append(delivery)
+                self._in_flight_bytes += delivery.size
+                self._unsent += 1
+                return True
+        finally:
+            if dropped:
+                now = time.monotonic()
+                with self._responded:
+                    with_callbacks = [record for record in dropped if record._resolve(None, RecordDroppedError(), now)]
+                    self._responded.notify_all()
+                if with_callbacks:
+                    self._callbacks.schedule(with_callbacks)
 
     def _receive_message(self):
         try:
-            for received in self._client.continuous_receive():
-                self._handle_message(received)
-        except SocketClosedError:
+            while True:
+                try:
+                    for received in self._client.continuous_receive():
+                        self._handle_message(received)
+                except (SocketClosedError, SocketReadError):
+                    pass
+                if self._client.is_connected() or not self._reconnect():
+                    return
+        finally:
+            # responses will not arrive any more. the receive may also end for the connection to go back to a pool
+            if self._client.is_connected():
+                with self._responded:
+                    self._responded.notify_all()
+            else:
+                self._fail_in_flight(SocketClosedError())
+
+    def _reconnects(self) -> bool:
+        # whether a lost connection is going to be reconnected
+        return self._replays and not self._closed.is_set()
+
+    def _reconnect(self) -> bool:
+        # connects again with exponential backoff. returns whether the connection is back, with the records in flight
+        # being sent again on a thread of its own, so their responses are received meanwhile
+        if not self._reconnects():
+            return False
+        lost_at = time.monotonic()
+        deadline = lost_at + self.config.get_reconnect_timeout_ms() / 1000
+        backoff = self.config.get_reconnect_backoff_ms() / 1000
+        while not self._closed.wait(backoff):
+            # held until the records are sent again, so no publisher writes ahead of them. the resending thread
+            # releases it
+            self._write_lock.acquire()
+            try:
+                self._client.connect(SessionType.PUBLISHER, self.topic, self._host)
+            except Exception as err:
+                self._client.close()
+                self._release_write_lock()
+                self.logger.error('reconnect failed: {}'.format(err))
+                if time.monotonic() + backoff >= deadline:
+                    self._closed.set()
+                    self.logger.error('gave up reconnecting after {:.3f}s'.format(time.monotonic() - lost_at))
+                    return False
+                backoff = min(backoff * 2, self.config.get_reconnect_backoff_max_ms() / 1000)
+                continue
+            if self._closed.is_set():
+                self._client.close()
+                self._release_write_lock()
+                return False
+            threading.Thread(target=self._resend, args=(lost_at,), name='shapleq-resend', daemon=True).start()
+            return True
+        return False
+
+    def _resend(self, lost_at: float):
+        # sends the records in flight again after a reconnect, then releases the write lock taken by _reconnect
+        try:
+            replayed = self._replay()
+            drained = self._drain_spill()
+            # records published while the connection was down and not taken by a writer yet
+            self._write_pending()
+        except (SocketClosedError, SocketWriteError) as err:
+            # the records are sent again on the next connection
+            self._client.close()
+            self.logger.error('sending records again failed: {}'.format(err))
             return
+        finally:
+            self._release_write_lock()
+        self.logger.info('reconnected after {:.3f}s, sent {} records again and {} spilled records'.format(
+            time.monotonic() - lost_at, replayed, drained))
 
-    def _handle_message(self, msg: QMessage):
+    def _replay(self) -> int:
+        # sends the records taken by writers but not responded to again, in publish order, and returns their count.
+        # called with the write lock held, so the records in flight change only by responses to the oldest ones and
+        # by publishers adding unsent ones
+        with self._responded:
+            sent = list(islice(self._in_flight, len(self._in_flight) - self._unsent - self._spilled))
+        if sent:
+            self._client.send_batch([delivery._frame for delivery in sent], True, len(sent))
+        return len(sent)
 
-        if (put_response := msg.unpack_to(PutResponse())) is not None:
-            self.logger.debug('received response - partition id: {}, partition offset: {}'.format(
-                put_response.partition.partition_id, put_response.partition.offset))
-        elif (ack := msg.unpack_to(Ack())) is not None:
-            raise RequestFailedError(msg=ack.msg)
+    def _drain_spill(self) -> int:
+        # sends the spilled records in batches, in order, and returns their count. called like _replay, after it
+        drained = 0
+        while self._spill is not None and (frames := self._spill.read(self.SPILL_DRAIN_BYTES)):
+            with self._responded:
+                first = len(self._in_flight) - self._unsent - self._spilled
+                deliveries = list(islice(self._in_flight, first, first + len(frames)))
+                self._spilled -= len(frames)
+            for delivery, frame in zip(deliveries, frames):
+                # kept until the response arrives, to be sent again if the connection is lost once more
+                delivery._frame = [frame]
+            self._client.send_batch([delivery._frame for delivery in deliveries], True, len(deliveries))
+            drained += len(deliveries)
+        return drained
+
+    def _handle_message(self, msg: QMessage):
+        received = self._MESSAGES.decode(msg)
+        if isinstance(received, PutResponse):
+            self._client.frame_log.debug('received response - partition id: %d, partition offset: %d',
+                                         received.partition.partition_id, received.partition.offset)
+            self._resolve(received.partition, None)
+        elif isinstance(received, Ack):
+            # the broker rejected the record. its delivery fails, and later records are still received
+            self.logger.error('publish failed: {}'.format(received.msg))
+            self._resolve(None, RequestFailedError(msg=received.msg))
         else:
             raise InvalidMessageError()
+
+    def _resolve(self, partition: Optional[Partition], error: Optional[Exception]):
+        # responses come in publish order, so each one is for the oldest record in flight
+        with self._responded:
+            if not self._in_flight:
+                self.logger.error('received a response to no published record')
+                return
+            delivery = self._in_flight.popleft()
+            self._in_flight_bytes -= delivery.size
+            has_callbacks = delivery._resolve(partition, error, time.monotonic())
+            self._responded.notify_all()
+        if has_callbacks:
+            self._callbacks.schedule([delivery])
@@ -0,0 +1,480 @@
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection, wait
+from typing import Callable, Deque, Iterable, List, Optional, Tuple, Union
+from shapleqclient.base import QConfig, make_zk_client, resolve_broker
+from shapleqclient.common import exception
+from shapleqclient.common.exception import BufferFullError, ClientConnectionError, RequestFailedError, \
+    SocketClosedError
+from shapleqclient.delivery import CallbackDispatcher, Delivery
+from shapleqclient.message.encoder import Payload, PutRequestEncoder, payload_view
+from shapleqclient.producer import Producer
+from shapleqclient.proto.data_pb2 import Partition, PUBLISHER
+from shapleqclient.zk_client import ZKClient
+
+# a ring is a shared memory block starting with the total bytes the parent wrote and the worker consumed, followed
+# by the records. a record is its length, 4 bytes of padding and its sequence number, then the payload padded to
+# 8 bytes. a record that does not fit before the end of the ring starts over at the beginning, after a wrap marker
+_COUNTERS = struct.Struct('<QQ')
+_HEAD = struct.Struct('<Q')
+_TAIL_OFFSET = 8
+_DATA_OFFSET = 64
+_LENGTH = struct.Struct('<i')
+_SEQ_NUM = struct.Struct('<q')
+_RECORD_HEADER_SIZE = 16
+_WRAP = -1
+_STOP = -2
+
+# partition id, offset, and the exception class name and message of a failed record
+_Result = Tuple[int, int, Optional[str], Optional[str]]
+
+
+def _record_size(length: int) -> int:
+    return _RECORD_HEADER_SIZE + ((length + 7) & ~7)
+
+
+def _rebuild_error(name: str, msg: str) -> Exception:
+    # exceptions of common.exception take their message as msg, if any
+    cls = getattr(exception, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        return RequestFailedError(msg='{}: {}'.format(name, msg))
+    try:
+        return cls(msg=msg)
+    except TypeError:
+        return cls()
+
+
+class _Worker:
+    """The parent's side of a worker process: its ring, semaphores, result pipe and deliveries."""
+    index: int
+    capacity: int
+    process: Optional[multiprocessing.Process]
+    # cleared once the worker's pipe ended
+    alive: bool
+    shm: shared_memory.SharedMemory
+    # released by the parent when records are written, and by the worker when it consumed records
+    items: multiprocessing.Semaphore
+    space: multiprocessing.Semaphore
+    conn: Connection
+    # deliveries of the records handed to the worker and not resolved yet, in ring order
+    deliveries: Deque[Delivery]
+    # taken to write to the ring, so records and deliveries are in the same order
+    lock: threading.Lock
+    _head: int
+
+    def __init__(self, index: int, capacity: int, ctx):
+        self.index = index
+        self.capacity = capacity
+        self.process = None
+        self.alive = False
+        self.shm = shared_memory.SharedMemory(create=True, size=_DATA_OFFSET + capacity)
+        _COUNTERS.pack_into(self.shm.buf, 0, 0, 0)
+        self.items = ctx.Semaphore(0)
+        self.space = ctx.Semaphore(0)
+        self.deliveries = deque()
+        self.lock = threading.Lock()
+        self._head = 0
+
+    def reserve(self, length: int, deadline: float):
+        # called with the lock held. waits until the ring has space for a record of `length` bytes, which stays
+        # free for the next write since only the parent writes
+        size = _record_size(max(length, 0))
+        if size > self.capacity:
+            raise ValueError("record of {} bytes does not fit the ring".format(length))
+        while self.capacity - (self._head - self._tail()) < self._skip(size) + size:
+            # the worker releases space after consuming records; stale releases only cost a check
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.space.acquire(timeout=remaining):
+                if self.capacity - (self._head - self._tail()) >= self._skip(size) + size:
+                    break
+                raise BufferFullError(msg="ring of producer process {} is full".format(self.index))
+
+    def put(self, data: Union[bytes, memoryview], seq_num: int):
+        # called with the lock held, after reserving space. the worker is signaled by the caller
+        self._write(len(data), seq_num, data)
+
+    def put_stop(self, deadline: float):
+        self.reserve(0, deadline)
+        self._write(_STOP, 0, None)
+        self.items.release()
+
+    def _skip(self, size: int) -> int:
+        pos = self._head % self.capacity
+        return self.capacity - pos if self.capacity - pos < size else 0
+
+    def _write(self, length: int, seq_num: int, data: Optional[Union[bytes, memoryview]]):
+        size = _record_size(max(length, 0))
+        pos = self._head % self.capacity
+        skip = self._skip(size)
+        buf = self.shm.buf
+        if skip > 0:
+            _LENGTH.pack_into(buf, _DATA_OFFSET + pos, _WRAP)
+            self._head += skip
+            pos = 0
+        start = _DATA_OFFSET + pos
+        _LENGTH.pack_into(buf, start, length)
+        _SEQ_NUM.pack_into(buf, start + 8, seq_num)
+        if data is not None:
+            buf[start + _RECORD_HEADER_SIZE:start + _RECORD_HEADER_SIZE + length] = data
+        self._head += size
+        # the semaphore released afterwards makes the record visible to the worker before the head
+        _HEAD.pack_into(buf, 0, self._head)
+
+    def _tail(self) -> int:
+        return _HEAD.unpack_from(self.shm.buf, _TAIL_OFFSET)[0]
+
+    def close(self):
+        self.conn.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ProducerPool:
+    """Producers in worker processes, fed with records through shared memory rings.
+
+    Encoding and checksumming records is CPU work under the GIL, so one
+    process can publish only so fast. A pool runs `processes` worker
+    processes, each with a `Producer` of its own connection, and hands
+    records to them round robin. The parent copies each payload once, into
+    the ring of a worker; payloads are not pickled. Each worker reports the
+    responses to its records back through a pipe, all responses that arrived
+    since its last report in one message, and the parent resolves the
+    deliveries `publish` returned. Workers of a config that reconnects copy
+    each payload once more, since their producers keep records in flight to
+    send them again.
+
+    The broker is looked up once, in the parent. Records take the pool's
+    node id and sequence numbers from its counter, as they are written to a
+    ring. Records of different workers may reach the broker in any order,
+    while the records of one worker keep the order of their numbers.
+
+    Publishing into a full ring waits up to the config timeout and then
+    raises `BufferFullError`. Workers are started with the spawn method,
+    since forking a process with running threads can leave locks held in
+    the child.
+    """
+    DEFAULT_RING_SIZE = 4 * 1024 * 1024
+
+    config: QConfig
+    topic: str
+    logger: logging.Logger
+    node_id: str
+    processes: int
+    ring_size: int
+    _zk_client: ZKClient
+    _workers: List[_Worker]
+    _next_worker: int
+    _seq_num: int
+    # taken to choose a worker and, within the worker's lock, to number a record
+    _lock: threading.Lock
+    _resolved: threading.Condition
+    _callbacks: CallbackDispatcher
+    _results: Optional[threading.Thread]
+
+    def __init__(self, config: QConfig, topic: str, logger: logging.Logger, node_id: str, processes: int,
+                 first_seq_num: int = 0, ring_size: int = DEFAULT_RING_SIZE):
+        if processes < 1:
+            raise ValueError("processes should be at least 1")
+        # the node id is checked here rather than in every worker
+        PutRequestEncoder(node_id)
+        self.config = config
+        self.topic = topic
+        self.logger = logger
+        self.node_id = node_id
+        self.processes = processes
+        self.ring_size = ring_size & ~7
+        self._zk_client = make_zk_client(config)
+        self._workers = []
+        self._next_worker = 0
+        self._seq_num = first_seq_num
+        self._lock = threading.Lock()
+        self._resolved = threading.Condition()
+        self._callbacks = CallbackDispatcher(logger)
+        self._results = None
+
+    def setup(self):
+        address = resolve_broker(self._zk_client, PUBLISHER, self.topic)
+        self._zk_client.close()
+        ctx = multiprocessing.get_context('spawn')
+        try:
+            for index in range(self.processes):
+                worker = _Worker(index, self.ring_size, ctx)
+                self._workers.append(worker)
+                worker.conn, child_conn = ctx.Pipe(duplex=False)
+                worker.process = ctx.Process(target=_run_worker, name='shapleq-producer-{}'.format(index),
+                                             args=(self.config, self.topic, self.logger, address, self.node_id,
+                                                   worker.shm.name, self.ring_size, worker.items, worker.space,
+                                                   child_conn),
+                                             daemon=True)
+                worker.process.start()
+                worker.alive = True
+                # the parent keeps no copy of the worker's end, so the pipe ends when the worker does
+                child_conn.close()
+
+            # every worker reports whether it connected
+            for worker in self._workers:
+                if not worker.conn.poll(self.config.get_timeout() / 1000 + 30):
+                    raise ClientConnectionError("producer process {} did not start".format(worker.index))
+                if (failure := worker.conn.recv()) is not None:
+                    raise ClientConnectionError("producer process {} cannot connect: {}: {}".format(
+                        worker.index, *failure))
+        except BaseException:
+            self._terminate()
+            raise
+
+        self._results = threading.Thread(target=self._receive_results, name='shapleq-pool-results', daemon=True)
+        self._results.start()
+
+    def publish(self, data: Payload, callback: Optional[Callable[[Delivery], None]] = None) -> Delivery:
+        """Hands a record to a worker and returns its delivery. `data` is copied into the worker's ring."""
+        data = payload_view(data)
+        with self._lock:
+            worker = self._choose_worker()
+        delivery = self._put(worker, data, callback)
+        worker.items.release()
+        return delivery
+
+    def publish_many(self, payloads: Iterable[Payload],
+                     callback: Optional[Callable[[Delivery], None]] = None) -> List[Delivery]:
+        """Hands records to the workers in runs of consecutive records, signaling each worker once per run.
+
+        When a record does not fit its worker's ring in time, `BufferFullError` is raised; the records before
+        it were handed over and `next_seq_num` returns the sequence number the failed record would have taken.
+        """
+        deliveries = []
+        run_size = Producer.MANY_CHUNK_SIZE
+        payloads = iter(payloads)
+        while True:
+            run, size = [], 0
+            for data in payloads:
+                data = payload_view(data)
+                run.append(data)
+                size += len(data)
+                if size >= run_size:
+                    break
+            if not run:
+                return deliveries
+
+            with self._lock:
+                worker = self._choose_worker()
+            try:
+                for data in run:
+                    deliveries.append(self._put(worker, data, callback))
+            finally:
+                worker.items.release()
+
+    def next_seq_num(self) -> int:
+        return self._seq_num
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every record published so far is resolved. Returns False on timeout."""
+        with self._resolved:
+            return self._resolved.wait_for(lambda: all(not worker.deliveries for worker in self._workers), timeout)
+
+    def stop(self):
+        """Sends the records handed to the workers, waits for their responses and stops the workers."""
+        deadline = time.monotonic() + self.config.get_timeout() / 1000
+        for worker in self._workers:
+            if worker.alive:
+                with worker.lock:
+                    try:
+                        worker.put_stop(deadline)
+                    except BufferFullError as err:
+                        self.logger.error(err)
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(max(deadline - time.monotonic(), 0) + self.config.get_timeout() / 1000)
+        self._terminate()
+
+    def __enter__(self) -> 'ProducerPool':
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _choose_worker(self) -> _Worker:
+        worker = self._workers[self._next_worker]
+        self._next_worker = (self._next_worker + 1) % len(self._workers)
+        return worker
+
+    def _put(self, worker: _Worker, data: Union[bytes, memoryview],
+             callback: Optional[Callable[[Delivery], None]]) -> Delivery:
+        if not worker.alive:
+            raise SocketClosedError()
+        with worker.lock:
+            # numbered only once the ring has space, so a record that does not fit takes no sequence number, and
+            # numbered under the worker's lock, so the worker gets its records in the order of their numbers
+            worker.reserve(len(data), time.monotonic() + self.config.get_timeout() / 1000)
+            with self._lock:
+                seq_num = self._seq_num
+                self._seq_num += 1
+            worker.put(data, seq_num)
+            delivery = Delivery(seq_num, len(data), self._resolved, self._callbacks)
+            if callback is not None:
+                delivery.add_done_callback(callback)
+            with self._resolved:
+                worker.deliveries.append(delivery)
+        return delivery
+
+    def _receive_results(self):
+        workers = {worker.conn: worker for worker in self._workers}
+        while workers:
+            for conn in wait(list(workers)):
+                try:
+                    results = conn.recv()
+                except (EOFError, OSError):
+                    self._fail(workers.pop(conn))
+                    continue
+                self._resolve(workers[conn], results)
+
+    def _resolve(self, worker: _Worker, results: List[_Result]):
+        # a report resolves the oldest deliveries of the worker, under one lock and with one wakeup
+        now = time.monotonic()
+        with_callbacks = []
+        with self._resolved:
+            for partition_id, offset, error_name, error_msg in results:
+                if not worker.deliveries:
+                    self.logger.error('producer process {} reported an unknown record'.format(worker.index))
+                    break
+                delivery = worker.deliveries.popleft()
+                if error_name is None:
+                    resolved = delivery._resolve(Partition(partition_id=partition_id, offset=offset), None, now)
+                else:
+                    resolved = delivery._resolve(None, _rebuild_error(error_name, error_msg), now)
+                if resolved:
+                    with_callbacks.append(delivery)
+            self._resolved.notify_all()
+        if with_callbacks:
+            self._callbacks.schedule(with_callbacks)
+
+    def _fail(self, worker: _Worker):
+        # the worker ended; its records not reported will not be
+        worker.alive = False
+        with self._resolved:
+            failed, worker.deliveries = list(worker.deliveries), deque()
+            now = time.monotonic()
+            with_callbacks = [delivery for delivery in failed if delivery._resolve(None, SocketClosedError(), now)]
+            self._resolved.notify_all()
+        if with_callbacks:
+            self._callbacks.schedule(with_callbacks)
+
+    def _terminate(self):
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+        if self._results is not None:
+            self._results.join()
+        for worker in self._workers:
+            self._fail(worker)
+            worker.close()
+        self._workers = []
+        self._callbacks.close()
+
+
+def _run_worker(config: QConfig, topic: str, logger: logging.Logger, address: str, node_id: str, shm_name: str,
+                capacity: int, items, space, conn: Connection):
+    # spawned processes share the resource tracker of the parent, which unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    producer = Producer(config, topic, logger, node_id=node_id)
+    try:
+        producer.setup(address)
+    except Exception as err:
+        conn.send((type(err).__name__, str(err)))
+        conn.close()
+        shm.close()
+        return
+    conn.send(None)
+    # a reconnecting producer keeps the frames of records in flight to send them again, after their space in the
+    # ring is released, so it publishes copies
+    copies = config.get_reconnect_backoff_ms() > 0
+
+    # deliveries, or errors of records that could not be published, in ring order. None ends the reports
+    pending: Deque[Union[Delivery, Exception, None]] = deque()
+    cond = threading.Condition()
+    reporter = threading.Thread(target=_report, args=(pending, cond, conn), name='shapleq-pool-report')
+    reporter.start()
+
+    buf = shm.buf
+    data = None
+    tail = 0
+    stopped = False
+    try:
+        while not stopped:
+            items.acquire()
+            head = _HEAD.unpack_from(buf, 0)[0]
+            while tail < head:
+                pos = tail % capacity
+                start = _DATA_OFFSET + pos
+                length = _LENGTH.unpack_from(buf, start)[0]
+                if length == _WRAP:
+                    tail += capacity - pos
+                    continue
+                if length == _STOP:
+                    tail += _RECORD_HEADER_SIZE
+                    stopped = True
+                    break
+
+                seq_num = _SEQ_NUM.unpack_from(buf, start + 8)[0]
+                data = buf[start + _RECORD_HEADER_SIZE:start + _RECORD_HEADER_SIZE + length]
+                try:
+                    published = producer.publish(bytes(data) if copies else data, seq_num, node_id)
+                except Exception as err:
+                    published = err
+                with cond:
+                    pending.append(published)
+                    cond.notify()
+                tail += _record_size(length)
+
+            # records are referenced by the producer until written, so their space is released afterwards
+            try:
+                producer.flush()
+            except Exception as err:
+                logger.error(err)
+            _HEAD.pack_into(buf, _TAIL_OFFSET, tail)
+            space.release()
+    finally:
+        with cond:
+            pending.append(None)
+            cond.notify()
+        reporter.join()
+        producer.stop()
+        conn.close()
+        # the last record's slice exports the block too
+        del data, buf
+        shm.close()
+
+
+def _report(pending: Deque[Union[Delivery, Exception, None]], cond: threading.Condition, conn: Connection):
+    # deliveries resolve in order, so after waiting for the oldest, every resolved one after it is sent along
+    while True:
+        with cond:
+            cond.wait_for(lambda: pending)
+            oldest = pending[0]
+        if oldest is None:
+            return
+        if isinstance(oldest, Delivery):
+            oldest.exception()
+
+        results = []
+        with cond:
+            while pending and pending[0] is not None and \
+                    (not isinstance(pending[0], Delivery) or pending[0].done()):
+                results.append(_result(pending.popleft()))
+        try:
+            conn.send(results)
+        except OSError:
+            return
+
+
+def _result(published: Union[Delivery, Exception]) -> _Result:
+    error = published if isinstance(published, Exception) else published.exception()
+    if error is not None:
+        return 0, 0, type(error).__name__, str(error)
+    partition = published.result()
+    return partition.partition_id, partition.offset, None, None
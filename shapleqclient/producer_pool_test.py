@@ -0,0 +1,144 @@
+import array
+import logging
+import os
+import signal
+import threading
+import unittest
+from shapleqclient.base import QConfig
+from shapleqclient.common.exception import BufferFullError, ClientConnectionError, InvalidNodeIdError
+from shapleqclient.delivery import Delivery
+from shapleqclient.producer_pool import ProducerPool
+from shapleqclient.testing import FakeBroker, FakeZKClient
+
+
+class ProducerPoolTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+    topic = "test_topic"
+    node_id = "0" * 32
+
+    def setUp(self):
+        self.broker = FakeBroker()
+
+    def tearDown(self):
+        self.broker.close()
+
+    def make_pool(self, processes: int, ring_size: int = ProducerPool.DEFAULT_RING_SIZE,
+                  config: QConfig = None) -> ProducerPool:
+        config = config or QConfig()
+        config.zk_client_factory = FakeZKClient.factory([self.broker.address])
+        pool = ProducerPool(config, self.topic, self.logger, self.node_id, processes, ring_size=ring_size)
+        pool.setup()
+        return pool
+
+    def test_records_are_published_by_every_process(self):
+        pool = self.make_pool(2)
+        acked = []
+        done = threading.Event()
+
+        def callback(delivery: Delivery):
+            acked.append(delivery.seq_num)
+            if len(acked) == 1001:
+                done.set()
+
+        payloads = [b'record %d' % i for i in range(1000)]
+        deliveries = pool.publish_many(payloads, callback)
+        deliveries.append(pool.publish(array.array('d', [1.0, 2.0]), callback))
+        self.assertTrue(pool.wait(timeout=30))
+        self.assertTrue(done.wait(5))
+        pool.stop()
+
+        records = self.broker.records(self.topic)
+        by_seq_num = {record.seq_num: record.data for record in records}
+        self.assertEqual(1001, len(records))
+        self.assertEqual(payloads + [array.array('d', [1.0, 2.0]).tobytes()], [by_seq_num[i] for i in range(1001)])
+        # each delivery resolved with the offset of its own record
+        for delivery in deliveries:
+            self.assertEqual(delivery.seq_num, records[delivery.result().offset].seq_num)
+        self.assertEqual(list(range(1001)), sorted(acked))
+        self.assertEqual(1001, pool.next_seq_num())
+
+    def test_ring_wraps_around(self):
+        pool = self.make_pool(1, ring_size=4096)
+        payloads = [bytes([i % 256]) * (100 + i % 700) for i in range(200)]
+        for payload in payloads:
+            pool.publish(payload)
+        self.assertTrue(pool.wait(timeout=30))
+        pool.stop()
+
+        self.assertEqual(payloads, [record.data for record in self.broker.records(self.topic)])
+
+    def test_stop_sends_handed_records(self):
+        pool = self.make_pool(2)
+        deliveries = pool.publish_many([b'data'] * 100)
+        pool.stop()
+
+        self.assertEqual(100, len(self.broker.records(self.topic)))
+        self.assertTrue(all(delivery.exception(timeout=0) is None for delivery in deliveries))
+
+    def test_concurrent_records_of_a_worker_keep_their_order(self):
+        pool = self.make_pool(1, ring_size=4096)
+
+        def publish():
+            for _ in range(500):
+                pool.publish(b'x' * 100)
+
+        threads = [threading.Thread(target=publish) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(pool.wait(timeout=30))
+        pool.stop()
+
+        self.assertEqual(list(range(2000)), [record.seq_num for record in self.broker.records(self.topic)])
+
+    def test_full_ring_takes_no_seq_num(self):
+        pool = self.make_pool(1, ring_size=4096, config=QConfig(timeout=300))
+        pid = pool._workers[0].process.pid
+        os.kill(pid, signal.SIGSTOP)
+        try:
+            with self.assertRaises(BufferFullError):
+                pool.publish_many([b'y' * 100] * 100)
+        finally:
+            os.kill(pid, signal.SIGCONT)
+        written = pool.next_seq_num()
+        self.assertGreater(written, 0)
+        self.assertLess(written, 100)
+
+        pool.publish(b'after')
+        self.assertTrue(pool.wait(timeout=30))
+        pool.stop()
+
+        records = self.broker.records(self.topic)
+        self.assertEqual(list(range(written + 1)), [record.seq_num for record in records])
+        self.assertEqual(b'after', records[-1].data)
+
+    def test_reconnecting_worker_replays_its_own_copies(self):
+        pool = self.make_pool(1, ring_size=4096, config=QConfig(reconnect_backoff_ms=50))
+        pool.publish(b'first')
+        self.assertTrue(pool.wait(timeout=30))
+        self.broker.drop_connections()
+        # the ring is written over many times while the worker reconnects
+        payloads = [bytes([i % 256]) * (100 + i % 300) for i in range(300)]
+        deliveries = [pool.publish(payload) for payload in payloads]
+        self.assertTrue(pool.wait(timeout=30))
+        pool.stop()
+
+        self.assertTrue(all(delivery.exception(timeout=0) is None for delivery in deliveries))
+        by_seq_num = {record.seq_num: record.data for record in self.broker.records(self.topic)}
+        self.assertEqual(payloads, [by_seq_num[i + 1] for i in range(300)])
+
+    def test_worker_connect_failure_is_raised(self):
+        self.broker.close()
+        config = QConfig(timeout=500, zk_client_factory=FakeZKClient.factory([self.broker.address]))
+        pool = ProducerPool(config, self.topic, self.logger, self.node_id, 1)
+        with self.assertRaises(ClientConnectionError):
+            pool.setup()
+
+    def test_invalid_node_id(self):
+        with self.assertRaises(InvalidNodeIdError):
+            ProducerPool(QConfig(), self.topic, self.logger, 'short', 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,392 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import Callable
+from shapleqclient.base import QConfig
+from shapleqclient.common.exception import RequestFailedError, SocketClosedError, WindowFullError, \
+    RecordDroppedError, InvalidNodeIdError, SpillFullError
+from shapleqclient.delivery import Delivery
+from shapleqclient.producer import Producer
+from shapleqclient.pool import ConnectionPool
+from shapleqclient.testing import FakeBroker, FakeZKClient
+
+
+class ProducerTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+    topic = "test_topic"
+    node_id = "0" * 32
+
+    def setUp(self):
+        self.broker = FakeBroker()
+
+    def tearDown(self):
+        self.broker.close()
+
+    def make_producer(self, config: QConfig, **producer_kwargs) -> Producer:
+        # brokers are looked up in self.zk_client, which tests may point at another broker
+        self.zk_client = FakeZKClient([self.broker.address])
+        config.zk_client_factory = lambda: self.zk_client
+        producer = Producer(config, self.topic, self.logger, **producer_kwargs)
+        producer.setup()
+        return producer
+
+    @staticmethod
+    def wait_until(condition: Callable[[], bool], timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def wait_records(self, count: int):
+        self.wait_until(lambda: len(self.broker.records(self.topic)) >= count)
+        return self.broker.records(self.topic)
+
+    def test_batched_publish_writes_frames_together(self):
+        producer = self.make_producer(QConfig(batch_bytes=64 * 1024, linger_ms=60 * 1000))
+        # leave out the stream handshake
+        producer.metrics().reset()
+        for seq in range(100):
+            producer.publish(b'data', seq, self.node_id)
+        self.assertEqual(0, producer.metrics().send_calls)
+
+        producer.flush()
+        metrics = producer.metrics()
+        records = self.wait_records(100)
+        producer.stop()
+
+        self.assertEqual((100, 1), (metrics.frames_sent, metrics.send_calls))
+        self.assertEqual(list(range(100)), [record.seq_num for record in records])
+
+    def test_stop_drains_batched_records(self):
+        producer = self.make_producer(QConfig(batch_bytes=64 * 1024, linger_ms=60 * 1000))
+        for seq in range(10):
+            producer.publish(b'data', seq, self.node_id)
+        producer.stop()
+
+        self.assertEqual(list(range(10)), [record.seq_num for record in self.wait_records(10)])
+
+    def test_deliveries_resolve_in_publish_order(self):
+        producer = self.make_producer(QConfig())
+        acked = []
+        done = threading.Event()
+
+        def callback(delivery: Delivery):
+            acked.append((delivery.seq_num, delivery.result().offset))
+            if len(acked) == 50:
+                done.set()
+
+        deliveries = [producer.publish(b'data', seq, self.node_id, callback) for seq in range(50)]
+        producer.flush()
+
+        self.assertEqual(list(range(50)), [delivery.result(timeout=5).offset for delivery in deliveries])
+        self.assertTrue(done.wait(5))
+        self.assertEqual([(seq, seq) for seq in range(50)], acked)
+        self.assertTrue(all(delivery.latency() >= 0 for delivery in deliveries))
+        producer.stop()
+
+    def test_rejected_record_fails_its_delivery(self):
+        producer = self.make_producer(QConfig())
+        self.broker.put_error = "rejected"
+        rejected = producer.publish(b'data', 0, self.node_id)
+        producer.flush()
+        self.assertIsInstance(rejected.exception(timeout=5), RequestFailedError)
+
+        # the producer keeps receiving responses after a rejection
+        self.broker.put_error = None
+        accepted = producer.publish(b'data', 1, self.node_id)
+        producer.flush()
+        self.assertEqual(0, accepted.result(timeout=5).offset)
+        producer.stop()
+
+    def test_stop_fails_records_in_flight(self):
+        producer = self.make_producer(QConfig())
+        self.broker.put_delay = 0.5
+        delivery = producer.publish(b'data', 0, self.node_id)
+        producer.flush()
+        producer.stop()
+
+        self.assertIsInstance(delivery.exception(timeout=5), SocketClosedError)
+
+    def test_full_window_raises(self):
+        producer = self.make_producer(QConfig(max_in_flight=2, in_flight_policy=QConfig.RAISE))
+        self.broker.put_delay = 0.2
+        first = producer.publish(b'data', 0, self.node_id)
+        producer.publish(b'data', 1, self.node_id)
+        with self.assertRaises(WindowFullError):
+            producer.publish(b'data', 2, self.node_id)
+
+        stats = producer.window_stats()
+        self.assertEqual((2, 1), (stats.records, stats.rejected))
+        self.assertGreater(stats.bytes, 0)
+        first.result(timeout=5)
+        producer.stop()
+
+    def test_full_window_blocks_until_acked(self):
+        producer = self.make_producer(QConfig(max_in_flight_bytes=1, in_flight_policy=QConfig.BLOCK))
+        self.broker.put_delay = 0.01
+        deliveries = [producer.publish(b'data', seq, self.node_id) for seq in range(5)]
+        # each record fills the window, so each publish waited for the previous response
+        self.assertEqual(4, producer.window_stats().waits)
+        self.assertEqual(list(range(5)), [delivery.result(timeout=5).offset for delivery in deliveries])
+        self.assertEqual((0, 0), (producer.window_stats().records, producer.window_stats().bytes))
+        producer.stop()
+
+    def test_full_window_blocks_up_to_timeout(self):
+        producer = self.make_producer(QConfig(timeout=100, max_in_flight=1))
+        self.broker.put_delay = 0.5
+        producer.publish(b'data', 0, self.node_id)
+        with self.assertRaises(WindowFullError):
+            producer.publish(b'data', 1, self.node_id)
+        producer.stop()
+
+    def test_full_window_drops_oldest_queued_records(self):
+        producer = self.make_producer(QConfig(batch_bytes=64 * 1024, linger_ms=60 * 1000, max_in_flight=3,
+                                              in_flight_policy=QConfig.DROP_OLDEST))
+        deliveries = [producer.publish(b'data', seq, self.node_id) for seq in range(5)]
+        producer.flush()
+
+        self.assertEqual([2, 3, 4], [record.seq_num for record in self.wait_records(3)])
+        for delivery in deliveries[:2]:
+            self.assertIsInstance(delivery.exception(timeout=5), RecordDroppedError)
+        self.assertEqual(2, producer.window_stats().dropped)
+        producer.stop()
+
+    def test_full_window_drops_new_record_when_all_are_sent(self):
+        producer = self.make_producer(QConfig(max_in_flight=1, in_flight_policy=QConfig.DROP_OLDEST))
+        self.broker.put_delay = 0.2
+        sent = producer.publish(b'data', 0, self.node_id)
+        dropped = producer.publish(b'data', 1, self.node_id)
+
+        self.assertIsInstance(dropped.exception(timeout=0), RecordDroppedError)
+        self.assertEqual(0, sent.result(timeout=5).offset)
+        producer.stop()
+
+    def test_concurrent_publishers(self):
+        # large frames and a small send buffer make partial writes likely
+        producer = self.make_producer(QConfig(send_buffer_size=4096))
+        threads, per_thread = 32, 100
+        published = {}
+        start = threading.Barrier(threads)
+
+        def publish(index: int):
+            start.wait()
+            for i in range(per_thread):
+                data = bytes([index]) * (1024 + i * 37) + b'%d:%d' % (index, i)
+                delivery = producer.publish(data, index * per_thread + i, self.node_id)
+                published[(index, i)] = (data, delivery)
+
+        workers = [threading.Thread(target=publish, args=(index,)) for index in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        producer.flush()
+
+        records = self.wait_records(threads * per_thread)
+        self.assertEqual(threads * per_thread, len(records))
+        for (index, i), (data, delivery) in published.items():
+            # every frame arrived whole, and each delivery resolved with the offset of its own record
+            record = records[delivery.result(timeout=5).offset]
+            self.assertEqual((data, index * per_thread + i), (record.data, record.seq_num))
+        for index in range(threads):
+            seq_nums = [record.seq_num for record in records if record.seq_num // per_thread == index]
+            self.assertEqual(sorted(seq_nums), seq_nums)
+        producer.stop()
+
+    def test_publish_while_flushing(self):
+        producer = self.make_producer(QConfig())
+        published = threading.Event()
+
+        def flush():
+            while not published.is_set():
+                producer.flush()
+
+        flusher = threading.Thread(target=flush)
+        flusher.start()
+        try:
+            deliveries = [producer.publish(b'data', seq, self.node_id) for seq in range(2000)]
+        finally:
+            published.set()
+            flusher.join()
+
+        # no frame is left for a later publish or flush to write
+        self.assertEqual(0, len(producer._pending))
+        self.assertTrue(all(delivery.exception(timeout=5) is None for delivery in deliveries))
+        self.assertEqual(2000, len(self.wait_records(2000)))
+        producer.stop()
+
+    def test_reconnects_to_failover_broker(self):
+        producer = self.make_producer(QConfig(reconnect_backoff_ms=10))
+        standby = FakeBroker()
+        self.broker.put_delay = 0.5
+        deliveries = [producer.publish(b'data %d' % seq, seq, self.node_id) for seq in range(5)]
+        producer.flush()
+
+        # the broker fails before responding, and zookeeper names the standby
+        self.zk_client.brokers = [standby.address]
+        lost_at = time.monotonic()
+        self.broker.close()
+        offsets = [delivery.result(timeout=5).offset for delivery in deliveries]
+        recovery = time.monotonic() - lost_at
+
+        # records are sent again with their own sequence numbers, in order
+        self.assertEqual(list(range(5)), offsets)
+        self.assertEqual([(b'data %d' % seq, seq) for seq in range(5)],
+                         [(record.data, record.seq_num) for record in standby.records(self.topic)])
+        self.assertLess(recovery, 1.0)
+        self.assertEqual(5, producer.publish(b'data', 5, self.node_id).result(timeout=5).offset)
+        producer.stop()
+        standby.close()
+
+    def test_publishes_while_reconnecting(self):
+        producer = self.make_producer(QConfig(reconnect_backoff_ms=10, batch_bytes=1024, linger_ms=1))
+        # no broker listens on the standby's port until it starts
+        standby = FakeBroker()
+        port = int(standby.address.split(':')[1])
+        standby.close()
+        self.zk_client.brokers = [standby.address]
+        self.broker.close()
+        self.wait_until(lambda: not producer.is_connected())
+
+        deliveries = [producer.publish(b'data', seq, self.node_id) for seq in range(3)]
+        time.sleep(0.1)
+        standby = FakeBroker(port=port)
+        self.assertEqual([0, 1, 2], [delivery.result(timeout=5).offset for delivery in deliveries])
+        self.assertEqual([0, 1, 2], [record.seq_num for record in standby.records(self.topic)])
+        producer.stop()
+        standby.close()
+
+    def test_gives_up_reconnecting(self):
+        producer = self.make_producer(QConfig(reconnect_backoff_ms=10, reconnect_timeout_ms=100))
+        self.broker.put_delay = 0.5
+        delivery = producer.publish(b'data', 0, self.node_id)
+        producer.flush()
+        self.broker.close()
+
+        self.assertIsInstance(delivery.exception(timeout=5), SocketClosedError)
+        with self.assertRaises(SocketClosedError):
+            producer.publish(b'data', 1, self.node_id)
+        producer.stop()
+
+    def test_spills_records_while_disconnected(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            producer = self.make_producer(QConfig(reconnect_backoff_ms=10, reconnect_backoff_max_ms=50,
+                                                  spill_dir=spill_dir, spill_segment_bytes=64 * 1024))
+            standby = FakeBroker()
+            port = int(standby.address.split(':')[1])
+            standby.close()
+            self.zk_client.brokers = [standby.address]
+            self.broker.close()
+            self.wait_until(lambda: not producer.is_connected())
+
+            count = 5000
+            deliveries = [producer.publish(b'record %d' % seq, seq, self.node_id) for seq in range(count)]
+            producer.flush()
+            # the frames are on disk, and only the segments being written and read are mapped
+            self.assertEqual(count, producer.window_stats().spilled)
+            self.assertTrue(all(delivery._frame is None for delivery in deliveries))
+            self.assertLessEqual(producer._spill.mapped_segments(), 2)
+
+            producer.metrics().reset()
+            started_at = time.monotonic()
+            standby = FakeBroker(port=port)
+            self.assertEqual(list(range(count)), [delivery.result(timeout=10).offset for delivery in deliveries])
+            drain_rate = count / (time.monotonic() - started_at)
+
+            records = standby.records(self.topic)
+            self.assertEqual([(b'record %d' % seq, seq) for seq in range(count)],
+                             [(record.data, record.seq_num) for record in records])
+            # the log is sent in batches of SPILL_DRAIN_BYTES
+            self.assertLess(producer.metrics().send_calls, 20)
+            self.assertGreater(drain_rate, 1000)
+            self.assertEqual(0, producer.window_stats().spilled)
+            producer.stop()
+            standby.close()
+            self.assertEqual([], os.listdir(spill_dir))
+
+    def test_full_spill_log_fails_records(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            producer = self.make_producer(QConfig(reconnect_backoff_ms=10, spill_dir=spill_dir,
+                                                  spill_segment_bytes=1024, spill_max_bytes=4096))
+            self.broker.close()
+            self.wait_until(lambda: not producer.is_connected())
+
+            # publish does not raise; records that do not fit fail through their deliveries
+            deliveries = [producer.publish(b'x' * 100, seq, self.node_id) for seq in range(100)]
+            producer.flush()
+            failed = [delivery for delivery in deliveries if delivery.done()]
+            self.assertTrue(all(isinstance(delivery.exception(), SpillFullError) for delivery in failed))
+            stats = producer.window_stats()
+            self.assertEqual((100 - len(failed), len(failed)), (stats.spilled, stats.spill_failed))
+            self.assertGreater(len(failed), 0)
+            producer.stop()
+
+    def test_spills_until_first_connect(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            # no broker listens on the port until it starts
+            port = int(self.broker.address.split(':')[1])
+            self.broker.close()
+            producer = self.make_producer(QConfig(reconnect_backoff_ms=10, reconnect_backoff_max_ms=50,
+                                                  spill_dir=spill_dir))
+            self.assertFalse(producer.is_connected())
+            deliveries = [producer.publish(b'data', seq, self.node_id) for seq in range(10)]
+            producer.flush()
+            self.assertEqual(10, producer.window_stats().spilled)
+
+            self.broker = FakeBroker(port=port)
+            self.assertEqual(list(range(10)), [delivery.result(timeout=5).offset for delivery in deliveries])
+            producer.stop()
+
+    def test_spill_needs_reconnecting(self):
+        with self.assertRaises(ValueError):
+            QConfig(spill_dir='spill')
+        with self.assertRaises(ValueError):
+            Producer(QConfig(spill_dir='spill', reconnect_backoff_ms=10), self.topic, self.logger,
+                     pool=ConnectionPool(QConfig(), self.logger))
+
+    def test_publish_many_numbers_records(self):
+        producer = self.make_producer(QConfig(), node_id=self.node_id, first_seq_num=10)
+        producer.metrics().reset()
+        payloads = [b'record %d' % i for i in range(1000)]
+        deliveries = producer.publish_many(payloads)
+        deliveries += producer.publish_many(iter([b'last']))
+        producer.flush()
+
+        records = self.wait_records(1001)
+        self.assertEqual(list(range(10, 1011)), [record.seq_num for record in records])
+        self.assertEqual(payloads + [b'last'], [record.data for record in records])
+        self.assertEqual(list(range(1001)), [delivery.result(timeout=5).offset for delivery in deliveries])
+        self.assertEqual(1011, producer.next_seq_num())
+        self.assertEqual(1001, producer.metrics().frames_sent)
+        # the records fit in one chunk, written in one send
+        self.assertLessEqual(producer.metrics().send_calls, 2)
+        producer.stop()
+
+    def test_publish_many_with_batching_and_window(self):
+        producer = self.make_producer(QConfig(batch_bytes=1024, linger_ms=10, max_in_flight=10), node_id=self.node_id)
+        deliveries = producer.publish_many(b'x' * i for i in range(100))
+        producer.flush()
+
+        self.assertEqual(list(range(100)), [len(record.data) for record in self.wait_records(100)])
+        self.assertEqual(list(range(100)), [delivery.result(timeout=5).offset for delivery in deliveries])
+        producer.stop()
+
+    def test_publish_many_raises_on_full_window(self):
+        producer = self.make_producer(QConfig(max_in_flight=3, in_flight_policy=QConfig.RAISE), node_id=self.node_id)
+        self.broker.put_delay = 0.2
+        with self.assertRaises(WindowFullError):
+            producer.publish_many([b'data'] * 5)
+        self.assertEqual(3, producer.next_seq_num())
+
+        self.assertEqual([0, 1, 2], [record.seq_num for record in self.wait_records(3)])
+        producer.stop()
+
+    def test_publish_many_needs_node_id(self):
+        producer = self.make_producer(QConfig())
+        with self.assertRaises(InvalidNodeIdError):
+            producer.publish_many([b'data'])
+        producer.stop()
+        with self.assertRaises(InvalidNodeIdError):
+            Producer(QConfig(), self.topic, self.logger, node_id='short')
@@ -0,0 +1,200 @@
+import logging
+import selectors
+import socket
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from shapleqclient.base import ClientBase
+from shapleqclient.common.exception import SocketClosedError, SocketReadError, InvalidChecksumError
+from shapleqclient.message.qmessage import QMessage
+
+MessageHandler = Callable[[QMessage], None]
+
+
+class _Loop:
+    """One reactor thread with its own selector.
+
+    The selector is only touched by its thread. Other threads queue
+    registrations and wake the thread through a socketpair.
+    """
+    _selector: selectors.BaseSelector
+    _wakeup_r: socket.socket
+    _wakeup_w: socket.socket
+    _ops: Deque[Tuple[Callable, threading.Event]]
+    # taken to queue an op and by the thread when it stops, so no op is queued after the last run of the ops
+    _ops_lock: threading.Lock
+    _clients: Dict[ClientBase, int]
+
+    def __init__(self, name: str, logger: logging.Logger):
+        self.logger = logger
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._ops = deque()
+        self._ops_lock = threading.Lock()
+        self._clients = {}
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def size(self) -> int:
+        return len(self._clients)
+
+    def add(self, client: ClientBase, handler: MessageHandler):
+        self._call(lambda: self._add(client, handler))
+
+    def remove(self, client: ClientBase):
+        self._call(lambda: self._remove(client))
+
+    def close(self):
+        self._running = False
+        self._wakeup()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _call(self, op: Callable):
+        # runs op on the loop thread and waits for it, so a removed client is never read again once this returns
+        if threading.current_thread() is self._thread:
+            op()
+            return
+        done = threading.Event()
+        with self._ops_lock:
+            if not self._running:
+                # the selector is closed with the loop
+                return
+            self._ops.append((op, done))
+        self._wakeup()
+        done.wait()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            # the pipe is full, so a wakeup is pending anyway
+            pass
+
+    def _add(self, client: ClientBase, handler: MessageHandler):
+        fd = client.fileno()
+        if fd in self._selector.get_map():
+            # the descriptor of a client closed without being removed was reused
+            stale = self._selector.get_key(fd).data[0]
+            self._remove(stale)
+        self._clients[client] = fd
+        self._selector.register(fd, selectors.EVENT_READ, (client, handler))
+        # frames received together with earlier responses are already buffered
+        self._dispatch(client, handler, client.buffered_messages())
+
+    def _remove(self, client: ClientBase):
+        if (fd := self._clients.pop(client, None)) is not None:
+            self._selector.unregister(fd)
+
+    def _run(self):
+        try:
+            while self._running:
+                for key, _ in self._selector.select():
+                    if key.fileobj is self._wakeup_r:
+                        self._drain_wakeups()
+                    else:
+                        self._read(*key.data)
+        finally:
+            with self._ops_lock:
+                self._running = False
+            self._run_ops()
+            self._selector.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+
+    def _drain_wakeups(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        self._run_ops()
+
+    def _run_ops(self):
+        while self._ops:
+            op, done = self._ops.popleft()
+            try:
+                if self._running:
+                    op()
+            except Exception as err:
+                self.logger.error(err)
+            finally:
+                done.set()
+
+    def _read(self, client: ClientBase, handler: MessageHandler):
+        try:
+            received = client.receive_ready()
+        except (SocketClosedError, SocketReadError):
+            self._remove(client)
+            return
+        self._dispatch(client, handler, received)
+
+    def _dispatch(self, client: ClientBase, handler: MessageHandler, received: Iterator[QMessage]):
+        try:
+            for msg in received:
+                try:
+                    handler(msg)
+                except Exception as err:
+                    # a failing handler must not stop the other connections of this loop
+                    self.logger.error(err)
+        except InvalidChecksumError as err:
+            # frames after a corrupt one cannot be trusted
+            self.logger.error(err)
+            client.close()
+        if not client.is_connected():
+            self._remove(client)
+
+
+class Reactor:
+    """Receives on many connections with a few threads.
+
+    Every registered client is assigned to the least loaded of `num_threads`
+    selector loops, which reads whatever its sockets have ready and calls the
+    client's handler once per received frame, on the loop thread. Handlers
+    should return quickly, since they hold up every other connection of
+    their loop; exceptions they raise are logged.
+
+    Messages passed to a handler are views into the client's read buffer
+    (see `QMessage`) and are only valid during the call.
+    """
+    _loops: List[_Loop]
+    _assigned: Dict[ClientBase, _Loop]
+    _lock: threading.Lock
+
+    def __init__(self, logger: logging.Logger, num_threads: int = 1):
+        if num_threads < 1:
+            raise ValueError("reactor needs at least one thread")
+        self.logger = logger
+        self._loops = [_Loop('shapleq-reactor-{}'.format(i), logger) for i in range(num_threads)]
+        self._assigned = {}
+        self._lock = threading.Lock()
+
+    def register(self, client: ClientBase, handler: MessageHandler):
+        if not client.is_connected():
+            raise SocketClosedError()
+        with self._lock:
+            loop = min(self._loops, key=_Loop.size)
+            self._assigned[client] = loop
+        loop.add(client, handler)
+
+    def unregister(self, client: ClientBase):
+        with self._lock:
+            loop: Optional[_Loop] = self._assigned.pop(client, None)
+        if loop is not None:
+            loop.remove(client)
+
+    def close(self):
+        with self._lock:
+            self._assigned.clear()
+        for loop in self._loops:
+            loop.close()
+
+    def __enter__(self) -> 'Reactor':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
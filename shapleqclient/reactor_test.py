@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+import unittest
+from collections import deque
+from typing import Dict, List
+from shapleqclient.base import QConfig
+from shapleqclient.producer import Producer
+from shapleqclient.reactor import Reactor
+from shapleqclient.message.qmessage import QMessage
+from shapleqclient.proto.api_pb2 import PutResponse
+from shapleqclient.testing import FakeBroker, FakeZKClient
+
+
+def client_threads() -> int:
+    return sum(1 for th in threading.enumerate() if not th.name.startswith(FakeBroker.THREAD_NAME))
+
+
+class ReactorTest(unittest.TestCase):
+    logger = logging.getLogger("shapleq-python")
+    node_id = "0" * 32
+
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.reactor = Reactor(self.logger, num_threads=2)
+        self.producers: List[Producer] = []
+        self.responses: Dict[int, List[int]] = {}
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        for producer in self.producers:
+            producer.stop()
+        self.reactor.close()
+        self.broker.close()
+
+    def start_producers(self, count: int):
+        config = QConfig(zk_client_factory=FakeZKClient.factory([self.broker.address]))
+        for i in range(count):
+            producer = Producer(config, "topic{}".format(i), self.logger, reactor=self.reactor)
+            producer._handle_message = lambda msg, index=i: self._record(index, msg)
+            producer.setup()
+            self.producers.append(producer)
+
+    def _record(self, index: int, msg: QMessage):
+        response = msg.unpack_to(PutResponse())
+        with self.lock:
+            self.responses.setdefault(index, []).append(response.partition.offset)
+
+    def wait_responses(self, count: int, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if sum(len(offsets) for offsets in self.responses.values()) >= count:
+                    return
+            time.sleep(0.01)
+        self.fail("responses not received in time")
+
+    def test_dispatch_responses_to_their_producer(self):
+        self.start_producers(3)
+        for index, producer in enumerate(self.producers):
+            for seq in range(index + 1):
+                producer.publish(b'data', seq, self.node_id)
+        self.wait_responses(6)
+
+        self.assertEqual({0: [0], 1: [0, 1], 2: [0, 1, 2]}, self.responses)
+
+    def test_stopped_producer_is_unregistered(self):
+        self.start_producers(2)
+        self.producers[0].stop()
+        self.producers[1].publish(b'data', 0, self.node_id)
+        self.wait_responses(1)
+
+        self.assertEqual({1: [0]}, self.responses)
+        self.assertEqual(1, sum(loop.size() for loop in self.reactor._loops))
+
+    def test_call_racing_close_returns(self):
+        loop = self.reactor._loops[0]
+        appending = threading.Event()
+
+        class SlowDeque(deque):
+            # queues the op only after the loop was told to stop
+            def append(self, item):
+                appending.set()
+                time.sleep(0.2)
+                super().append(item)
+
+        loop._ops = SlowDeque()
+        caller = threading.Thread(target=loop._call, args=(lambda: None,), daemon=True)
+        caller.start()
+        self.assertTrue(appending.wait(5))
+        loop.close()
+        caller.join(5)
+        self.assertFalse(caller.is_alive())
+
+    def test_thousand_producers_on_reactor_threads(self):
+        threads_before = client_threads()
+        self.start_producers(1000)
+        for producer in self.producers:
+            producer.publish(b'data', 1, self.node_id)
+        self.wait_responses(1000)
+
+        # only the reactor threads, started before the producers, receive for all of them
+        self.assertEqual(threads_before, client_threads())
+        self.assertEqual(1000, len(self.responses))
@@ -0,0 +1,167 @@
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from collections import deque
+from typing import Deque, List, Optional, Union
+from shapleqclient.common.exception import SpillFullError
+
+Frame = List[Union[bytes, memoryview]]
+
+# length of each frame, written before it
+_LENGTH = struct.Struct('<I')
+
+
+class _Segment:
+    path: str
+    size: int
+    # offsets the next frame is written at and read from
+    write_pos: int
+    read_pos: int
+    map: Optional[mmap.mmap]
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.write_pos = 0
+        self.read_pos = 0
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def remap(self):
+        if self.map is None:
+            fd = os.open(self.path, os.O_RDWR)
+            try:
+                self.map = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+
+    def unmap(self):
+        if self.map is None:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            # frames read from the segment are still referenced. the map is released with the last of them
+            pass
+        self.map = None
+
+
+class SpillLog:
+    """Append-only log of encoded frames in memory-mapped segment files.
+
+    Frames are appended to segments of `segment_bytes` bytes, or of one
+    frame when it is larger, in a directory of their own created under
+    `directory`, and `read` returns them in the order they were appended.
+    A segment is removed once every frame in it is read. At most `max_bytes`
+    bytes of unread frames are held; `append` raises `SpillFullError` for a
+    frame that does not fit.
+
+    Only the segment being written and the one being read are mapped, so
+    memory use does not grow with the size of the log. Frames are returned
+    as views into a segment's map, which stays valid while they are
+    referenced even after the segment is removed.
+
+    The log is not locked; a producer uses it under its write lock. It is
+    not recovered after a restart, and `close` removes its files.
+    """
+    segment_bytes: int
+    max_bytes: int
+    directory: str
+    _segments: Deque[_Segment]
+    _next_segment: int
+    _records: int
+    _bytes: int
+
+    def __init__(self, directory: str, segment_bytes: int, max_bytes: int):
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='shapleq-spill-', dir=directory)
+        self._segments = deque()
+        self._next_segment = 0
+        self._records = 0
+        self._bytes = 0
+
+    def append(self, frame: Frame):
+        length = sum(len(buf) for buf in frame)
+        size = _LENGTH.size + length
+        if self._bytes + size > self.max_bytes:
+            raise SpillFullError()
+
+        segment = self._segments[-1] if self._segments else None
+        if segment is None or segment.write_pos + size > segment.size:
+            if segment is not None and len(self._segments) > 1:
+                # neither read nor written until the reader gets to it
+                segment.unmap()
+            segment = self._add_segment(max(self.segment_bytes, size))
+
+        pos = segment.write_pos
+        _LENGTH.pack_into(segment.map, pos, length)
+        pos += _LENGTH.size
+        for buf in frame:
+            segment.map[pos:pos + len(buf)] = buf
+            pos += len(buf)
+        segment.write_pos = pos
+        self._records += 1
+        self._bytes += size
+
+    def read(self, max_bytes: int) -> List[memoryview]:
+        """Returns the oldest unread frames, up to `max_bytes` bytes but at least one while any is left."""
+        frames, read = [], 0
+        while self._segments:
+            segment = self._segments[0]
+            if segment.read_pos == segment.write_pos:
+                if len(self._segments) == 1:
+                    break
+                self._remove_first()
+                continue
+            segment.remap()
+            length, = _LENGTH.unpack_from(segment.map, segment.read_pos)
+            size = _LENGTH.size + length
+            if frames and read + size > max_bytes:
+                break
+            start = segment.read_pos + _LENGTH.size
+            frames.append(memoryview(segment.map)[start:start + length])
+            segment.read_pos += size
+            read += size
+            self._records -= 1
+            self._bytes -= size
+        return frames
+
+    def records(self) -> int:
+        return self._records
+
+    def bytes(self) -> int:
+        return self._bytes
+
+    def mapped_segments(self) -> int:
+        return sum(1 for segment in self._segments if segment.map is not None)
+
+    def clear(self):
+        """Drops every unread frame."""
+        while self._segments:
+            self._remove_first()
+        self._records = 0
+        self._bytes = 0
+
+    def close(self):
+        self.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _add_segment(self, size: int) -> _Segment:
+        path = os.path.join(self.directory, '{:010d}.log'.format(self._next_segment))
+        self._next_segment += 1
+        segment = _Segment(path, size)
+        self._segments.append(segment)
+        return segment
+
+    def _remove_first(self):
+        segment = self._segments.popleft()
+        segment.unmap()
+        os.unlink(segment.path)
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from shapleqclient.common.exception import SpillFullError
+from shapleqclient.spill import SpillLog
+
+
+class SpillLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reads_frames_in_order_across_segments(self):
+        log = SpillLog(self.directory.name, 1024, 1024 * 1024)
+        frames = [[b'head %d ' % i, memoryview(b'x' * (i % 300))] for i in range(100)]
+        for frame in frames:
+            log.append(frame)
+        self.assertEqual(100, log.records())
+
+        read = []
+        while batch := log.read(4096):
+            self.assertLessEqual(sum(len(frame) for frame in batch), 4096)
+            read += [bytes(frame) for frame in batch]
+        self.assertEqual([b''.join(frame) for frame in frames], read)
+        self.assertEqual((0, 0), (log.records(), log.bytes()))
+        # read segments are removed, leaving the one being written
+        self.assertEqual(1, len(os.listdir(log.directory)))
+        log.close()
+        self.assertFalse(os.path.exists(log.directory))
+
+    def test_maps_only_segments_in_use(self):
+        log = SpillLog(self.directory.name, 64 * 1024, 64 * 1024 * 1024)
+        frame = [b'y' * 1000]
+        for _ in range(10000):
+            log.append(frame)
+            self.assertLessEqual(log.mapped_segments(), 2)
+        self.assertGreater(len(os.listdir(log.directory)), 100)
+
+        count = 0
+        while batch := log.read(64 * 1024):
+            count += len(batch)
+            self.assertLessEqual(log.mapped_segments(), 2)
+        self.assertEqual(10000, count)
+        log.close()
+
+    def test_append_beyond_max_bytes_raises(self):
+        log = SpillLog(self.directory.name, 1024, 4096)
+        with self.assertRaises(SpillFullError):
+            for _ in range(100):
+                log.append([b'z' * 100])
+        self.assertLessEqual(log.bytes(), 4096)
+        self.assertEqual(39, log.records())
+
+        # frames larger than a segment get one of their own
+        log.read(4096)
+        log.append([b'w' * 3000])
+        self.assertEqual([b'w' * 3000], [bytes(frame) for frame in log.read(4096)])
+        log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+"""In-process stand-ins for a ShapleQ broker and zookeeper, for tests and benchmarks.
+
+`FakeBroker` speaks the client protocol on a local port. It keeps records in
+memory, answers PutRequests with increasing offsets, streams fetched records
+to subscribers and handles topic administration. It is not a broker
+implementation; it only does what the client needs to be exercised.
+"""
+import functools
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from shapleqclient.common.error import PQErrCode
+from shapleqclient.message.frame_decoder import FrameDecoder
+from shapleqclient.message.qmessage import MessageType, make_qmessage_from_proto
+from shapleqclient.message.registry import MessageRegistry
+from shapleqclient.message.api import MAGIC_NUM, ack_msg
+from shapleqclient.proto import api_pb2, data_pb2
+
+
+class FakeRecord:
+    def __init__(self, data: bytes, seq_num: int, node_id: str):
+        self.data = data
+        self.seq_num = seq_num
+        self.node_id = node_id
+
+
+class FakeZKClient:
+    """Answers broker lookups of `ClientBase.connect` with fixed addresses."""
+
+    def __init__(self, brokers: List[str]):
+        self.brokers = brokers
+        self.connected = False
+
+    @classmethod
+    def factory(cls, brokers: List[str]) -> Callable[[], 'FakeZKClient']:
+        """Returns a `QConfig` zk_client_factory of clients naming `brokers`, which can be pickled."""
+        return functools.partial(cls, list(brokers))
+
+    def connect(self):
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def close(self):
+        self.connected = False
+
+    def get_topic_brokers(self, topic: str) -> List[str]:
+        return list(self.brokers)
+
+    def get_brokers(self) -> List[str]:
+        return list(self.brokers)
+
+
+class FakeBroker:
+    # names of the threads the broker serves connections on start with this
+    THREAD_NAME = 'fake-broker'
+    _REQUESTS = MessageRegistry(api_pb2.ConnectRequest, api_pb2.PutRequest, api_pb2.FetchRequest,
+                                api_pb2.CreateTopicRequest, api_pb2.DeleteTopicRequest, api_pb2.DescribeTopicRequest,
+                                api_pb2.ListTopicRequest, api_pb2.Ping)
+
+    # seconds to wait before answering each PutRequest
+    put_delay: float
+    # answer PutRequests with an Ack carrying this message instead of a PutResponse
+    put_error: Optional[str]
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.put_delay = 0.0
+        self.put_error = None
+        self._topics: Dict[str, data_pb2.Topic] = {}
+        self._records: Dict[str, List[FakeRecord]] = {}
+        self._lock = threading.Condition()
+        self._connections: List[socket.socket] = []
+        self._threads: List[threading.Thread] = []
+        self._running = True
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(1024)
+        self.address = '{}:{}'.format(*self._server.getsockname())
+
+        self._acceptor = threading.Thread(target=self._accept, name=self.THREAD_NAME, daemon=True)
+        self._acceptor.start()
+
+    def records(self, topic: str) -> List[FakeRecord]:
+        with self._lock:
+            return list(self._records.get(topic, []))
+
+    def connection_count(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def drop_connections(self):
+        """Closes every client connection, as a crashed broker would."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def close(self):
+        self._running = False
+        try:
+            # wakes the accepting thread; closing the socket alone would not
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        self.drop_connections()
+        with self._lock:
+            self._lock.notify_all()
+
+    def __enter__(self) -> 'FakeBroker':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _accept(self):
+        while self._running:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name=self.THREAD_NAME, daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        decoder = FrameDecoder()
+        session: Tuple[int, str] = (data_pb2.ADMIN, '')
+        try:
+            while self._running:
+                if decoder.recv_into(conn) == 0:
+                    return
+                for msg in decoder:
+                    request = self._REQUESTS.decode(msg)
+                    msg_type = MessageType(msg.type())
+                    if isinstance(request, api_pb2.ConnectRequest):
+                        session = (request.session_type, request.topic_name)
+                        self._send(conn, msg_type, api_pb2.ConnectResponse(magic=MAGIC_NUM))
+                    elif isinstance(request, api_pb2.PutRequest):
+                        self._put(conn, session[1], request)
+                    elif isinstance(request, api_pb2.FetchRequest):
+                        threading.Thread(target=self._stream, args=(conn, session[1], request), name=self.THREAD_NAME,
+                                         daemon=True).start()
+                    else:
+                        self._send(conn, msg_type, self._transaction(request))
+        except OSError:
+            return
+        finally:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def _send(self, conn: socket.socket, msg_type: MessageType, response):
+        conn.sendall(make_qmessage_from_proto(msg_type, response).serialize())
+
+    def _put(self, conn: socket.socket, topic: str, request: api_pb2.PutRequest):
+        if self.put_delay > 0:
+            time.sleep(self.put_delay)
+        if self.put_error is not None:
+            self._send(conn, MessageType.STREAM, ack_msg(PQErrCode.ErrInternal.value, self.put_error))
+            return
+
+        with self._lock:
+            records = self._records.setdefault(topic, [])
+            records.append(FakeRecord(request.data, request.seq_num, request.node_id))
+            offset = len(records) - 1
+            self._lock.notify_all()
+
+        partition = data_pb2.Partition(partition_id=1, offset=offset)
+        self._send(conn, MessageType.STREAM, api_pb2.PutResponse(magic=MAGIC_NUM, partition=partition))
+
+    def _stream(self, conn: socket.socket, topic: str, request: api_pb2.FetchRequest):
+        offset = request.start_offset
+        max_batch_size = max(request.max_batch_size, 1)
+        try:
+            while self._running:
+                with self._lock:
+                    while self._running and len(self._records.get(topic, [])) <= offset:
+                        self._lock.wait()
+                    records = self._records.get(topic, [])[offset:offset + max_batch_size]
+                    last_offset = len(self._records.get(topic, [])) - 1
+                if not records:
+                    return
+
+                if max_batch_size == 1:
+                    record = records[0]
+                    response = api_pb2.FetchResponse(magic=MAGIC_NUM, data=record.data, offset=offset,
+                                                     seq_num=record.seq_num, node_id=record.node_id,
+                                                     last_offset=last_offset)
+                else:
+                    response = api_pb2.BatchedFetchResponse(magic=MAGIC_NUM, last_offset=last_offset)
+                    for i, record in enumerate(records):
+                        response.items.add(data=record.data, offset=offset + i, seq_num=record.seq_num,
+                                           node_id=record.node_id)
+                self._send(conn, MessageType.STREAM, response)
+                offset += len(records)
+        except OSError:
+            return
+
+    def _transaction(self, request):
+        with self._lock:
+            if isinstance(request, api_pb2.CreateTopicRequest):
+                self._topics[request.topic.name] = request.topic
+                return api_pb2.CreateTopicResponse(magic=MAGIC_NUM)
+            elif isinstance(request, api_pb2.DeleteTopicRequest):
+                self._topics.pop(request.topic_name, None)
+                return api_pb2.DeleteTopicResponse(magic=MAGIC_NUM)
+            elif isinstance(request, api_pb2.DescribeTopicRequest):
+                if request.topic_name not in self._topics:
+                    return api_pb2.DescribeTopicResponse(magic=MAGIC_NUM,
+                                                         error_code=PQErrCode.ErrTopicNotExist.value,
+                                                         error_message="topic not exists")
+                return api_pb2.DescribeTopicResponse(magic=MAGIC_NUM, topic=self._topics[request.topic_name])
+            elif isinstance(request, api_pb2.ListTopicRequest):
+                return api_pb2.ListTopicResponse(magic=MAGIC_NUM, topics=list(self._topics))
+            elif isinstance(request, api_pb2.Ping):
+                return api_pb2.Pong(magic=MAGIC_NUM, echo=request.echo, server_time=time.time_ns())
+            else:
+                return ack_msg(PQErrCode.ErrInvalidMsgType.value, "unexpected request")
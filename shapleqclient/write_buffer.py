@@ -0,0 +1,144 @@
+import os
+import socket
+import threading
+from typing import List, Optional, Union
+from shapleqclient.common.exception import SocketWriteError
+from shapleqclient.metrics import Metrics
+
+DEFAULT_IOV_MAX = 1024
+
+
+def _iov_max() -> int:
+    # buffers one sendmsg call takes. sysconf may not know the limit, or report it as -1 for indeterminate
+    try:
+        limit = os.sysconf('SC_IOV_MAX')
+    except (AttributeError, ValueError, OSError):
+        return DEFAULT_IOV_MAX
+    return limit if limit > 0 else DEFAULT_IOV_MAX
+
+
+IOV_MAX = _iov_max()
+
+
+def send_all(sock: socket.socket, buffers: List[memoryview]) -> int:
+    """Write every buffer with vectored sends, resuming after short writes. Returns the number of send calls.
+
+    `buffers` is consumed: written views are removed from it and a partially
+    written one is replaced by its unwritten tail.
+    """
+    if not hasattr(sock, 'sendmsg'):
+        calls = len(buffers)
+        for view in buffers:
+            sock.sendall(view)
+        buffers.clear()
+        return calls
+
+    calls = 0
+    while buffers:
+        sent = sock.sendmsg(buffers[:IOV_MAX])
+        calls += 1
+        if sent <= 0:
+            raise SocketWriteError()
+
+        written = 0
+        while written < len(buffers) and sent >= buffers[written].nbytes:
+            sent -= buffers[written].nbytes
+            written += 1
+        del buffers[:written]
+        if sent > 0:
+            buffers[0] = buffers[0][sent:]
+    return calls
+
+
+class WriteBuffer:
+    """Outgoing frames of one connection.
+
+    Frames are queued and written together with one vectored send once
+    `flush_size` bytes are pending or `flush_delay` milliseconds have passed
+    since the first of them was queued. With a `flush_delay` of 0 every write
+    is sent right away. A short write never drops the rest of a frame; the
+    remainder is sent before anything else.
+
+    Queued buffers are referenced, not copied, and must not be modified until
+    they are flushed.
+    """
+    flush_size: int
+    flush_delay: int
+    _sock: socket.socket
+    _pending: List[memoryview]
+    _pending_bytes: int
+    _lock: threading.Lock
+    _timer: Optional[threading.Timer]
+    _error: Optional[SocketWriteError]
+    _metrics: Metrics
+
+    def __init__(self, sock: socket.socket, flush_size: int, flush_delay: int, metrics: Optional[Metrics] = None):
+        self.flush_size = flush_size
+        self.flush_delay = flush_delay
+        self._sock = sock
+        self._pending = []
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._error = None
+        self._metrics = metrics if metrics is not None else Metrics()
+
+    def write(self, buffers: List[Union[bytes, memoryview]]):
+        with self._lock:
+            self._raise_error()
+            for buf in buffers:
+                view = memoryview(buf).cast('B')
+                if view.nbytes > 0:
+                    self._pending.append(view)
+                    self._pending_bytes += view.nbytes
+
+            if self.flush_delay <= 0 or self._pending_bytes >= self.flush_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_delay / 1000, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._raise_error()
+            self._flush()
+
+    def pending_bytes(self) -> int:
+        return self._pending_bytes
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()
+            self._pending_bytes = 0
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending_bytes = self._pending_bytes
+        try:
+            self._metrics.send_calls += send_all(self._sock, self._pending)
+        except socket.error as err:
+            raise SocketWriteError(msg=str(err))
+        finally:
+            self._pending_bytes = sum(view.nbytes for view in self._pending)
+            self._metrics.bytes_sent += pending_bytes - self._pending_bytes
+
+    def _flush_on_timer(self):
+        with self._lock:
+            try:
+                self._flush()
+            except SocketWriteError as err:
+                # nobody waits on the timer; report it to the next writer
+                self._error = err
+
+    def _raise_error(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err